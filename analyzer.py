@@ -0,0 +1,272 @@
+import os
+import sys
+import zlib
+import kernels
+from kernels import numpy
+from journal import MAGIC, SEGMENT_HEADER, CRC, JournalError, segmentPath
+from lib import Snapshot
+
+# Offline analysis of the events of a whole grid, after the fact.
+#
+# getSnapshot() asks running nodes where they were at a cut. Once the
+# nodes are gone, the events they recorded ([T, location], as in
+# EventLog.events() or a node's journal) still say where everyone was at
+# any cut. The analyzer takes every node's events and answers:
+#
+#   latestCut(bound)     the latest consistent cut (at or before bound)
+#   isConsistent(cut)    whether a cut is consistent
+#   snapshot(cut)        where every node was at a cut, as a Snapshot
+#   lattice(low, high)   every consistent cut between two of them
+#
+# A cut is a list of own times, one per node, like L: cut[i] includes the
+# events of node i up to own time cut[i], 0 none of them. It is consistent
+# if no event in it depends on one outside it, that is if the T of the
+# last event of every node is at most the cut, entry by entry.
+#
+# Events are kept in NumPy arrays, not as Python lists, so a day of
+# traffic fits in memory and checks are array operations:
+#
+# - ingest() buffers events and turns every CHUNK of them into an array,
+#   readJournal() reads a journal segment straight into one.
+# - index() puts every node's events, sorted by own time, into one
+#   (events x numNodes) array, with a row of zeros before each node's
+#   first event. A cut is then a row index per node, and the rows of its
+#   last events one fancy index.
+# - T only grows along a node's events, so every column of a node's rows
+#   is sorted, and the last event of node i that doesn't depend on
+#   anything past a cut is a searchsorted per column, not a scan.
+#
+# NumPy is required (see kernels.py).
+
+# events buffered per node before they are turned into an array
+CHUNK = 1 << 16
+
+# the events of a journal directory (see journal.py), one segment at a time
+# as (clocks, locations) arrays: clocks has a T per row
+def readJournal(path):
+    segment = 0
+    while os.path.exists(segmentPath(path, segment)):
+        filePath = segmentPath(path, segment)
+        with open(filePath, 'rb') as f:
+            data = f.read()
+        magic, recordSize, segmentRecords = SEGMENT_HEADER.unpack_from(data, 0)
+        if magic != MAGIC or recordSize % 8 != 0:
+            raise JournalError('%s is not a journal segment' % filePath)
+        size = CRC.size + recordSize
+        if len(data) != SEGMENT_HEADER.size + segmentRecords * size:
+            raise JournalError('%s has the wrong size' % filePath)
+        # the journal ends at the first record whose crc doesn't match, as
+        # in Journal.recoverEvents
+        view = memoryview(data)
+        count = 0
+        for start in range(SEGMENT_HEADER.size, len(data), size):
+            crc, = CRC.unpack_from(data, start)
+            if zlib.crc32(view[start + CRC.size:start + size]) != crc:
+                break
+            count += 1
+        record = numpy.dtype([('crc', '<u4'), ('body', '<i8', (recordSize // 8,))])
+        records = numpy.frombuffer(data, dtype=record, count=count, offset=SEGMENT_HEADER.size)
+        body = records['body']
+        yield body[:, 1:], body[:, 0]
+        if count < segmentRecords:
+            return
+        segment += 1
+
+class CutAnalyzer():
+
+    # numNodes: size of the clocks, None to go by the largest id seen
+    def __init__(self, numNodes=None):
+        if not kernels.available():
+            raise ImportError('the analyzer needs NumPy')
+        self.numNodes = numNodes or 0
+        # id -> [(clocks, locations)] arrays, and [T, location] not in one yet
+        self.chunks = {}
+        self.pending = {}
+        self.indexed = False
+
+    # add events ([T, location]) recorded by node id, in any order
+    def ingest(self, id, events):
+        pending = self.pending.setdefault(id, [])
+        for T, location in events:
+            pending.append(list(T) + [location])
+            if len(pending) == CHUNK:
+                self.flush(id)
+                pending = self.pending.setdefault(id, [])
+        self.indexed = False
+
+    # add events of node id as arrays: clocks a T per row, locations one each
+    def ingestArrays(self, id, clocks, locations):
+        clocks = numpy.asarray(clocks, dtype=numpy.int64)
+        if len(clocks):
+            self.chunks.setdefault(id, []).append((clocks, numpy.asarray(locations, dtype=numpy.int64)))
+        self.numNodes = max(self.numNodes, id + 1, clocks.shape[1] if clocks.ndim == 2 else 0)
+        self.indexed = False
+
+    # add the events in node id's journal
+    def ingestJournal(self, id, path):
+        for clocks, locations in readJournal(path):
+            self.ingestArrays(id, clocks, locations)
+
+    # turn the buffered events of node id into an array
+    def flush(self, id):
+        rows = self.pending.pop(id, [])
+        if not rows:
+            return
+        width = max(len(row) for row in rows)
+        if any(len(row) != width for row in rows):
+            # sparse clocks grow as nodes show up
+            rows = [row[:-1] + [0]*(width - len(row)) + row[-1:] for row in rows]
+        array = numpy.array(rows, dtype=numpy.int64)
+        self.ingestArrays(id, array[:, :-1], array[:, -1])
+
+    # build the arrays queries use, done by the queries themselves when
+    # events were added since the last time
+    def index(self):
+        if self.indexed:
+            return
+        for id in list(self.pending):
+            self.flush(id)
+        n = self.numNodes
+        clocks = []
+        times = []
+        locations = []
+        # index of each node's row of zeros
+        self.start = numpy.zeros(n, dtype=numpy.int64)
+        # number of events of each node
+        self.counts = numpy.zeros(n, dtype=numpy.int64)
+        rows = 0
+        for id in range(n):
+            nodeClocks = numpy.zeros((1, n), dtype=numpy.int64)
+            nodeLocations = numpy.full(1, -1, dtype=numpy.int64)
+            chunks = self.chunks.get(id)
+            if chunks:
+                nodeClocks = numpy.concatenate([nodeClocks] + [numpy.pad(c, ((0, 0), (0, n - c.shape[1])))
+                                                               for c, l in chunks])
+                nodeLocations = numpy.concatenate([nodeLocations] + [l for c, l in chunks])
+                own = nodeClocks[1:, id]
+                if not numpy.all(own[1:] > own[:-1]):
+                    # sort by own time and keep the first event with each, as
+                    # EventLog does
+                    own, first = numpy.unique(own, return_index=True)
+                    keep = numpy.concatenate(([0], first[own > 0] + 1))
+                    nodeClocks = nodeClocks[keep]
+                    nodeLocations = nodeLocations[keep]
+            self.start[id] = rows
+            self.counts[id] = len(nodeClocks) - 1
+            rows += len(nodeClocks)
+            clocks.append(nodeClocks)
+            times.append(nodeClocks[:, id])
+            locations.append(nodeLocations)
+        # column-major, so the columns searched in latestCut are contiguous
+        self.clocks = numpy.asfortranarray(numpy.concatenate(clocks)) if clocks else numpy.zeros((0, 0), dtype=numpy.int64)
+        self.times = numpy.concatenate(times) if times else numpy.zeros(0, dtype=numpy.int64)
+        self.locations = numpy.concatenate(locations) if locations else numpy.zeros(0, dtype=numpy.int64)
+        self.indexed = True
+
+    def __len__(self):
+        self.index()
+        return int(self.counts.sum())
+
+    # events of every node up to a cut, as an array of how many (positions)
+    def positions(self, cut):
+        self.index()
+        if len(cut) > self.numNodes:
+            raise ValueError('cut has %d entries, there are %d nodes' % (len(cut), self.numNodes))
+        positions = numpy.zeros(self.numNodes, dtype=numpy.int64)
+        for id, time in enumerate(cut):
+            first = self.start[id] + 1
+            positions[id] = numpy.searchsorted(self.times[first:first + self.counts[id]], time, 'right')
+        return positions
+
+    # the cut (own times) of positions
+    def cutAt(self, positions):
+        return self.times[self.start + positions]
+
+    # whether no event up to the cut depends on one past it
+    def isConsistent(self, cut):
+        positions = self.positions(cut)
+        return bool((self.clocks[self.start + positions] <= self.cutAt(positions)).all())
+
+    # the latest consistent cut, of everything or at or before bound
+    def latestCut(self, bound=None):
+        self.index()
+        positions = self.counts.copy() if bound is None else self.positions(bound)
+        # consistent cuts are closed under taking the smaller of two, so
+        # lowering each node to its last event that only depends on what
+        # the cut has left, until nothing changes, gives the latest one
+        while True:
+            cut = self.cutAt(positions)
+            over = self.clocks[self.start + positions] > cut
+            behind = numpy.flatnonzero(over.any(axis=1))
+            if len(behind) == 0:
+                return cut.tolist()
+            for id in behind:
+                first = self.start[id] + 1
+                last = first + positions[id]
+                positions[id] = min(numpy.searchsorted(self.clocks[first:last, j], cut[j], 'right')
+                                    for j in numpy.flatnonzero(over[id]))
+
+    # where every node was at a cut, nodes with no events in it are left out
+    def snapshot(self, cut):
+        positions = self.positions(cut)
+        cut = self.cutAt(positions).tolist()
+        locations = self.locations[self.start + positions]
+        ids = [id for id in range(self.numNodes) if positions[id] > 0]
+        return Snapshot(cut, [[id, int(locations[id])] for id in ids], ids, 0.0)
+
+    # every consistent cut from low to high (both consistent themselves),
+    # low first, one at a time as there can be a great many
+    def lattice(self, low, high):
+        low = self.positions(low)
+        high = self.positions(high)
+        if (low > high).any():
+            raise ValueError('low is past high')
+        for positions in (low, high):
+            if not (self.clocks[self.start + positions] <= self.cutAt(positions)).all():
+                raise ValueError('%s is not a consistent cut' % self.cutAt(positions).tolist())
+        # a depth first walk of a spanning tree of the lattice: the parent of
+        # a cut is the one with the event of the smallest id that can be
+        # taken out of it removed, so every cut is reached exactly once
+        # without remembering the ones already seen
+        stack = [low]
+        while stack:
+            positions = stack.pop()
+            cut = self.cutAt(positions)
+            yield cut.tolist()
+            # the next event of every node that has one, and whether it only
+            # depends on the cut (its own entry is the one it moves up)
+            ids = numpy.flatnonzero(positions < high)
+            rows = self.start[ids] + positions[ids] + 1
+            nextClocks = self.clocks[rows]
+            fits = nextClocks <= cut
+            fits[numpy.arange(len(ids)), ids] = True
+            children = fits.all(axis=1)
+            ids = ids[children]
+            if len(ids) == 0:
+                continue
+            # whether node j's last event could be taken out of the child
+            # that adds the next event of ids[k]: nobody else's last event
+            # depends on it, and the child's new one doesn't either
+            previous = self.times[self.start + numpy.maximum(positions - 1, 0)]
+            depends = self.clocks[self.start + positions] > previous
+            numpy.fill_diagonal(depends, False)
+            others = depends.sum(axis=0) - depends[ids]
+            removable = (others == 0) & (nextClocks[children] <= previous) & (positions > low)
+            # ...the child is ours if no node before ids[k] could
+            removable[numpy.arange(len(ids)), ids] = False
+            removable &= numpy.arange(self.numNodes) < ids[:, None]
+            for id in ids[~removable.any(axis=1)][::-1]:
+                child = positions.copy()
+                child[id] += 1
+                stack.append(child)
+
+# python analyzer.py ID=JOURNAL ...
+# prints the latest consistent cut of the journals and where everyone was
+if __name__ == '__main__':
+    analyzer = CutAnalyzer()
+    for argument in sys.argv[1:]:
+        id, path = argument.split('=', 1)
+        analyzer.ingestJournal(int(id), path)
+    cut = analyzer.latestCut()
+    print('%d events, latest consistent cut %s' % (len(analyzer), cut))
+    print(analyzer.snapshot(cut))
@@ -0,0 +1,603 @@
+import sys
+import time
+import math
+import os
+import json
+import platform
+import subprocess
+import asyncio
+import resource
+import shutil
+import tempfile
+import itertools
+from lib import Node, AsyncNode, LocalNode
+from loopback import LoopbackNetwork
+from reliable import ReliableTransport
+from clocks import SharedMatrix, scanSymmetric
+from eventlog import EventLog
+import wire
+import kernels
+
+# Benchmarks for the node implementation. Every benchmark starts real nodes
+# on localhost, so they need free UDP ports starting at BASIS_PORT.
+#
+#   python bench.py handlers [numNodes ...]
+#   python bench.py wire [numNodes ...]
+#   python bench.py symmetry [numNodes ...]
+#   python bench.py asyncio [numNodes ...]
+#   python bench.py moves
+#   python bench.py eventlog [events ...]
+#   python bench.py journal [numNodes ...]
+#   python bench.py loopback [numNodes ...]
+#   python bench.py metrics [numNodes ...]
+#   python bench.py broadcast [numNodes ...]
+#   python bench.py kernels [numNodes ...]
+#   python bench.py reliable [loss ...]
+#   python bench.py analyzer [events ...]
+#   python bench.py suite [file] [numNodesxnetworkSize ...]
+#       (in any order, an argument that isn't a grid is the file)
+
+BASIS_PORT = 42000
+NETWORK_SIZE = 8
+ROUNDS = 200
+
+# grids (numNodes, networkSize) the suite sweeps by default
+SUITE_GRIDS = [(4, 4), (4, 8), (9, 4), (9, 8), (16, 8)]
+SUITE_FILE = 'bench-results.json'
+# External messages per throughput run
+EXTERNALS = 500
+
+# builds a message the way a freshly started peer at senderLocation would send it
+def makeMessage(msgType, senderLocation, senderID, numNodes, wireFormat='text'):
+    T = [0]*numNodes
+    S = [ [0]*numNodes for i in range(numNodes)]
+    S[senderID][senderID] = 1
+    L = [0]*numNodes
+    return wire.encode(msgType, senderLocation, senderID, T, S, L, wireFormat)
+
+# average time (in microseconds) to run handleMessage on each message
+def timeHandler(node, messages):
+    start = time.perf_counter()
+    for i in range(ROUNDS):
+        for message in messages:
+            node.handleMessage(message)
+    return (time.perf_counter() - start) / (ROUNDS * len(messages)) * 1e6
+
+# handler latency with T, S and L behind Manager proxies vs in shared memory
+def benchHandlers(sizes):
+    print('numNodes  backend  connect+disconnect(us)  external(us)')
+    for numNodes in sizes:
+        for sharedMemory in (False, True):
+            node = Node(NETWORK_SIZE, 0, 'localhost', BASIS_PORT, numNodes, 0, sharedMemory=sharedMemory)
+            hello = makeMessage('Hello?', 1, 1, numNodes)
+            goodbye = makeMessage('Goodbye', 1, 1, numNodes)
+            external = makeMessage('External', 1, 1, numNodes)
+            connect = timeHandler(node, [hello, goodbye])
+            node.handleMessage(hello)
+            receive = timeHandler(node, [external])
+            node.exit()
+            node.manager.shutdown()
+            backend = 'shared' if sharedMemory else 'manager'
+            print('%8d  %7s  %22.1f  %12.1f' % (numNodes, backend, connect, receive))
+
+# message size and encode/decode cost of the text and binary formats
+def benchWire(sizes):
+    print('numNodes  format   bytes  datagrams  encode(us)  decode(us)')
+    for numNodes in sizes:
+        # a busy grid: clocks well past one byte
+        T = [1000 + i for i in range(numNodes)]
+        S = [ [(i * j) % 5000 for j in range(numNodes)] for i in range(numNodes)]
+        L = list(T)
+        for wireFormat in ('text', 'binary'):
+            rounds = max(1, ROUNDS // numNodes)
+            start = time.perf_counter()
+            for i in range(rounds):
+                data = wire.encode('External', 1, 0, T, S, L, wireFormat)
+            encodeTime = (time.perf_counter() - start) / rounds * 1e6
+            start = time.perf_counter()
+            for i in range(rounds):
+                wire.decode(data)
+            decodeTime = (time.perf_counter() - start) / rounds * 1e6
+            print('%8d  %6s  %6d  %9d  %10.1f  %10.1f' % (numNodes, wireFormat, len(data), len(wire.fragment(data)), encodeTime, decodeTime))
+        # the External that follows one send event, as a delta
+        data = wire.encode('External', 1, 0, {0: T[0] + 1}, {(0, 1): S[0][1] + 1, (1, 0): S[1][0] + 1}, None, size=numNodes)
+        print('%8d  %6s  %6d  %9d' % (numNodes, 'delta', len(data), len(wire.fragment(data))))
+
+# full scan of S against the running asymmetric pair count
+# S is symmetric, which is the worst case for the scan
+def benchSymmetry(sizes):
+    print('numNodes  scan(us)  count(us)  speedup')
+    for numNodes in sizes:
+        S = SharedMatrix(numNodes, [ [1 if i == j else 0 for j in range(numNodes)] for i in range(numNodes)])
+        rounds = max(1, 100000 // (numNodes * numNodes))
+        start = time.perf_counter()
+        for i in range(rounds):
+            scanSymmetric(S)
+        scan = (time.perf_counter() - start) / rounds * 1e6
+        start = time.perf_counter()
+        for i in range(ROUNDS):
+            S.isSymmetric()
+        count = (time.perf_counter() - start) / ROUNDS * 1e6
+        print('%8d  %8.1f  %9.2f  %7.0fx' % (numNodes, scan, count, scan / count))
+
+# handler latency with the Python merge loops vs the NumPy kernels, and a
+# symmetry scan of a plain list matrix both ways (S is symmetric, the worst
+# case for the scan)
+def benchKernels(sizes):
+    if not kernels.available():
+        print('NumPy is not installed, nothing to compare')
+        return
+    print('numNodes  kernels  hello+goodbye(us)  external(us)  scan(us)  identical')
+    for numNodes in sizes:
+        results = []
+        for vectorized in (False, True):
+            network = LoopbackNetwork()
+            node = LocalNode(NETWORK_SIZE, 0, 'sim', BASIS_PORT, numNodes, 0, network.transport(),
+                             discoveryTimeout=0, vectorized=vectorized)
+            hello = makeMessage('Hello?', 1, 1, numNodes, 'binary')
+            goodbye = makeMessage('Goodbye', 1, 1, numNodes, 'binary')
+            external = makeMessage('External', 1, 1, numNodes, 'binary')
+            rounds = max(1, ROUNDS * 50 // numNodes)
+            start = time.perf_counter()
+            for i in range(rounds):
+                node.handleMessage(hello)
+                node.handleMessage(goodbye)
+            connect = (time.perf_counter() - start) / rounds * 1e6
+            node.handleMessage(hello)
+            start = time.perf_counter()
+            for i in range(rounds):
+                node.handleMessage(external)
+            receive = (time.perf_counter() - start) / rounds * 1e6
+            S = [ [1 if i == j else 0 for j in range(numNodes)] for i in range(numNodes)]
+            start = time.perf_counter()
+            for i in range(rounds):
+                if vectorized:
+                    kernels.isSymmetric(S, numNodes)
+                else:
+                    scanSymmetric(S)
+            scan = (time.perf_counter() - start) / rounds * 1e6
+            results.append((node.T[:], node.S.toList(), node.L[:]))
+            name = 'numpy' if vectorized else 'python'
+            identical = 'yes' if results[-1] == results[0] else 'NO'
+            print('%8d  %7s  %17.1f  %12.1f  %8.1f  %9s' % (numNodes, name, connect, receive, scan, identical))
+
+# answering a 'Snapshot?' for a recent event (the usual case) by scanning a plain list vs
+# the EventLog index, and how big e gets under a retention policy
+def benchEventLog(lengths):
+    print('  events  scan(us)  find(us)  retained')
+    for length in lengths:
+        events = [ [[t, 0, 0], 1] for t in range(1, length + 1)]
+        log = EventLog(0)
+        for event in events:
+            log.append(event)
+        rounds = max(1, 100000 // length)
+        start = time.perf_counter()
+        for i in range(rounds):
+            for event in events:
+                if event[0][0] == length:
+                    break
+        scan = (time.perf_counter() - start) / rounds * 1e6
+        start = time.perf_counter()
+        for i in range(ROUNDS):
+            log.find(length)
+        find = (time.perf_counter() - start) / ROUNDS * 1e6
+        # the cut follows right behind our own time
+        bounded = EventLog(0, retention=10)
+        for event in events:
+            bounded.append(event)
+            bounded.prune(event[0][0])
+        print('%8d  %8.1f  %8.2f  %8d' % (length, scan, find, len(bounded)))
+
+# cost of journaling an event, on the EventLog itself and for a whole
+# internalEvent() (which goes through the Manager), plus the time to
+# read the journal back
+def benchJournal(sizes):
+    print('numNodes  append(us)  journaled(us)  internal(us)  journaled(us)  recover(ms)')
+    for numNodes in sizes:
+        path = tempfile.mkdtemp()
+        rounds = ROUNDS * 50
+        times = []
+        for journalPath in (None, path):
+            log = EventLog(0, journalPath=journalPath, numNodes=numNodes)
+            T = [0]*numNodes
+            start = time.perf_counter()
+            for t in range(1, rounds + 1):
+                T[0] = t
+                log.append([T[:], 1])
+            times.append((time.perf_counter() - start) / rounds * 1e6)
+            log.close()
+        start = time.perf_counter()
+        EventLog(0, journalPath=path, numNodes=numNodes).close()
+        recoverTime = (time.perf_counter() - start) * 1e3
+        shutil.rmtree(path)
+        for journalPath in (None, path):
+            node = Node(NETWORK_SIZE, 0, 'localhost', BASIS_PORT, numNodes, 0, journal=journalPath)
+            start = time.perf_counter()
+            for i in range(ROUNDS):
+                node.internalEvent()
+            times.append((time.perf_counter() - start) / ROUNDS * 1e6)
+            node.exit()
+            node.manager.shutdown()
+        shutil.rmtree(path)
+        print('%8d  %10.2f  %13.2f  %12.1f  %13.1f  %11.1f' % (numNodes, times[0], times[1], times[2], times[3], recoverTime))
+
+# many AsyncNodes sharing one event loop in this process
+# (the process runtime needs a Manager and a listener process per node)
+async def startAsyncNodes(numNodes):
+    networkSize = math.ceil(math.sqrt(numNodes))
+    nodes = [AsyncNode(networkSize, i, 'localhost', BASIS_PORT, numNodes, i) for i in range(numNodes)]
+    start = time.perf_counter()
+    await asyncio.gather(*[node.start() for node in nodes])
+    elapsed = time.perf_counter() - start
+    links = sum(len(node.connectedNeighbors) for node in nodes)
+    for node in nodes:
+        node.exit()
+    return elapsed, links
+
+def benchAsyncio(sizes):
+    print('numNodes  processes  start(s)  links  maxRSS(MB)')
+    for numNodes in sizes:
+        elapsed, links = asyncio.run(startAsyncNodes(numNodes))
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        print('%8d  %9d  %8.2f  %5d  %10.1f' % (numNodes, 1, elapsed, links, rss))
+
+# the same grid on real sockets (AsyncNode) and on the in-memory network
+# (LocalNode, with dense and with sparse clocks): wall time to start every
+# node and take a snapshot
+def benchLoopback(sizes):
+    print('numNodes  transport  start(s)  snapshot(ms)  datagrams')
+    for numNodes in sizes:
+        elapsed, links = asyncio.run(startAsyncNodes(numNodes))
+        print('%8d  %9s  %8.2f  %12s  %9s' % (numNodes, 'udp', elapsed, '-', '-'))
+        networkSize = math.ceil(math.sqrt(numNodes))
+        for sparse in (False, True):
+            network = LoopbackNetwork()
+            start = time.perf_counter()
+            nodes = [LocalNode(networkSize, i, 'sim', BASIS_PORT, numNodes, i, network.transport(), sparse=sparse)
+                     for i in range(numNodes)]
+            elapsed = time.perf_counter() - start
+            start = time.perf_counter()
+            nodes[0].getSnapshot()
+            snapshotTime = (time.perf_counter() - start) * 1e3
+            transport = 'sparse' if sparse else 'loopback'
+            print('%8d  %9s  %8.2f  %12.1f  %9d' % (numNodes, transport, elapsed, snapshotTime, network.sent))
+
+# handler latency with metrics off and on (LocalNode, so only the
+# counting differs, not the process setup)
+def benchMetrics(sizes):
+    print('numNodes  metrics  connect+disconnect(us)  external(us)')
+    for numNodes in sizes:
+        for metrics in (False, True):
+            network = LoopbackNetwork()
+            node = LocalNode(NETWORK_SIZE, 0, 'sim', BASIS_PORT, numNodes, 0, network.transport(),
+                             discoveryTimeout=0, metrics=metrics)
+            hello = makeMessage('Hello?', 1, 1, numNodes, 'binary')
+            goodbye = makeMessage('Goodbye', 1, 1, numNodes, 'binary')
+            external = makeMessage('External', 1, 1, numNodes, 'binary')
+            connect = timeHandler(node, [hello, goodbye])
+            node.handleMessage(hello)
+            receive = timeHandler(node, [external])
+            print('%8d  %7s  %22.1f  %12.1f' % (numNodes, 'on' if metrics else 'off', connect, receive))
+
+# a broadcast to the 24 cells around a node with a message encoded per
+# cell vs once for all of them, and datagrams for a burst of External
+# messages to one neighbor sent one by one vs in a batch
+def benchBroadcast(sizes):
+    print('numNodes  per cell(us)  once(us)  burst datagrams  batched datagrams')
+    for numNodes in sizes:
+        network = LoopbackNetwork()
+        nodes = [LocalNode(5, i, 'sim', BASIS_PORT, numNodes, i, network.transport()) for i in range(25)]
+        node = nodes[12]
+        network.run()
+        start = time.perf_counter()
+        for i in range(ROUNDS):
+            for location in node.reachableCells():
+                node.send('Hello?', location)
+            network.queue.clear()
+        perCell = (time.perf_counter() - start) / ROUNDS * 1e6
+        start = time.perf_counter()
+        for i in range(ROUNDS):
+            node.broadcast('Hello?')
+            network.queue.clear()
+        once = (time.perf_counter() - start) / ROUNDS * 1e6
+        sent = network.sent
+        for i in range(10):
+            node.externalSend(13)
+        burst = network.sent - sent
+        sent = network.sent
+        with node.batch():
+            for i in range(10):
+                node.externalSend(13)
+        batched = network.sent - sent
+        print('%8d  %12.1f  %8.1f  %15d  %17d' % (numNodes, perCell, once, burst, batched))
+
+# a 3x3 block of nodes on a lossy loopback network, with and without the
+# reliability layer: virtual seconds until every handshake, External and
+# one move has settled, how many of the Externals arrived, datagrams put
+# on the wire, and whether every link ended up known to both ends
+def benchReliable(losses):
+    print('loss  transport  converge(s)  externals  datagrams  consistent')
+    locations = [0, 1, 2, 5, 6, 7, 10, 11, 12]
+    for loss in losses:
+        for reliable in (False, True):
+            network = LoopbackNetwork(latency=0.001, jitter=0.002, loss=loss, seed=1)
+            def transport(i):
+                if reliable:
+                    return ReliableTransport(network.transport())
+                return network.transport()
+            nodes = [LocalNode(5, location, 'sim', BASIS_PORT, len(locations), i, transport(i), metrics=True)
+                     for i, location in enumerate(locations)]
+            network.run()
+            sent = 0
+            for i in range(EXTERNALS // 50):
+                for node in nodes:
+                    for peer in list(node.connectedNeighbors):
+                        node.externalSend(peer)
+                        sent += 1
+            nodes[8].moveRight()
+            network.run()
+            received = sum(node.metrics.report()['types'].get('External', {}).get('received', 0) for node in nodes)
+            consistent = all((q in node.connectedNeighbors) == (p in other.connectedNeighbors)
+                             for p, node in enumerate(nodes) for q, other in enumerate(nodes) if p != q)
+            print('%4.2f  %9s  %11.2f  %9s  %9d  %10s' % (loss, 'reliable' if reliable else 'udp', network.now,
+                  '%d/%d' % (received, sent), network.sent, consistent))
+
+# events of ANALYZER_NODES nodes sending to each other at random, as
+# {id: (clocks, locations)} arrays, like reading their journals back
+def randomEvents(count, numNodes, seed=0):
+    numpy = kernels.numpy
+    rng = numpy.random.default_rng(seed)
+    T = numpy.zeros((numNodes, numNodes), dtype=numpy.int64)
+    clocks = numpy.zeros((count, numNodes), dtype=numpy.int64)
+    senders = rng.integers(numNodes, size=count)
+    # every event after the first sees what someone sent a little earlier
+    sources = numpy.maximum(numpy.arange(count) - rng.integers(1, 50, size=count), 0)
+    for k in range(count):
+        i = senders[k]
+        if k:
+            numpy.maximum(T[i], clocks[sources[k]], out=T[i])
+        T[i, i] += 1
+        clocks[k] = T[i]
+    locations = rng.integers(NETWORK_SIZE * NETWORK_SIZE, size=count)
+    return {id: (clocks[senders == id], locations[senders == id]) for id in range(numNodes)}
+
+ANALYZER_NODES = 50
+
+# the offline analyzer on a day's worth of events: time to index them, to
+# find the latest consistent cut of all of them and of the first half of
+# each node's, to place every node at a cut, and to walk the lattice of
+# cuts just below the latest one
+def benchAnalyzer(lengths):
+    from analyzer import CutAnalyzer
+    print('  events  index(ms)  latest(ms)  bounded(ms)  snapshot(ms)  lattice(cuts/s)')
+    for length in lengths:
+        events = randomEvents(length, ANALYZER_NODES)
+        cutAnalyzer = CutAnalyzer(ANALYZER_NODES)
+        start = time.perf_counter()
+        for id, (clocks, locations) in events.items():
+            cutAnalyzer.ingestArrays(id, clocks, locations)
+        cutAnalyzer.index()
+        indexTime = (time.perf_counter() - start) * 1e3
+        start = time.perf_counter()
+        latest = cutAnalyzer.latestCut()
+        latestTime = (time.perf_counter() - start) * 1e3
+        start = time.perf_counter()
+        half = cutAnalyzer.latestCut([time // 2 for time in latest])
+        boundedTime = (time.perf_counter() - start) * 1e3
+        start = time.perf_counter()
+        cutAnalyzer.snapshot(half)
+        snapshotTime = (time.perf_counter() - start) * 1e3
+        low = cutAnalyzer.latestCut([max(time - 3, 0) for time in latest])
+        start = time.perf_counter()
+        cuts = sum(1 for cut in itertools.islice(cutAnalyzer.lattice(low, latest), 20000))
+        rate = cuts / (time.perf_counter() - start)
+        print('%8d  %9.1f  %10.1f  %11.1f  %12.2f  %15.0f' % (length, indexTime, latestTime, boundedTime,
+                                                             snapshotTime, rate))
+
+# time to start a node next to another one, and to move it back and forth
+def benchMoves():
+    print('runtime  start(ms)  move(ms)')
+    other = Node(NETWORK_SIZE, 0, 'localhost', BASIS_PORT, 2, 0)
+    start = time.perf_counter()
+    node = Node(NETWORK_SIZE, 1, 'localhost', BASIS_PORT, 2, 1)
+    startTime = (time.perf_counter() - start) * 1e3
+    start = time.perf_counter()
+    for i in range(5):
+        node.moveRight()
+        node.moveLeft()
+    moveTime = (time.perf_counter() - start) / 10 * 1e3
+    print('%7s  %9.1f  %8.1f' % ('process', startTime, moveTime))
+    node.exit()
+    other.exit()
+    asyncio.run(benchAsyncMoves())
+
+async def benchAsyncMoves():
+    other = await AsyncNode(NETWORK_SIZE, 0, 'localhost', BASIS_PORT + 1000, 2, 0).start()
+    start = time.perf_counter()
+    node = await AsyncNode(NETWORK_SIZE, 1, 'localhost', BASIS_PORT + 1000, 2, 1).start()
+    startTime = (time.perf_counter() - start) * 1e3
+    start = time.perf_counter()
+    for i in range(5):
+        await node.moveRight()
+        await node.moveLeft()
+    moveTime = (time.perf_counter() - start) / 10 * 1e3
+    print('%7s  %9.1f  %8.1f' % ('asyncio', startTime, moveTime))
+    node.exit()
+    other.exit()
+
+# The suite: real Nodes (a Manager and a listener process each) on
+# localhost, for every grid in the sweep. The nodes fill a square block in
+# the corner of the grid, so they are all within reach of their
+# neighbors, and the rest of the grid is empty. For each grid it records
+#   handshake_ms     smoothed Hello?/Hello round trip, as node 0 measured it
+#   discovery_ms     one full discovery round of node 0
+#   external_per_s   External messages from node 0 that node 1 has merged
+#   move_ms          one move of the last node (moveRight and moveLeft)
+#   snapshot_ms      getSnapshot() on node 0, and whether it was complete
+#   bytes            average bytes on the wire per message, by message
+#                    type (of what the nodes send themselves, the replies
+#                    their listener processes send are not counted)
+# and writes all of it, with the machine and commit it ran on, to a JSON
+# file that later runs can be compared against.
+
+# location of the i-th node in a square block in the top left corner
+def blockLocation(i, numNodes, networkSize):
+    side = math.ceil(math.sqrt(numNodes))
+    return (i // side) * networkSize + i % side
+
+# wraps a node's transport to add up what it sends, per message type
+class CountingTransport():
+
+    def __init__(self, transport, counts):
+        self.transport = transport
+        self.counts = counts
+
+    def sendto(self, data, address):
+        try:
+            msgType = wire.decode(data)[0].split('|')[0]
+        except wire.WireError:
+            # a fragment, counted towards its own kind
+            msgType = 'fragment'
+        count = self.counts.setdefault(msgType, [0, 0])
+        count[0] += 1
+        count[1] += len(data)
+        self.transport.sendto(data, address)
+
+    def __getattr__(self, name):
+        return getattr(self.transport, name)
+
+def benchGrid(numNodes, networkSize, basis):
+    side = math.ceil(math.sqrt(numNodes))
+    if side > networkSize:
+        raise ValueError('%d nodes do not fit in a %dx%d grid' % (numNodes, networkSize, networkSize))
+    if numNodes < 2:
+        raise ValueError('the grid benchmark needs at least 2 nodes, not %d' % numNodes)
+    result = {'numNodes': numNodes, 'networkSize': networkSize}
+    counts = {}
+    nodes = []
+    try:
+        for i in range(numNodes):
+            nodes.append(Node(networkSize, blockLocation(i, numNodes, networkSize), 'localhost', basis, numNodes, i))
+        for node in nodes:
+            node.transport = CountingTransport(node.transport, counts)
+        first = nodes[0]
+        second = nodes[1]
+        last = nodes[-1]
+
+        start = time.perf_counter()
+        first.discover()
+        result['discovery_ms'] = (time.perf_counter() - start) * 1e3
+        result['handshake_ms'] = first.discovery.state[5] * 1e3
+
+        start = time.perf_counter()
+        for i in range(EXTERNALS):
+            first.externalSend(second.myID)
+        sent = first.T[first.myID]
+        deadline = time.monotonic() + 5.0
+        while second.T[first.myID] < sent and time.monotonic() < deadline:
+            time.sleep(0.0005)
+        elapsed = time.perf_counter() - start
+        result['external_per_s'] = EXTERNALS / elapsed
+        result['external_lost'] = sent - second.T[first.myID]
+
+        # the last node has room to its right unless the block fills the row
+        if last.column + 1 < networkSize:
+            moves = (last.moveRight, last.moveLeft)
+        else:
+            moves = (last.moveDown, last.moveUp) if last.row + 1 < networkSize else (last.moveLeft, last.moveRight)
+        start = time.perf_counter()
+        for i in range(5):
+            for move in moves:
+                move()
+        result['move_ms'] = (time.perf_counter() - start) / 10 * 1e3
+
+        snapshot = first.getSnapshot()
+        result['snapshot_ms'] = snapshot.elapsed * 1e3
+        result['snapshot_complete'] = snapshot.isComplete()
+    finally:
+        for node in nodes:
+            if node.isActive():
+                node.exit()
+            node.manager.shutdown()
+    result['bytes'] = dict((msgType, count[1] / count[0]) for msgType, count in sorted(counts.items()))
+    result['messages'] = dict((msgType, count[0]) for msgType, count in sorted(counts.items()))
+    return result
+
+def benchSuite(path, grids):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ''
+    report = {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'results': [],
+    }
+    print('numNodes  size  handshake(ms)  discovery(ms)  externals/s  move(ms)  snapshot(ms)  External(B)')
+    basis = BASIS_PORT + 2000
+    for numNodes, networkSize in grids:
+        result = benchGrid(numNodes, networkSize, basis)
+        # every grid on ports of its own
+        basis += networkSize * networkSize
+        report['results'].append(result)
+        print('%8d  %4d  %13.2f  %13.1f  %11.0f  %8.1f  %12.1f  %11.1f' % (numNodes, networkSize,
+              result['handshake_ms'], result['discovery_ms'], result['external_per_s'], result['move_ms'],
+              result['snapshot_ms'], result['bytes'].get('External', 0)))
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print('wrote ' + path)
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] == 'handlers':
+        sizes = [int(x) for x in sys.argv[2:]] or [10, 50]
+        benchHandlers(sizes)
+    elif sys.argv[1] == 'symmetry':
+        sizes = [int(x) for x in sys.argv[2:]] or [10, 100, 1000]
+        benchSymmetry(sizes)
+    elif sys.argv[1] == 'asyncio':
+        sizes = [int(x) for x in sys.argv[2:]] or [25, 100]
+        benchAsyncio(sizes)
+    elif sys.argv[1] == 'moves':
+        benchMoves()
+    elif sys.argv[1] == 'eventlog':
+        sizes = [int(x) for x in sys.argv[2:]] or [100, 10000, 1000000]
+        benchEventLog(sizes)
+    elif sys.argv[1] == 'journal':
+        sizes = [int(x) for x in sys.argv[2:]] or [3, 50]
+        benchJournal(sizes)
+    elif sys.argv[1] == 'loopback':
+        sizes = [int(x) for x in sys.argv[2:]] or [25, 100]
+        benchLoopback(sizes)
+    elif sys.argv[1] == 'metrics':
+        sizes = [int(x) for x in sys.argv[2:]] or [10, 50]
+        benchMetrics(sizes)
+    elif sys.argv[1] == 'broadcast':
+        sizes = [int(x) for x in sys.argv[2:]] or [25, 100]
+        benchBroadcast(sizes)
+    elif sys.argv[1] == 'kernels':
+        sizes = [int(x) for x in sys.argv[2:]] or [16, 64, 200, 500]
+        benchKernels(sizes)
+    elif sys.argv[1] == 'reliable':
+        losses = [float(x) for x in sys.argv[2:]] or [0, 0.05, 0.1, 0.2]
+        benchReliable(losses)
+    elif sys.argv[1] == 'analyzer':
+        lengths = [int(x) for x in sys.argv[2:]] or [10000, 100000, 1000000]
+        benchAnalyzer(lengths)
+    elif sys.argv[1] == 'suite':
+        path = SUITE_FILE
+        grids = []
+        for argument in sys.argv[2:]:
+            numNodes, x, networkSize = argument.partition('x')
+            if x and numNodes.isdigit() and networkSize.isdigit():
+                grids.append((int(numNodes), int(networkSize)))
+            else:
+                path = argument
+        benchSuite(path, grids or SUITE_GRIDS)
+    elif sys.argv[1] == 'wire':
+        sizes = [int(x) for x in sys.argv[2:]] or [10, 15, 50, 200]
+        benchWire(sizes)
+    else:
+        print('Unknown benchmark ' + sys.argv[1])
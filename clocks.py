@@ -0,0 +1,337 @@
+import ctypes
+import multiprocessing
+
+# Clock storage for T, S and L.
+#
+# Vector and Matrix keep their values in a flat Python list, for nodes
+# that live in a single process. SharedVector and SharedMatrix keep them
+# in shared memory instead of behind a Manager: the arrays are allocated
+# before the listener process is forked, so both processes map the same
+# pages and every read or write is a plain memory access. Callers are
+# responsible for holding the node's lock while they update several
+# entries that have to stay consistent with each other.
+#
+# Matrix also keeps count of the pairs (i, j) with
+# matrix[i][j] != matrix[j][i]. Every write adjusts the count for the
+# cells it changes, so checking whether the matrix is symmetric does not
+# have to look at the matrix at all.
+#
+# SparseVector and SparseMatrix only store their non-zero entries, in
+# dicts keyed by node id. Reading an entry that was never written gives 0,
+# and writing to an id they have not seen yet makes them grow to fit it,
+# so neither needs to know the number of nodes up front. A node that only
+# ever meets the few peers around it pays for those, not for the whole
+# network.
+
+# vector of integers (used for T and L)
+class Vector():
+
+    def __init__(self, size, values=None):
+        self.size = size
+        self.data = self.allocate(size)
+        if values is not None:
+            self.data[:] = list(values)
+
+    def allocate(self, size):
+        return [0]*size
+
+    def __len__(self):
+        return self.size
+
+    # slices come back as plain lists, just like Manager proxies
+    def __getitem__(self, index):
+        return self.data[index]
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            self.data[index] = list(value)
+        else:
+            self.data[index] = value
+
+    def __iter__(self):
+        return iter(self.data[:])
+
+    def __eq__(self, other):
+        return self.data[:] == list(other)
+
+    def __repr__(self):
+        return str(self.data[:])
+
+class SharedVector(Vector):
+
+    def allocate(self, size):
+        return multiprocessing.RawArray('q', size)
+
+# a single row of a Matrix, reads and writes go straight to the matrix
+class Row():
+
+    def __init__(self, matrix, row):
+        self.matrix = matrix
+        self.offset = row * matrix.size
+
+    def __len__(self):
+        return self.matrix.size
+
+    def __getitem__(self, column):
+        return self.matrix.data[self.offset + column]
+
+    def __setitem__(self, column, value):
+        self.matrix.setCell(self.offset // self.matrix.size, column, value)
+
+    def __iter__(self):
+        return iter(self.matrix.data[self.offset:self.offset + self.matrix.size])
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return str(list(self))
+
+# square matrix of integers (used for S), stored row-major in one flat array
+class Matrix():
+
+    def __init__(self, size, values=None):
+        self.size = size
+        self.data = self.allocate(size * size)
+        # number of asymmetric pairs
+        self.asymmetric = self.allocateCounter()
+        if values is not None:
+            for i in range(size):
+                self[i] = values[i]
+
+    def allocate(self, size):
+        return [0]*size
+
+    def allocateCounter(self):
+        return ctypes.c_longlong(0)
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, row):
+        return Row(self, row)
+
+    def __iter__(self):
+        for i in range(self.size):
+            yield Row(self, i)
+
+    # replace a whole row
+    def __setitem__(self, row, values):
+        values = list(values)
+        offset = row * self.size
+        old = self.data[offset:offset + self.size]
+        if old == values:
+            return
+        for column in range(self.size):
+            if values[column] != old[column]:
+                self.setCell(row, column, values[column])
+
+    # write one cell, keeping the asymmetric pair count up to date
+    def setCell(self, row, column, value):
+        data = self.data
+        index = row * self.size + column
+        old = data[index]
+        if row != column and old != value:
+            mirror = data[column * self.size + row]
+            self.asymmetric.value += (value != mirror) - (old != mirror)
+        data[index] = value
+
+    # O(1), uses the running count instead of scanning
+    def isSymmetric(self):
+        return self.asymmetric.value == 0
+
+    def toList(self):
+        flat = self.data[:]
+        return [flat[i*self.size:(i+1)*self.size] for i in range(self.size)]
+
+class SharedMatrix(Matrix):
+
+    def allocate(self, size):
+        return multiprocessing.RawArray('q', size)
+
+    def allocateCounter(self):
+        return multiprocessing.RawValue('q', 0)
+
+# vector of integers keyed by id (used for T and L), see above
+class SparseVector():
+
+    def __init__(self, size=0, values=None):
+        # one more than the largest id seen
+        self.size = size
+        # id -> value, for values other than 0
+        self.data = {}
+        if values is not None:
+            self[:] = values
+
+    def __len__(self):
+        return self.size
+
+    # vector[:] is a copy, and sparse as well
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            if index == slice(None):
+                return self.copy()
+            return self.toList()[index]
+        return self.data.get(index, 0)
+
+    # only the whole vector can be assigned to, vector[:] = values
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            if index != slice(None):
+                raise IndexError('only [:] can be assigned to a SparseVector')
+            self.data = dict(nonzero(value))
+            self.size = max(self.size, len(value))
+            return
+        if value:
+            self.data[index] = value
+            if index >= self.size:
+                self.size = index + 1
+        else:
+            self.data.pop(index, None)
+
+    def __iter__(self):
+        return iter(self.toList())
+
+    def __eq__(self, other):
+        return self.toList() == list(other)
+
+    def __repr__(self):
+        return str(self.toList())
+
+    # (id, value) pairs of the non-zero entries
+    def items(self):
+        return self.data.items()
+
+    def copy(self):
+        vector = SparseVector(self.size)
+        vector.data = dict(self.data)
+        return vector
+
+    def toList(self):
+        data = self.data
+        return [data.get(i, 0) for i in range(self.size)]
+
+# a single row of a SparseMatrix, reads and writes go straight to the matrix
+class SparseRow():
+
+    def __init__(self, matrix, row):
+        self.matrix = matrix
+        self.row = row
+
+    def __len__(self):
+        return self.matrix.size
+
+    def __getitem__(self, column):
+        return self.matrix.get(self.row, column)
+
+    def __setitem__(self, column, value):
+        self.matrix.setCell(self.row, column, value)
+
+    def __iter__(self):
+        cells = self.matrix.rows.get(self.row, {})
+        return iter([cells.get(j, 0) for j in range(self.matrix.size)])
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return str(list(self))
+
+# square matrix of integers keyed by id (used for S), see above
+# It keeps the same asymmetric pair count as Matrix.
+class SparseMatrix():
+
+    def __init__(self, size=0, values=None):
+        self.size = size
+        # row -> {column: value}, for values other than 0
+        self.rows = {}
+        # number of asymmetric pairs
+        self.asymmetric = ctypes.c_longlong(0)
+        if values is not None:
+            for i in range(len(values)):
+                self[i] = values[i]
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, row):
+        return SparseRow(self, row)
+
+    def __iter__(self):
+        for i in range(self.size):
+            yield SparseRow(self, i)
+
+    # replace a whole row
+    def __setitem__(self, row, values):
+        for column, value in enumerate(values):
+            self.setCell(row, column, value)
+
+    def __eq__(self, other):
+        return self.toList() == [list(row) for row in other]
+
+    def get(self, row, column):
+        cells = self.rows.get(row)
+        if cells is None:
+            return 0
+        return cells.get(column, 0)
+
+    # write one cell, keeping the asymmetric pair count up to date
+    def setCell(self, row, column, value):
+        old = self.get(row, column)
+        if old == value:
+            return
+        if row != column:
+            mirror = self.get(column, row)
+            self.asymmetric.value += (value != mirror) - (old != mirror)
+        if value:
+            self.rows.setdefault(row, {})[column] = value
+            if row >= self.size or column >= self.size:
+                self.size = max(row, column) + 1
+        else:
+            cells = self.rows[row]
+            del cells[column]
+            if not cells:
+                del self.rows[row]
+
+    def isSymmetric(self):
+        return self.asymmetric.value == 0
+
+    # ((row, column), value) pairs of the non-zero entries
+    def items(self):
+        return [((i, j), value) for i, cells in self.rows.items() for j, value in cells.items()]
+
+    def copy(self):
+        matrix = SparseMatrix(self.size)
+        matrix.rows = dict((i, dict(cells)) for i, cells in self.rows.items())
+        matrix.asymmetric.value = self.asymmetric.value
+        return matrix
+
+    def toList(self):
+        return [list(row) for row in self]
+
+# (index, value) pairs of the non-zero entries of any vector
+def nonzero(vector):
+    if isinstance(vector, SparseVector):
+        return vector.items()
+    return [(i, value) for i, value in enumerate(vector) if value]
+
+# ((row, column), value) pairs of the non-zero entries of any matrix
+def nonzeroCells(matrix):
+    if isinstance(matrix, SparseMatrix):
+        return matrix.items()
+    return [((i, j), value) for i, row in enumerate(matrix) for j, value in enumerate(row) if value]
+
+# checks if a 2D array is symmetric by comparing every pair
+def scanSymmetric(matrix):
+    size = len(matrix)
+    for i in range(size):
+        for j in range(size):
+            if (matrix[i][j] != matrix[j][i]):
+                return False
+    return True
+
+# all entries of a matrix in row-major order
+def flatten(matrix):
+    if isinstance(matrix, Matrix):
+        return matrix.data[:]
+    return [x for row in matrix for x in row]
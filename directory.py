@@ -0,0 +1,110 @@
+import os
+import mmap
+import time
+import tempfile
+
+# Which UDP port the node in each grid cell listens on.
+#
+# A node binds one socket when it starts and keeps it when it moves, so
+# once it has moved its port no longer says where it is. Every node on
+# the machine maps the same small file with one entry per cell and keeps
+# the entry for its own cell up to date, which is all send() needs to go
+# on addressing other nodes by cell:
+#
+#   0       nobody has registered here, use basis + cell as before
+#   EMPTY   the node that was here has moved on or left
+#   entry   the port of the node in this cell, and the id of the process
+#           it runs in (pid << 16 | port)
+#
+# The file is named after the grid (basis port and size), so grids that
+# don't overlap don't share one, and it outlives the nodes. A node that
+# was killed never vacates its cell, so a cell whose process is gone is
+# taken as empty, or the next run would send what is meant for that cell
+# to whoever has the port by then. Entries are 8 byte words, which are
+# written and read in one piece. MemoryDirectory keeps the same entries in
+# a list instead, for nodes that all live in one process (loopback.py).
+
+EMPTY = -1
+# seconds a process found running is taken to still be running
+LIVENESS_INTERVAL = 1.0
+
+# whether process pid is still running
+def running(pid):
+    if os.name != 'posix':
+        # no way to ask without side effects, take it at its word
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # someone else's
+        return True
+    return True
+
+class Directory():
+
+    def __init__(self, networkSize, basis, path=None):
+        self.basis = basis
+        self.size = networkSize * networkSize
+        if path is None:
+            path = os.path.join(tempfile.gettempdir(), 'grid-%d-%d.dir' % (basis, networkSize))
+        self.path = path
+        self.entries = self.allocate()
+        self.pid = os.getpid()
+        # pid -> when it was last found running
+        self.checked = {}
+
+    def allocate(self):
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            if os.fstat(fd).st_size < self.size * 8:
+                os.ftruncate(fd, self.size * 8)
+            self.map = mmap.mmap(fd, self.size * 8)
+        finally:
+            os.close(fd)
+        return memoryview(self.map).cast('q')
+
+    # port to send to for a cell, None if nobody is there
+    def lookup(self, cell):
+        entry = self.entries[cell]
+        if entry == 0:
+            return self.basis + cell
+        if entry == EMPTY or not self.isRunning(entry >> 16):
+            return None
+        return entry & 0xFFFF
+
+    def isRunning(self, pid):
+        if pid == self.pid:
+            return True
+        now = time.monotonic()
+        checked = self.checked.get(pid)
+        if checked is not None and now - checked < LIVENESS_INTERVAL:
+            return True
+        if not running(pid):
+            self.checked.pop(pid, None)
+            return False
+        self.checked[pid] = now
+        return True
+
+    # we are now at cell, listening on port
+    def register(self, cell, port):
+        self.entries[cell] = os.getpid() << 16 | port
+
+    # we (on port) have left cell, unless someone else has moved in since
+    def vacate(self, cell, port):
+        if self.entries[cell] == os.getpid() << 16 | port:
+            self.entries[cell] = EMPTY
+
+    def close(self):
+        self.entries.release()
+        self.map.close()
+
+class MemoryDirectory(Directory):
+
+    # every node using it registers, so a cell nobody registered is empty
+    def allocate(self):
+        return [EMPTY]*self.size
+
+    def close(self):
+        pass
@@ -0,0 +1,93 @@
+import time
+import collections
+import multiprocessing
+
+# Bookkeeping for one round of neighbor discovery.
+#
+# A round starts when we broadcast 'Hello?' to the cells around us and is
+# complete once every one of those cells has answered with 'Hello', or
+# nothing has arrived for a quiet period. Empty cells never answer, so in
+# practice most rounds end by going quiet. The quiet period adapts to the
+# round trip time measured from earlier replies:
+#
+#   quiet = clamp(QUIET_FACTOR * smoothed rtt, minQuiet, timeout)
+#
+# and no round lasts longer than timeout. Replies that arrive after a
+# round is over are still handled as usual, they just don't hold anything
+# up, and they still update the rtt estimate.
+#
+# With shared=True the state lives in shared memory so the listener
+# process can record replies that the main process is waiting for.
+# clock gives the current time, nodes on a simulated network pass theirs.
+
+QUIET_FACTOR = 4
+# shortest quiet period of nodes on real sockets, by which even a busy
+# listener process has answered, and of nodes on a simulated network,
+# whose replies take no time to arrive unless it says so
+QUIET = 0.25
+LOOPBACK_QUIET = 0.01
+# weight of a new sample in the smoothed rtt, as in TCP
+RTT_GAIN = 0.125
+
+# positions in the state array
+ROUND = 0
+START = 1
+LAST = 2
+EXPECTED = 3
+ANSWERED = 4
+RTT = 5
+
+class Discovery():
+
+    def __init__(self, numNodes, minQuiet=QUIET, timeout=2.0, shared=False, clock=time.monotonic):
+        self.minQuiet = minQuiet
+        self.timeout = timeout
+        self.clock = clock
+        if shared:
+            self.state = multiprocessing.RawArray('d', 6)
+            # round in which each node last answered
+            self.seen = multiprocessing.RawArray('q', numNodes)
+        else:
+            self.state = [0.0]*6
+            # grows as ids show up, numNodes may be None
+            self.seen = collections.defaultdict(int)
+        self.state[RTT] = minQuiet / QUIET_FACTOR
+
+    # start a new round in which `expected` cells were asked
+    def begin(self, expected, now=None):
+        if now is None:
+            now = self.clock()
+        state = self.state
+        state[ROUND] += 1
+        state[START] = now
+        state[LAST] = now
+        state[EXPECTED] = expected
+        state[ANSWERED] = 0
+
+    # record a 'Hello' from node id
+    def reply(self, id, now=None):
+        if now is None:
+            now = self.clock()
+        state = self.state
+        sample = now - state[START]
+        state[RTT] += RTT_GAIN * (sample - state[RTT])
+        state[LAST] = now
+        if self.seen[id] != state[ROUND]:
+            self.seen[id] = int(state[ROUND])
+            state[ANSWERED] += 1
+
+    def quietPeriod(self):
+        return min(max(QUIET_FACTOR * self.state[RTT], self.minQuiet), self.timeout)
+
+    # seconds until the current round is over, 0 if it already is
+    def remaining(self, now=None):
+        if now is None:
+            now = self.clock()
+        state = self.state
+        if state[ANSWERED] >= state[EXPECTED]:
+            return 0
+        deadline = min(state[LAST] + self.quietPeriod(), state[START] + self.timeout)
+        return max(deadline - now, 0)
+
+    def isComplete(self, now=None):
+        return self.remaining(now) == 0
@@ -0,0 +1,144 @@
+from bisect import bisect_left
+from multiprocessing.managers import BaseProxy
+from journal import Journal
+
+# The event list e of a node, indexed by the node's own clock component.
+#
+# Every event is recorded right after the node increments T[myID], so no
+# two events share that component and the 'Snapshot?' lookup ("the event
+# whose own time equals the requested cut") is a dict lookup instead of a
+# scan over the whole history.
+#
+# Events older than the latest consistent cut are only needed to answer
+# snapshot requests made with an older cut. retention says how many of
+# them to keep: None keeps everything (the original behavior), 0 keeps
+# nothing before the cut.
+#
+# With journalPath set every event is also written to a Journal in that
+# directory (see journal.py) and the events already there are loaded back.
+# append() then returns True every checkpointInterval events, to tell the
+# node it is time to checkpoint its clocks.
+class EventLog():
+
+    def __init__(self, ownID, retention=None, journalPath=None, numNodes=None, checkpointInterval=100):
+        self.ownID = ownID
+        self.retention = retention
+        # own time -> [T, location]
+        self.index = {}
+        # own times in the order the events were recorded (which is also
+        # increasing order), the ones before head have been pruned
+        self.order = []
+        self.head = 0
+
+        self.journal = None
+        self.checkpointInterval = checkpointInterval
+        self.sinceCheckpoint = 0
+        if journalPath is not None:
+            self.journal = Journal(journalPath, numNodes)
+            for event in self.journal.recovered:
+                self.add(event)
+            state = self.journal.recover()
+            if state is not None:
+                self.prune(state['L'][ownID])
+
+    # record an event ([T, location])
+    def append(self, event):
+        if not self.add(event):
+            return False
+        if self.journal is None:
+            return False
+        self.journal.append(event[0], event[1])
+        self.sinceCheckpoint += 1
+        return self.sinceCheckpoint >= self.checkpointInterval
+
+    # index an event, False if there already is one with the same own time
+    def add(self, event):
+        ownTime = event[0][self.ownID]
+        if ownTime in self.index:
+            # keep the first event with this time, like the old linear scan
+            return False
+        self.index[ownTime] = event
+        self.order.append(ownTime)
+        return True
+
+    # the event recorded at the given own time, or None
+    def find(self, ownTime):
+        return self.index.get(ownTime)
+
+    # drop events before cutTime beyond what the retention policy keeps
+    # returns how many events were dropped
+    def prune(self, cutTime):
+        if self.retention is None:
+            return 0
+        order = self.order
+        # number of events strictly before the cut
+        before = bisect_left(order, cutTime, self.head) - self.head
+        dropped = max(before - self.retention, 0)
+        for ownTime in order[self.head:self.head + dropped]:
+            del self.index[ownTime]
+        self.head += dropped
+        # forget the pruned prefix once it is most of the list
+        if self.head > len(order) // 2:
+            del order[:self.head]
+            self.head = 0
+        return dropped
+
+    # save the clocks (S flattened row-major) to the journal
+    def checkpoint(self, T, S, L):
+        if self.journal is not None:
+            self.journal.checkpoint(T, S, L)
+        self.sinceCheckpoint = 0
+
+    # clocks to restart from, None without a journal or with an empty one
+    def recover(self):
+        if self.journal is None:
+            return None
+        return self.journal.recover()
+
+    # stop journaling, everything written so far is flushed to disk
+    def close(self):
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+
+    # all events, oldest first
+    def events(self):
+        return [self.index[ownTime] for ownTime in self.order[self.head:]]
+
+    def __len__(self):
+        return len(self.order) - self.head
+
+    def __iter__(self):
+        return iter(self.events())
+
+# proxy for an EventLog living in a Manager server process
+class EventLogProxy(BaseProxy):
+
+    _exposed_ = ('append', 'find', 'prune', 'checkpoint', 'recover', 'close', 'events', '__len__')
+
+    def append(self, event):
+        return self._callmethod('append', (event,))
+
+    def find(self, ownTime):
+        return self._callmethod('find', (ownTime,))
+
+    def prune(self, cutTime):
+        return self._callmethod('prune', (cutTime,))
+
+    def checkpoint(self, T, S, L):
+        return self._callmethod('checkpoint', (T, S, L))
+
+    def recover(self):
+        return self._callmethod('recover')
+
+    def close(self):
+        return self._callmethod('close')
+
+    def events(self):
+        return self._callmethod('events')
+
+    def __len__(self):
+        return self._callmethod('__len__')
+
+    def __iter__(self):
+        return iter(self.events())
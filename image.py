@@ -0,0 +1,65 @@
+# The grid as one node sees it, for printNetwork.
+#
+# A node knows the 5x5 block of cells around it and where its active
+# neighbors are, which on a large grid is next to nothing, so the image
+# doesn't store a cell per grid cell. It is the neighbor table's
+# cell -> id map (kept up to date as neighbors come and go, see
+# neighbors.py) plus our own cell, and rows are worked out as they are
+# printed:
+#
+#   id   us, or an active neighbor
+#   +    a cell in range of us we know nothing about
+#   -    anything else
+#
+# rows() gives the rows of a viewport of `radius` cells around us, or with
+# radius=None of the whole grid, one row at a time, so printing even a
+# 2000x2000 grid never has more than one row in memory.
+
+# cells on each side of us a viewport shows unless told otherwise (on an
+# 8x8 grid that is all of it, wherever we are)
+RADIUS = 8
+# how far a node's range reaches, as in Node.calculateNeighbors
+RANGE = 2
+
+class NetworkImage():
+
+    # cells: location -> id of the active neighbors
+    def __init__(self, networkSize, location, id, cells):
+        self.networkSize = networkSize
+        self.row = location // networkSize
+        self.column = location % networkSize
+        # row -> {column: label}
+        self.labels = {}
+        for cell, neighbor in cells.items():
+            self.labels.setdefault(cell // networkSize, {})[cell % networkSize] = str(neighbor)
+        self.labels.setdefault(self.row, {}).setdefault(self.column, str(id))
+
+    # rows and columns shown, clipped to the grid
+    def bounds(self, radius):
+        if radius is None:
+            return 0, self.networkSize - 1, 0, self.networkSize - 1
+        last = self.networkSize - 1
+        return (max(self.row - radius, 0), min(self.row + radius, last),
+                max(self.column - radius, 0), min(self.column + radius, last))
+
+    # the rows of the viewport, each as '|...|'
+    def rows(self, radius=RADIUS):
+        top, bottom, left, right = self.bounds(radius)
+        empty = '|' + '-'*(right - left + 1) + '|'
+        for row in range(top, bottom + 1):
+            labels = self.labels.get(row)
+            inRange = abs(row - self.row) <= RANGE
+            if labels is None and not inRange:
+                yield empty
+            else:
+                yield '|' + self.render(row, left, right, labels or {}, inRange) + '|'
+
+    def render(self, row, left, right, labels, inRange):
+        cells = ['-']*(right - left + 1)
+        if inRange:
+            for column in range(max(self.column - RANGE, left), min(self.column + RANGE, right) + 1):
+                cells[column - left] = '+'
+        for column, label in labels.items():
+            if left <= column <= right:
+                cells[column - left] = label
+        return ''.join(cells)
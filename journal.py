@@ -0,0 +1,222 @@
+import os
+import mmap
+import struct
+import zlib
+import threading
+
+# On-disk journal of a node's events, with checkpoints of its clocks.
+#
+# Events are appended as fixed-size records to segment files that are
+# memory-mapped, so an append is a struct.pack_into into the mapping and
+# no system call. Once a record is in the mapping it survives the node
+# process dying (the kernel writes the pages back), only a crash of the
+# machine itself can lose the last few. flush() forces them out and is
+# called on every checkpoint.
+#
+#   segment file  events-000000.seg, events-000001.seg, ...
+#     header      magic, record size, records per segment
+#     record      crc32, location, T[0] ... T[n-1]
+#
+# Segments are created at full size, so unwritten records are zeros and
+# fail the crc check. Recovery reads records until the first one that
+# doesn't check out and continues appending from there, which also drops
+# a record torn by a crash halfway through writing it.
+#
+# Checkpoints of T, S and L go to two fixed slots in one more mapped file,
+# alternately, so a crash while writing one still leaves the other. Each
+# slot stores how many events had been journaled when it was taken.
+#
+#   checkpoint    slot 0, slot 1
+#     slot        crc32, sequence, event count, T, S (row-major), L
+
+MAGIC = 0x4A4E4C31
+SEGMENT_HEADER = struct.Struct('<III')
+CHECKPOINT_HEADER = struct.Struct('<QQ')
+CRC = struct.Struct('<I')
+SEGMENT_RECORDS = 4096
+CHECKPOINT_FILE = 'checkpoint'
+
+# file of a journal's segment-th segment
+def segmentPath(path, segment):
+    return os.path.join(path, 'events-%06d.seg' % segment)
+
+class JournalError(Exception):
+    pass
+
+class Journal():
+
+    # path is a directory used only by this node's journal
+    def __init__(self, path, numNodes, segmentRecords=SEGMENT_RECORDS):
+        self.path = path
+        self.numNodes = numNodes
+        self.segmentRecords = segmentRecords
+        # location and T
+        self.record = struct.Struct('<q%dq' % numNodes)
+        # T, S and L
+        self.clocks = struct.Struct('<%dq' % (2*numNodes + numNodes*numNodes))
+        self.recordSize = CRC.size + self.record.size
+        self.segmentSize = SEGMENT_HEADER.size + segmentRecords * self.recordSize
+        # the manager serving the EventLog runs a thread per connection
+        self.lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+        # events read back from disk, [T, location]
+        self.recovered = []
+        # index of the current segment and the next free record in it
+        self.segment = 0
+        self.position = 0
+        self.count = 0
+        self.map = None
+        self.recoverEvents()
+        self.openSegment(self.segment)
+
+        self.slotSize = CRC.size + CHECKPOINT_HEADER.size + self.clocks.size
+        self.checkpointMap = self.mapFile(os.path.join(path, CHECKPOINT_FILE), 2 * self.slotSize)
+        self.sequence = 0
+        self.latest = self.readCheckpoint()
+
+    def segmentPath(self, segment):
+        return segmentPath(self.path, segment)
+
+    # map a file of the given size, creating it (zero filled) if needed
+    def mapFile(self, filePath, size):
+        fd = os.open(filePath, os.O_RDWR | os.O_CREAT)
+        try:
+            if os.fstat(fd).st_size != size:
+                if os.fstat(fd).st_size != 0:
+                    raise JournalError('%s has the wrong size' % filePath)
+                os.ftruncate(fd, size)
+            return mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+    def openSegment(self, segment):
+        if self.map is not None:
+            self.map.flush()
+            self.map.close()
+        self.segment = segment
+        filePath = self.segmentPath(segment)
+        new = not os.path.exists(filePath)
+        self.map = self.mapFile(filePath, self.segmentSize)
+        if new:
+            SEGMENT_HEADER.pack_into(self.map, 0, MAGIC, self.record.size, self.segmentRecords)
+        else:
+            self.checkHeader(self.map, filePath)
+
+    def checkHeader(self, data, filePath):
+        magic, recordSize, segmentRecords = SEGMENT_HEADER.unpack_from(data, 0)
+        if magic != MAGIC or recordSize != self.record.size or segmentRecords != self.segmentRecords:
+            raise JournalError('%s was written with different settings' % filePath)
+
+    # offset of record i in a segment
+    def offset(self, i):
+        return SEGMENT_HEADER.size + i * self.recordSize
+
+    # read every valid record, leaving segment/position after the last one
+    def recoverEvents(self):
+        segment = 0
+        while os.path.exists(self.segmentPath(segment)):
+            filePath = self.segmentPath(segment)
+            with open(filePath, 'rb') as f:
+                data = f.read()
+            if len(data) != self.segmentSize:
+                raise JournalError('%s has the wrong size' % filePath)
+            self.checkHeader(data, filePath)
+            for i in range(self.segmentRecords):
+                start = self.offset(i)
+                crc, = CRC.unpack_from(data, start)
+                body = data[start + CRC.size:start + self.recordSize]
+                if zlib.crc32(body) != crc:
+                    self.segment, self.position = segment, i
+                    self.removeSegments(segment + 1)
+                    return
+                values = self.record.unpack(body)
+                self.recovered.append([list(values[1:]), values[0]])
+                self.count += 1
+            segment += 1
+        # every segment is full (or there are none)
+        self.segment, self.position = segment, 0
+
+    # segments after a torn record were never completed
+    def removeSegments(self, first):
+        while os.path.exists(self.segmentPath(first)):
+            os.remove(self.segmentPath(first))
+            first += 1
+
+    # add an event
+    def append(self, T, location):
+        with self.lock:
+            if self.position == self.segmentRecords:
+                self.openSegment(self.segment + 1)
+                self.position = 0
+            start = self.offset(self.position)
+            # body first, a crash before the crc is written leaves a record
+            # that recovery ignores
+            body = self.record.pack(location, *T)
+            self.map[start + CRC.size:start + self.recordSize] = body
+            CRC.pack_into(self.map, start, zlib.crc32(body))
+            self.position += 1
+            self.count += 1
+
+    # save T, S (flat, row-major) and L into the older of the two slots
+    def checkpoint(self, T, S, L):
+        with self.lock:
+            self.map.flush()
+            self.sequence += 1
+            start = (self.sequence % 2) * self.slotSize
+            body = self.clocks.pack(*T, *S, *L)
+            data = CHECKPOINT_HEADER.pack(self.sequence, self.count) + body
+            self.checkpointMap[start + CRC.size:start + self.slotSize] = data
+            CRC.pack_into(self.checkpointMap, start, zlib.crc32(data))
+            self.checkpointMap.flush()
+            self.latest = self.unpackClocks(body, self.count)
+
+    def unpackClocks(self, body, count):
+        n = self.numNodes
+        values = list(self.clocks.unpack(body))
+        S = [values[n + i*n:n + (i + 1)*n] for i in range(n)]
+        return {'T': values[:n], 'S': S, 'L': values[n + n*n:], 'count': count}
+
+    # the newest valid checkpoint, or None
+    def readCheckpoint(self):
+        latest = None
+        for slot in range(2):
+            start = slot * self.slotSize
+            crc, = CRC.unpack_from(self.checkpointMap, start)
+            data = self.checkpointMap[start + CRC.size:start + self.slotSize]
+            sequence, count = CHECKPOINT_HEADER.unpack_from(data, 0)
+            if sequence == 0 or zlib.crc32(data) != crc or sequence < self.sequence:
+                continue
+            self.sequence = sequence
+            latest = self.unpackClocks(data[CHECKPOINT_HEADER.size:], count)
+        return latest
+
+    # clocks to restart from: the last checkpoint with T brought up to date
+    # by the events journaled after it, or None if there is nothing on disk
+    def recover(self):
+        if self.latest is None and not self.recovered:
+            return None
+        n = self.numNodes
+        if self.latest is None:
+            state = {'T': [0]*n, 'S': None, 'L': [0]*n, 'count': 0}
+        else:
+            state = dict(self.latest)
+        T = list(state['T'])
+        for event in self.recovered[state['count']:]:
+            T = [max(a, b) for a, b in zip(T, event[0])]
+        state['T'] = T
+        return state
+
+    def flush(self):
+        with self.lock:
+            self.map.flush()
+            self.checkpointMap.flush()
+
+    def close(self):
+        with self.lock:
+            if self.map is not None:
+                self.map.flush()
+                self.map.close()
+                self.map = None
+            self.checkpointMap.flush()
+            self.checkpointMap.close()
@@ -0,0 +1,103 @@
+from clocks import Vector, Matrix, SparseVector, SparseMatrix, SharedVector, SharedMatrix
+
+# NumPy versions of the clock merges and the symmetry check.
+#
+# Node.updateT and Node.updateS merge clocks one entry at a time in
+# Python, which at a few hundred nodes is most of the time a handler
+# takes. With NumPy a merge is one elementwise maximum and a symmetry
+# check one comparison against the transpose. Clocks are int64 either way
+# (the shared arrays are 'q'), so the results are exactly the ones the
+# Python loops give.
+#
+# SharedVector and SharedMatrix are used in place, through arrays over the
+# same shared memory, so the listener process sees the result as usual.
+# Anything else (lists, Vector, Matrix, the sparse clocks a delta decodes
+# to) is copied into an array first.
+#
+# NumPy is optional: without it available() is False and nodes keep using
+# the Python loops.
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# clock size from which nodes use the kernels unless told otherwise, below
+# it calling into NumPy costs more than the loops it replaces
+# (python bench.py kernels: slower at 3 nodes, twice as fast at 8)
+AUTO_SIZE = 8
+# a plain list matrix has to be copied into an array before it can be
+# compared with its transpose, which only pays off for large ones
+SCAN_SIZE = 64
+
+def available():
+    return numpy is not None
+
+# whether a node with size x size clocks should use the kernels
+# setting is True, False, or None to decide by size
+def enabled(setting, size):
+    if numpy is None or size is None:
+        return False
+    if setting is None:
+        return size >= AUTO_SIZE
+    return setting
+
+# a vector as an int64 array of length size (a view for SharedVector)
+def vectorArray(vector, size):
+    if isinstance(vector, SharedVector):
+        return numpy.frombuffer(vector.data, dtype=numpy.int64)
+    if isinstance(vector, SparseVector):
+        array = numpy.zeros(size, dtype=numpy.int64)
+        for i, value in vector.items():
+            if i < size:
+                array[i] = value
+        return array
+    if isinstance(vector, Vector):
+        vector = vector.data
+    return numpy.array(vector[:size], dtype=numpy.int64)
+
+# a matrix as a size x size int64 array (a view for SharedMatrix)
+def matrixArray(matrix, size):
+    if isinstance(matrix, SharedMatrix):
+        return numpy.frombuffer(matrix.data, dtype=numpy.int64).reshape(size, size)
+    if isinstance(matrix, SparseMatrix):
+        array = numpy.zeros((size, size), dtype=numpy.int64)
+        for (i, j), value in matrix.items():
+            if i < size and j < size:
+                array[i, j] = value
+        return array
+    if isinstance(matrix, Matrix):
+        return numpy.array(matrix.data, dtype=numpy.int64).reshape(size, size)
+    if isinstance(matrix, numpy.ndarray):
+        return matrix[:size, :size]
+    return numpy.array([list(row)[:size] for row in matrix[:size]], dtype=numpy.int64)
+
+# number of pairs (i, j), i < j, with matrix[i][j] != matrix[j][i]
+def asymmetricPairs(array):
+    return int(numpy.count_nonzero(array != array.T)) // 2
+
+def isSymmetric(matrix, size):
+    array = matrixArray(matrix, size)
+    return bool((array == array.T).all())
+
+# vector0 = elementwise max(vector1, vector2), vector0 a Vector
+def maximum(vector0, vector1, vector2, size):
+    result = numpy.maximum(vectorArray(vector1, size), vectorArray(vector2, size))
+    if isinstance(vector0, SharedVector):
+        vectorArray(vector0, size)[:] = result
+    else:
+        vector0[:] = result.tolist()
+
+# matrix0 = elementwise max(matrix1, matrix2), matrix0 a Matrix
+# the asymmetric pair count is recounted from the result
+def maximumMatrix(matrix0, matrix1, matrix2, size):
+    result = numpy.maximum(matrixArray(matrix1, size), matrixArray(matrix2, size))
+    if isinstance(matrix0, SharedMatrix):
+        matrixArray(matrix0, size)[:] = result
+    else:
+        matrix0.data[:] = result.ravel().tolist()
+    matrix0.asymmetric.value = asymmetricPairs(result)
+
+# a copy of a matrix to change and merge back in with maximumMatrix
+def copyMatrix(matrix, size):
+    return matrixArray(matrix, size).copy()
@@ -1,58 +1,247 @@
 from socket import *
 import multiprocessing
-from multiprocessing import Manager
+from multiprocessing.managers import SyncManager
+import threading
+import asyncio
+import ctypes
 import time
+import select
+from clocks import Vector, Matrix, SharedVector, SharedMatrix, SparseVector, SparseMatrix
+from clocks import flatten, scanSymmetric, nonzero, nonzeroCells
+from discovery import Discovery, QUIET, LOOPBACK_QUIET
+from eventlog import EventLog, EventLogProxy
+from neighbors import NeighborTable, NeighborTableProxy
+from directory import Directory
+from metrics import Metrics, MetricsDump
+from outbox import Outbox
+from image import NetworkImage, RADIUS
+from multicast import Multicast, groupPort
+import kernels
+from reliable import ReliableTransport, Timers, WINDOW
+import wire
+
+# parts of the sender's clocks each message type carries in the binary
+# format, the handler for that type never looks at the others
+PAYLOAD = {
+    'Hello?': 'TS',
+    'Hello': 'TS',
+    'External': 'TS',
+    'Snapshot?': 'L',
+}
+# message types the receiver always merges into its clocks, these only
+# need the entries that changed since the last one sent to the same peer
+DELTA_TYPES = ['External']
+# deltas sent to a peer between full clocks, which bounds how long an entry
+# lost with full clocks that didn't arrive can stay missing
+RESYNC = 16
+# floods (origin, sequence) a node remembers the sender of, for duplicate
+# suppression and to route replies back
+MAX_FLOODS = 256
+
+# Manager that can also host a node's EventLog and NeighborTable
+class NodeManager(SyncManager):
+    pass
+
+NodeManager.register('EventLog', EventLog, EventLogProxy)
+NodeManager.register('NeighborTable', NeighborTable, NeighborTableProxy)
 
 class Node():
 
     # creates a node an places it within its own network image
-    def __init__(self, networkSize, location, name, basis, numNodes, id):
+    # sharedMemory keeps T, S and L in shared memory instead of Manager lists
+    # wireFormat is 'binary' or 'text' (the original comma separated format)
+    # discoveryQuiet and discoveryTimeout bound how long neighbor discovery
+    # waits for replies (see discovery.py, LocalNode waits less as the
+    # simulated network is fast), with wait=False the constructor
+    # returns right away and waitForDiscovery() blocks until it is done
+    # eventRetention is how many events from before the latest consistent
+    # cut to keep (None keeps all of them, see eventlog.py)
+    # journal is a directory to journal events and checkpoint the clocks in
+    # every checkpointInterval events (see journal.py), a node started on a
+    # directory that already has a journal picks up where that one left off
+    # directoryPath is the file mapping cells to ports (see directory.py)
+    # transport carries the datagrams, UDPTransport unless given
+    # metrics=True counts messages and times their handlers (see metrics.py)
+    # vectorized merges the clocks with NumPy if it is installed, None
+    # leaves it to the number of nodes (see kernels.py)
+    # reliable acknowledges and retransmits what we send to other nodes over
+    # UDP (see reliable.py), every node of the grid has to do the same
+    def __init__(self, networkSize, location, name, basis, numNodes, id, sharedMemory=True, wireFormat='binary',
+                 discoveryQuiet=QUIET, discoveryTimeout=2.0, wait=True, eventRetention=None,
+                 journal=None, checkpointInterval=100, directoryPath=None, transport=None, metrics=False,
+                 vectorized=None, multicast=False, reliable=False):
+        self.configure(networkSize, location, name, basis, numNodes, id, wireFormat,
+                       Directory(networkSize, basis, directoryPath))
+        # counted into by the listener process as well
+        self.metrics = Metrics(shared=True) if metrics else None
+
+        self.manager = NodeManager()
+        self.manager.start()
+        # guards T, S and L, shared by the main and listener processes
+        self.lock = multiprocessing.RLock()
+        # replies to our 'Hello?' are recorded by the listener process
+        self.discovery = Discovery(self.numNodes, discoveryQuiet, discoveryTimeout, shared=True)
+        # notified by the listener whenever a reply the main process may be
+        # waiting for ('Hello', 'Snapshot|') has been recorded
+        self.progress = multiprocessing.Condition(self.lock)
+        # sequence number of our latest flood, read by the listener to match
+        # replies (starts from the clock so a restarted node doesn't reuse
+        # numbers other nodes still remember)
+        self.floodSeq = multiprocessing.RawValue('q', int(time.time() * 1000))
+        temp = self.initialS()
+        if sharedMemory:
+            # time vector
+            self.T = SharedVector(self.numNodes)
+            # connection matrix
+            self.S = SharedMatrix(self.numNodes, temp)
+            # latest consistent cut time
+            self.L = SharedVector(self.numNodes)
+            self.vectorized = kernels.enabled(vectorized, self.numNodes)
+        else:
+            self.T = self.manager.list([0]*self.numNodes)
+            self.S = self.manager.list(temp)
+            self.L = self.manager.list([0]*self.numNodes)
+        # bumped by the listener whenever the link to a peer goes up or down,
+        # so the next message to that peer is sent in full
+        if sharedMemory:
+            self.peerEpoch = SharedVector(self.numNodes)
+        else:
+            self.peerEpoch = self.manager.list([0]*self.numNodes)
+        # event list, indexed by our own clock component
+        self.e = self.manager.EventLog(self.myID, eventRetention, journal, self.numNodes, checkpointInterval)
+        self.restore()
+
+        self.snapshot = self.manager.list([])
+        # evicted by the listener process on 'Goodbye' and 'Exiting'
+        self.snapshotCache = self.manager.dict()
+
+        if transport is None:
+            transport = ReliableUDPTransport() if reliable else UDPTransport()
+        self.transport = transport
+        # announce ourselves to multicast groups instead of every cell
+        # (see multicast.py), the listener process reads their socket too
+        if multicast and isinstance(transport, UDPTransport):
+            self.groups = Multicast.open(self.networkSize, groupPort(self.basis))
+            if self.groups is not None:
+                transport.listenTo(self.groups.socket)
+
+        self.activeNeighbors = self.manager.NeighborTable(self.networkSize)
+        self.connectedNeighbors = self.manager.list([])
+
+        self.startListening()
+        self.discover(wait)
+
+    # settings and local state every runtime needs
+    # directory maps cells to ports (see directory.py)
+    def configure(self, networkSize, location, name, basis, numNodes, id, wireFormat, directory):
         self.active = True
 
         self.networkSize = networkSize
-        self.myLocation = location
+        # our cell, in shared memory so the listener process sees us move
+        self.cell = multiprocessing.RawValue('q', location)
         self.myName = name
         self.basis = basis
+        # the port we would like, startListening() sets the one we got
         self.myPort = self.basis + self.myLocation
         self.numNodes = numNodes
         self.myID = id
+        self.wireFormat = wireFormat
+        # T, S and L are SparseVector/SparseMatrix (see clocks.py)
+        self.sparse = False
+        # T and S are merged with the NumPy kernels (see kernels.py)
+        self.vectorized = False
+        # where the other nodes listen
+        self.directory = directory
+
+        # peer id -> (epoch, T, S, deltas sent since) as last sent in full to
+        # that peer, S flattened unless it is sparse
+        self.lastSent = {}
+        # (origin, sequence) -> location of the neighbor the flood came from
+        self.floods = {}
+        # MetricsDump writing stats() to a file, see dumpStats()
+        self.statsDump = None
+        # queues messages inside batch() blocks (see outbox.py)
+        self.outbox = Outbox(self.transmit)
+        # multicast groups 'Hello?' goes to, None to send it to every cell
+        self.groups = None
+
+        self.networkImage = None
+        self.neighbors = self.calculateNeighbors()
 
-        self.manager = Manager()
-        # time vector
-        self.T = self.manager.list([0]*self.numNodes)
-        # connection matrix
-        temp = [ [0]*self.numNodes for i in range(self.numNodes)]
-        temp[self.myID][self.myID] = 1
-        self.S = self.manager.list(temp)
-        # latest consistent cut time
-        self.L = self.manager.list([0]*self.numNodes)
-        # event list
-        self.e = self.manager.list([])
-
-        self.snapshot = self.manager.list([])
-
-        self.row = int(self.myLocation / self.networkSize)
-        self.column = self.myLocation % self.networkSize
+    @property
+    def myLocation(self):
+        return self.cell.value
 
-        # initiate a UDP socket
-        self.sendSocket = socket(AF_INET, SOCK_DGRAM)
-        self.listenSocket = socket(AF_INET, SOCK_DGRAM)
-        self.listenSocket.bind(('', self.myPort))
+    @myLocation.setter
+    def myLocation(self, location):
+        self.cell.value = location
 
-        self.activeNeighbors = self.manager.list([])
-        self.connectedNeighbors = self.manager.list([])
+    @property
+    def row(self):
+        return self.myLocation // self.networkSize
 
-        self.listenP = multiprocessing.Process(target=self.listen, args=(self.activeNeighbors,self.connectedNeighbors, self.T, self.S, self.L, self.e, self.snapshot))
-        self.listenP.start()
+    @property
+    def column(self):
+        return self.myLocation % self.networkSize
 
-        self.networkImage = []
+    # initial connection matrix, we are only connected to ourselves
+    def initialS(self):
+        temp = [ [0]*self.numNodes for i in range(self.numNodes)]
+        temp[self.myID][self.myID] = 1
+        return temp
+
+    # open the transport, which we keep for as long as we are in the network
+    # we ask for the port of our starting cell, a node that started there
+    # and has moved on may still have it, then we get some other port
+    def startListening(self):
+        self.reassembler = wire.Reassembler()
+        self.myPort = self.transport.open(self.myPort, self.receive)
+        self.directory.register(self.myLocation, self.myPort)
+
+    def stopListening(self):
+        self.transport.close()
+
+    # look for neighbors around our location, by default waiting until they
+    # have all answered or gone quiet
+    def discover(self, wait=True):
         self.neighbors = self.calculateNeighbors()
-        
         self.checkForNeighbors()
-        time.sleep(2)
-
+        if wait:
+            self.waitForDiscovery()
+
+    # block until the current discovery round is over
+    def waitForDiscovery(self):
+        with self.outbox.unbatched(), self.progress:
+            remaining = self.discovery.remaining()
+            while remaining > 0:
+                self.pause(remaining)
+                remaining = self.discovery.remaining()
         self.updateNetworkImage()
 
+    # block until done() returns True or timeout seconds have passed,
+    # returns the last value of done()
+    def waitFor(self, done, timeout):
+        deadline = self.clock() + timeout
+        with self.outbox.unbatched(), self.progress:
+            while not done():
+                remaining = deadline - self.clock()
+                if remaining <= 0:
+                    return False
+                self.pause(remaining)
+        return True
+
+    # time as the network sees it
+    def clock(self):
+        return time.monotonic()
+
+    # wait (holding progress) until notified or timeout seconds have passed
+    def pause(self, timeout):
+        self.progress.wait(timeout)
+
+    # called by the listener (holding the lock) after recording a reply
+    def notifyProgress(self):
+        self.progress.notify_all()
+
     # Determine which parts of the network are reachable
     def calculateNeighbors(self):
         neighbors = []
@@ -63,205 +252,375 @@ class Node():
 
         return neighbors
 
-    # send a message to all "nearby" ports
-    def broadcast(self, message):
+    # locations of the "nearby" cells that are inside the network
+    def reachableCells(self):
+        cells = []
         for neighbor in self.neighbors:
             if neighbor[0] < 0 or neighbor[1] < 0:
                 continue
             if neighbor[0] >= self.networkSize or neighbor[1] >= self.networkSize:
                 continue
+            cells.append(neighbor[0]*self.networkSize + neighbor[1])
+        return cells
 
-            self.send(message, neighbor[0]*self.networkSize + neighbor[1])
-
-    # send to every location in the network
-    # the paper uses 'some other broadcast protocol'
-    def globalBroadcast(self, message):
-        for i in range(self.networkSize*self.networkSize):
-            self.send(message, i)
+    # send a message to all "nearby" ports
+    # most of the cells are empty, so it goes out best effort, never
+    # retransmitted (see reliable.py)
+    def broadcast(self, message):
+        self.sendAll(message, self.reachableCells(), reliable=False)
+
+    # send to every node we can reach over live links
+    # the paper uses 'some other broadcast protocol': this one floods. The
+    # message goes out as 'message|origin|sequence' to our connected
+    # neighbors, and every node passes it on once to its own (relayFlood)
+    # so it costs a message per link instead of one per grid cell.
+    # anything in arg goes after the sequence number
+    # returns the sequence number of the flood
+    def globalBroadcast(self, message, arg=None):
+        self.floodSeq.value += 1
+        message += '|%d|%d' % (self.myID, self.floodSeq.value)
+        if arg is not None:
+            message += '|' + arg
+        self.sendAll(message, [neighbor[3] for neighbor in self.connectedEntries()])
+        return self.floodSeq.value
+
+    # the first time flood (origin, sequence) arrives, remember where it came
+    # from and pass it on to our other connected neighbors, with cut (the
+    # origin's L) as the L it carries
+    # returns (origin, sequence), or None if we have already seen it
+    def relayFlood(self, msgType, senderID, senderLocation, cut):
+        name, origin, seq = msgType.split('|')[:3]
+        origin, seq = int(origin), int(seq)
+        if origin == self.myID or (origin, seq) in self.floods:
+            return None
+        self.floods[(origin, seq)] = senderLocation
+        if len(self.floods) > MAX_FLOODS:
+            del self.floods[next(iter(self.floods))]
+        locations = [neighbor[3] for neighbor in self.connectedEntries() if neighbor[2] != senderID and neighbor[2] != origin]
+        self.sendAll(msgType, locations, cut)
+        return origin, seq
+
+    # activeNeighbors entries of the nodes we are connected to
+    def connectedEntries(self):
+        connected = set(self.connectedNeighbors)
+        return [neighbor for neighbor in self.activeNeighbors if neighbor[2] in connected]
 
     # broadcast to neighbors a simple 'are you there' message
     def checkForNeighbors(self):
-        self.broadcast('Hello?')    
-
-    # updates local image of network
+        # every link is about to be re-established
+        self.lastSent.clear()
+        # cells the directory knows are empty won't answer
+        cells = [cell for cell in self.reachableCells() if self.directory.lookup(cell) is not None]
+        with self.lock:
+            self.discovery.begin(len(cells))
+        if self.groups is not None and self.groups.follow(self.myLocation):
+            self.announce('Hello?')
+        else:
+            self.broadcast('Hello?')
+
+    # send a message to everyone in range with one multicast datagram
+    def announce(self, message):
+        with self.lock:
+            payload = self.encode(message)
+        self.groups.announce(payload, self.myLocation)
+        if self.metrics is not None:
+            with self.lock:
+                self.metrics.sent(message, len(payload))
+
+    # whether location is in the 5x5 block of cells around us
+    def inRange(self, location):
+        return (abs(location // self.networkSize - self.row) <= 2 and
+                abs(location % self.networkSize - self.column) <= 2)
+
+    # updates local image of network (see image.py)
     def updateNetworkImage(self):
-
-        newImage = [ ['-']*self.networkSize for i in range(self.networkSize)]
-        newImage[self.row][self.column] = str(self.myID)
-
-        for neighbor in self.neighbors:
-            if neighbor[0] < 0 or neighbor[1] < 0:
-                continue
-            if neighbor[0] >= self.networkSize or neighbor[1] >= self.networkSize:
-                continue
-            newImage[neighbor[0]][neighbor[1]] = '+'
-
-        for neighbor in self.activeNeighbors:
-            newImage[neighbor[0]][neighbor[1]] = str(neighbor[2])
-
-        self.networkImage = newImage
+        self.networkImage = NetworkImage(self.networkSize, self.myLocation, self.myID, self.activeNeighbors.cells())
 
     # sends things in standardized format
-    def send(self, message, destinationLocation):
-        port = self.basis + destinationLocation
-        self.sendSocket.sendto(message+','+str(self.myLocation)+','+str(self.myID)+','+':'.join(map(str, self.T))+','+self.matrixToStr(self.S)+','+':'.join(map(str, self.L)), (self.myName, port))
-
-    # always listening function
-    def listen(self, activeNeighbors, connectedNeighbors, T, S, L, e, snapshot):
+    # peer is the id of the receiving node, if known
+    # cut is sent in place of our own L (when passing on someone else's flood)
+    def send(self, message, destinationLocation, peer=None, cut=None):
+        port = self.directory.lookup(destinationLocation)
+        if port is None:
+            # nobody there
+            return
+        with self.lock:
+            payload = self.encode(message, peer, cut)
+        self.post(message, payload, port)
+
+    # send the same message to several locations, encoding it only once
+    # (it can't carry a per-peer delta)
+    # a node that is in several of the cells (the directory still has it
+    # where it was) gets it once
+    def sendAll(self, message, locations, cut=None, reliable=True):
+        ports = []
+        for location in locations:
+            port = self.directory.lookup(location)
+            if port is not None and port not in ports:
+                ports.append(port)
+        if not ports:
+            return
+        with self.lock:
+            payload = self.encode(message, cut=cut)
+        for port in ports:
+            self.post(message, payload, port, reliable)
+
+    # hand an encoded message to the outbox
+    def post(self, message, payload, port, reliable=True):
+        self.outbox.send(payload, port, reliable)
+        if self.metrics is not None:
+            with self.lock:
+                self.metrics.sent(message, len(payload))
+
+    # put an encoded message (or batch) on the wire
+    # large messages go out as several datagrams, and ones that needn't be
+    # reliable around the reliability layer, if there is one
+    def transmit(self, data, port, reliable=True):
+        transport = self.transport
+        if not reliable and isinstance(transport, (ReliableTransport, ReliableUDPTransport)):
+            transport = transport.inner
+        for datagram in wire.fragment(data):
+            transport.sendto(datagram, (self.myName, port))
+
+    # messages sent inside a `with node.batch():` block go out together at
+    # the end of it, one datagram per destination (see outbox.py)
+    def batch(self):
+        return self.outbox.batch()
+
+    # encode a message carrying only the parts of our clocks the receiver uses
+    def encode(self, message, peer=None, cut=None):
+        if cut is None:
+            cut = self.L[:]
+        if self.wireFormat == 'text':
+            return wire.encode(message, self.myLocation, self.myID, self.T, self.S, cut, 'text')
+
+        parts = PAYLOAD.get(message.split('|')[0], '')
+        T = None
+        S = None
+        L = None
+        if peer is not None and message in DELTA_TYPES:
+            T, S = self.clockDelta(peer)
+        else:
+            if 'T' in parts:
+                T = self.T[:]
+            if 'S' in parts:
+                S = self.S
+        if 'L' in parts:
+            L = cut
+        size = self.numNodes
+        if self.sparse:
+            # only the non-zero entries go out, as deltas against zero
+            size = max(len(self.T), len(self.S), len(cut))
+            if T is not None and not isinstance(T, dict):
+                T = dict(nonzero(T))
+            if S is not None and not isinstance(S, dict):
+                S = dict(nonzeroCells(S))
+            if L is not None:
+                L = dict(nonzero(L))
+        return wire.encode(message, self.myLocation, self.myID, T, S, L, 'binary', size)
+
+    # entries of T and S that changed since we last sent peer all of them, or
+    # all of T and S if the link to peer has gone up or down since then or
+    # RESYNC messages have gone out since
+    # Since clocks only grow, merging just these entries with max() gives the
+    # receiver the same result as merging the full clocks would. Nothing
+    # tells us whether a message arrived, so every delta carries everything
+    # since the last full clocks: a lost delta is made up for by the next
+    # message, and lost full clocks by the next RESYNC. (Full clocks sent
+    # because they are smaller than the delta don't count as a resync.)
+    def clockDelta(self, peer):
+        epoch = self.peerEpoch[peer]
+        if self.sparse:
+            return self.sparseDelta(peer, epoch)
+        T = self.T[:]
+        flatS = flatten(self.S)
+        last = self.lastSent.get(peer)
+        if last is None or last[0] != epoch or last[3] >= RESYNC:
+            self.lastSent[peer] = (epoch, T, flatS, 0)
+            return T, self.S
+
+        n = self.numNodes
+        deltaT = {}
+        for i in range(n):
+            if T[i] != last[1][i]:
+                deltaT[i] = T[i]
+        deltaS = {}
+        for k, value in enumerate(flatS):
+            if value != last[2][k]:
+                deltaS[(k // n, k % n)] = value
+        self.lastSent[peer] = last[:3] + (last[3] + 1,)
+        # each changed entry also costs a 4 byte index
+        if 5 * (len(deltaT) + len(deltaS)) >= n + n*n:
+            return T, self.S
+        return deltaT, deltaS
+
+    # clockDelta() for sparse clocks, which only looks at non-zero entries
+    # (an entry that was 0 last time and still is can't have changed)
+    def sparseDelta(self, peer, epoch):
+        T = self.T.copy()
+        S = self.S.copy()
+        last = self.lastSent.get(peer)
+        if last is None or last[0] != epoch or last[3] >= RESYNC:
+            self.lastSent[peer] = (epoch, T, S, 0)
+            return dict(T.items()), dict(S.items())
+        lastT, lastS = last[1], last[2]
+        deltaT = {}
+        for i, value in T.items():
+            if value != lastT[i]:
+                deltaT[i] = value
+        deltaS = {}
+        for (i, j), value in S.items():
+            if value != lastS.get(i, j):
+                deltaS[(i, j)] = value
+        self.lastSent[peer] = last[:3] + (last[3] + 1,)
+        return deltaT, deltaS
+
+    # handle one datagram once the message it belongs to is complete
+    def receive(self, datagram, senderAddr):
+        try:
+            message = self.reassembler.add(datagram, senderAddr)
+            if message is not None:
+                # replies to everything in a batch are batched too
+                with self.outbox.batch():
+                    for part in wire.unbatch(message):
+                        self.handleMessage(part)
+        except wire.WireError:
+            # ignore anything we cannot parse
+            if self.metrics is not None:
+                with self.lock:
+                    self.metrics.parseFailure()
+
+    # react to a single (reassembled) message from another node
+    def handleMessage(self, message):
+        activeNeighbors = self.activeNeighbors
+        connectedNeighbors = self.connectedNeighbors
+        T, S, L = self.T, self.S, self.L
+        e = self.e
+        snapshot = self.snapshot
+        metrics = self.metrics
+        if metrics is not None:
+            start = time.perf_counter()
+
+        msgType, senderLocation, senderID, senderT, senderS, senderL = wire.decode(message)
+
+        # an announcement reaches the whole of the sender's region, us
+        # included (see multicast.py)
+        if msgType == 'Hello?' and (senderID == self.myID or not self.inRange(senderLocation)):
+            return
 
-        # print("listening on port " +str(self.myPort))
-        while True:
-            message, senderAddr = self.listenSocket.recvfrom(1024)
-
-            # print("received: " + message)
-            
-            msgSplit = message.split(',')
-            msgType = msgSplit[0]
-            senderLocation = int(msgSplit[1])
-            senderID = int(msgSplit[2])
-            senderT = [int(x) for x in msgSplit[3].split(':')]
-            tempSenderS = msgSplit[4].split('|')
-            senderS = []
-            for row in tempSenderS:
-                senderS.append([int(x) for x in row.split(':')])
-            senderL = [int(x) for x in msgSplit[5].split(':')]
+        with self.lock:
+            # handshakes and disconnects restart delta encoding for this peer
+            if msgType in ('Hello?', 'Hello', 'Goodbye', 'Exiting'):
+                self.peerEpoch[senderID] += 1
 
             # print(msgType, senderID, senderT)
 
             if msgType == 'Hello?':
-                # update activeNeighbors
-                # remove old location (if it exists)
-                for neighbor in activeNeighbors:
-                    if neighbor[2] == senderID:
-                        activeNeighbors.remove(neighbor)
-                # add new location to activeNeighbors
-                activeNeighbors.append([int(senderLocation / self.networkSize), senderLocation % self.networkSize, senderID, senderLocation])
+                # update activeNeighbors (moves the entry if it changed location)
+                activeNeighbors.update(senderID, senderLocation)
 
                 # 'On' from paper
                 # add to connected list if not already there
                 if senderID not in self.connectedNeighbors:
                     connectedNeighbors.append(senderID)
+                    if metrics is not None:
+                        metrics.linkUp()
 
                     # update T
                     T[self.myID] += 1
                     senderT[senderID] += 1
                     self.updateT(T, T, senderT)
                     # update S
-                    tempS = []
-                    for row in S:
-                        tempS.append(row)
+                    tempS = self.copyS()
                     tempS[self.myID][senderID] += 1
                     senderS[senderID][self.myID] += 1
                     self.updateS(S, tempS, senderS)
 
                     # record event in e
-                    tempT = []
-                    for x in T:
-                        tempT.append(x)
-                    e.append([tempT, self.myLocation])
+                    self.recordEvent()
                     # update L if S is consistent
-                    if self.isSymmetric(S):
-                        for i in range(self.numNodes):
-                            L[i] = T[i]
+                    self.advanceCut()
 
                 # respond with hello
                 self.send('Hello', senderLocation)
                 
             elif msgType == 'Hello':
-                # update activeNeighbors
-                # remove old location (if it exists)
-                for neighbor in activeNeighbors:
-                    if neighbor[2] == senderID:
-                        activeNeighbors.remove(neighbor)
-                # add new location to activeNeighbors
-                activeNeighbors.append([int(senderLocation / self.networkSize), senderLocation % self.networkSize, senderID, senderLocation])
+                # update activeNeighbors (moves the entry if it changed location)
+                activeNeighbors.update(senderID, senderLocation)
 
                 # 'On' from paper
                 # add to connected list if not already there
                 if senderID not in self.connectedNeighbors:
                     connectedNeighbors.append(senderID)
+                    if metrics is not None:
+                        metrics.linkUp()
                     # update T
                     T[self.myID] += 1
                     self.updateT(T, T, senderT)
                     # update S
-                    tempS = []
-                    for row in S:
-                        tempS.append(row)
+                    tempS = self.copyS()
                     tempS[self.myID][senderID] += 1
                     self.updateS(S, tempS, senderS)
 
                     # record event in e
-                    tempT = []
-                    for x in T:
-                        tempT.append(x)
-                    e.append([tempT, self.myLocation])
+                    self.recordEvent()
                     # update L if S is consistent
-                    if self.isSymmetric(S):
-                        for i in range(self.numNodes):
-                            L[i] = T[i]
+                    self.advanceCut()
+
+                # answer to our 'Hello?'
+                self.discovery.reply(senderID)
+                self.notifyProgress()
 
             # node moves away
             elif msgType == 'Goodbye':
                 # update activeNeighbors
-                # remove old location (if it exists)
-                for neighbor in activeNeighbors:
-                    if neighbor[2] == senderID:
-                        activeNeighbors.remove(neighbor)
-                
-                # 'Off' from paper
-                # remove from connected list
-                connectedNeighbors.remove(senderID)
-                # update T
-                T[self.myID] += 1
-                # update S
-                tempS = []
-                for row in S:
-                    tempS.append(row)
-                tempS[self.myID][senderID] += 1
-                self.updateS(S, tempS, tempS)
+                activeNeighbors.remove(senderID)
+                self.snapshotCache.pop(senderID, None)
+                # a datagram can arrive twice, the link only goes down once
+                if senderID in connectedNeighbors:
+                    # 'Off' from paper
+                    # remove from connected list
+                    connectedNeighbors.remove(senderID)
+                    if metrics is not None:
+                        metrics.linkDown()
+                    # update T
+                    T[self.myID] += 1
+                    # update S
+                    tempS = self.copyS()
+                    tempS[self.myID][senderID] += 1
+                    self.updateS(S, tempS, tempS)
+
+                    # record event in e
+                    self.recordEvent()
+                    # update L if S is consistent
+                    self.advanceCut()
 
-                # record event in e
-                tempT = []
-                for x in T:
-                    tempT.append(x)
-                e.append([tempT, self.myLocation])
-                # update L if S is consistent
-                if self.isSymmetric(S):
-                    for i in range(self.numNodes):
-                        L[i] = T[i]
-            
             # node exits network
             elif msgType == 'Exiting':
                 # update activeNeighbors
-                # remove old location (if it exists)
-                for neighbor in activeNeighbors:
-                    if neighbor[2] == senderID:
-                        activeNeighbors.remove(neighbor)
-                
-                # slightly different from 'Off' from paper
-                # updates topology matrix to still be symmetric
-                # remove from connected list
-                connectedNeighbors.remove(senderID)
-                # update T
-                T[self.myID] += 1
-                # update S
-                tempS = []
-                for row in S:
-                    tempS.append(row)
-                tempS[self.myID][senderID] += 1
-                tempS[senderID][self.myID] += 1
-                tempS[senderID][senderID] += 1
-                self.updateS(S, tempS, tempS)
+                activeNeighbors.remove(senderID)
+                self.snapshotCache.pop(senderID, None)
+                # a datagram can arrive twice, the link only goes down once
+                if senderID in connectedNeighbors:
+                    # slightly different from 'Off' from paper
+                    # updates topology matrix to still be symmetric
+                    # remove from connected list
+                    connectedNeighbors.remove(senderID)
+                    if metrics is not None:
+                        metrics.linkDown()
+                    # update T
+                    T[self.myID] += 1
+                    # update S
+                    tempS = self.copyS()
+                    tempS[self.myID][senderID] += 1
+                    tempS[senderID][self.myID] += 1
+                    tempS[senderID][senderID] += 1
+                    self.updateS(S, tempS, tempS)
 
-                # record event in e
-                tempT = []
-                for x in T:
-                    tempT.append(x)
-                e.append([tempT, self.myLocation])
-                # update L if S is consistent
-                if self.isSymmetric(S):
-                    for i in range(self.numNodes):
-                        L[i] = T[i]
+                    # record event in e
+                    self.recordEvent()
+                    # update L if S is consistent
+                    self.advanceCut()
 
             elif msgType == 'External':
                 # 'Receive from P' from paper
@@ -269,74 +628,101 @@ class Node():
                 T[self.myID] += 1
                 self.updateT(T, T, senderT)
                 # update S
-                tempS = []
-                for row in S:
-                    tempS.append(row)
+                tempS = self.copyS()
                 self.updateS(S, tempS, senderS)
 
                 
                 # record event in e
-                tempT = []
-                for x in T:
-                    tempT.append(x)
-                e.append([tempT, self.myLocation])
+                self.recordEvent()
                 # update L if S is consistent
-                if self.isSymmetric(S):
-                    for i in range(self.numNodes):
-                        L[i] = T[i]
-
-            elif msgType == 'Snapshot?':
-                for event in e:
-                    if event[0][self.myID] == senderL[self.myID]:
-                        self.send('Snapshot|'+str(event[1]), senderLocation)
-                        break
-            
+                self.advanceCut()
+
+            # 'Snapshot?|origin|sequence', or with '|id:id...' if only
+            # those nodes need to answer
+            elif msgType[:10] == 'Snapshot?|':
+                flood = self.relayFlood(msgType, senderID, senderLocation, senderL)
+                parts = msgType.split('|')
+                asked = len(parts) < 4 or str(self.myID) in parts[3].split(':')
+                if flood is not None and asked:
+                    event = e.find(senderL[self.myID])
+                    if event is not None:
+                        # answer towards the origin, through whoever asked us
+                        self.send('Snapshot|%d|%d|%d:%s' % (flood[0], flood[1], self.myID, event[1]), senderLocation)
+
+            # 'Snapshot|origin|sequence|id:location|id:location...'
             elif msgType[:9] == 'Snapshot|':
-                msgArr = msgType.split('|')
-                snapshot.append([senderID, msgArr[1]])
-
+                name, origin, seq, answers = msgType.split('|', 3)
+                origin, seq = int(origin), int(seq)
+                if origin == self.myID:
+                    # ignore answers to an older request
+                    if seq == self.floodSeq.value:
+                        for answer in answers.split('|'):
+                            id, location = answer.split(':')
+                            snapshot.append([int(id), location])
+                        self.notifyProgress()
+                else:
+                    # pass it on along the path the request came in on
+                    parent = self.floods.get((origin, seq))
+                    if parent is not None:
+                        self.send(msgType, parent)
+
+            if metrics is not None:
+                metrics.received(msgType, len(message), time.perf_counter() - start)
+
+    # the socket and listener stay as they are, only the directory changes
     def updateLocation(self, newLocation):
-        # update location and log move
-        self.myLocation = newLocation
-        self.myPort = self.basis + self.myLocation
-        self.row = int(self.myLocation / self.networkSize)
-        self.column = self.myLocation % self.networkSize
-        self.internalEvent() # logs the movement event
+        self.relocate(newLocation)
 
-        # stop listening from old location
-        self.listenP.terminate()
-        self.listenP.join()
+        # look at network again
+        self.discover()
 
-        # start listening at new location
-        self.listenSocket = socket(AF_INET, SOCK_DGRAM)
-        self.listenSocket.bind(('', self.myPort))
-        
-        # self.activeNeighbors = self.manager.list([])
+    # update location (here and in the directory) and log move
+    def relocate(self, newLocation):
+        self.directory.vacate(self.myLocation, self.myPort)
+        self.myLocation = newLocation
+        self.directory.register(self.myLocation, self.myPort)
+        self.internalEvent() # logs the movement event
 
-        self.listenP = multiprocessing.Process(target=self.listen, args=(self.activeNeighbors,self.connectedNeighbors, self.T, self.S, self.L, self.e, self.snapshot))
-        self.listenP.start()
+    # add an event with the current T and location to e
+    def recordEvent(self):
+        if self.e.append([self.T[:], self.myLocation]):
+            self.checkpoint()
 
-        # look at network again
-        self.neighbors = self.calculateNeighbors()
+    # save T, S and L to the journal, if there is one
+    # (nodes with sparse clocks never have one)
+    def checkpoint(self):
+        if self.sparse:
+            return
+        self.e.checkpoint(self.T[:], flatten(self.S), self.L[:])
 
-        
-        self.checkForNeighbors()
-        time.sleep(2)
-        self.updateNetworkImage()
+    # take T, S and L from the journal, if there is one
+    def restore(self):
+        state = self.e.recover()
+        if state is None:
+            return
+        self.T[:] = state['T']
+        if state['S'] is not None:
+            for i in range(self.numNodes):
+                self.S[i] = state['S'][i]
+        self.L[:] = state['L']
+
+    # L catches up with T whenever S is consistent, events from before the
+    # new cut may then be dropped from e
+    def advanceCut(self):
+        if self.isSymmetric(self.S):
+            self.L[:] = self.T[:]
+            self.e.prune(self.L[self.myID])
 
     # 'Internal event' from paper
     # simulate an internal event
     def internalEvent(self):
-        # update T
-        self.T[self.myID] += 1
-        # record event in e
-        tempT = []
-        for x in self.T:
-            tempT.append(x)
-        self.e.append([tempT, self.myLocation])
-        # update L if S is consistent
-        if self.isSymmetric(self.S):
-            self.L = self.T
+        with self.lock:
+            # update T
+            self.T[self.myID] += 1
+            # record event in e
+            self.recordEvent()
+            # update L if S is consistent
+            self.advanceCut()
 
     # 'Send to P' from paper
     # send to a given destination (by id) (external event)
@@ -345,35 +731,99 @@ class Node():
             print('Not connected to node ' + str(destination))
             return
         
-        # update T
-        self.T[self.myID] += 1
-        # record event in e
-        tempT = []
-        for x in self.T:
-            tempT.append(x)
-        self.e.append([tempT, self.myLocation])
-        # update L if S is consistent
-        if self.isSymmetric(self.S):
-            self.L = self.T
-
-        for neighbor in self.activeNeighbors:
-            if neighbor[2] == destination:
-                self.send('External', neighbor[3]) # neighbor location
-                break
+        with self.lock:
+            # update T
+            self.T[self.myID] += 1
+            # record event in e
+            self.recordEvent()
+            # update L if S is consistent
+            self.advanceCut()
+
+        neighbor = self.activeNeighbors.get(destination)
+        if neighbor is not None:
+            self.send('External', neighbor[3], destination) # neighbor location
 
     # ask everyone for their locate variable corresponding to L
-    # wait for their responses and print the results
-    def getSnapshot(self):
-        self.snapshot[:] = []
-        self.globalBroadcast('Snapshot?')
-        time.sleep(2)
-        for row in self.snapshot:
-            print(row)
+    # returns a Snapshot as soon as every node in it has answered, or
+    # with whatever arrived once timeout seconds have passed
+    def getSnapshot(self, timeout=2.0):
+        start = self.requestSnapshot()
+        self.waitFor(self.snapshotComplete, timeout)
+        return self.collectSnapshot(start)
+
+    # send out a snapshot request, returns when it was sent
+    # a node's answer for a cut time never changes, so nodes whose part of
+    # the cut is where it was for an earlier answer aren't asked again, and
+    # nodes at 0 have nothing to answer with (they are missing from the
+    # snapshot straight away). If that leaves nobody, no request goes out at
+    # all and the snapshot is complete as it is.
+    def requestSnapshot(self):
+        # holding the lock keeps answers to the previous request out
+        with self.lock:
+            self.snapshot[:] = []
+            # the cut the answers will refer to
+            self.snapshotCut = self.L[:]
+            # who the snapshot is of: all numNodes nodes, or if we don't
+            # know how many there are, the ones in the cut
+            if self.numNodes is None:
+                self.snapshotIDs = [id for id, time in nonzero(self.snapshotCut)]
+            else:
+                self.snapshotIDs = range(self.numNodes)
+            start = self.clock()
+            # our own answer
+            event = self.e.find(self.snapshotCut[self.myID])
+            if event is not None:
+                self.snapshot.append([self.myID, str(event[1])])
+            # id -> (cut time, location) of earlier answers
+            cache = self.snapshotCache.copy()
+            cached = []
+            asked = []
+            for id in self.snapshotIDs:
+                if id == self.myID or self.snapshotCut[id] == 0:
+                    continue
+                entry = cache.get(id)
+                if entry is not None and entry[0] == self.snapshotCut[id]:
+                    cached.append([id, entry[1]])
+                else:
+                    asked.append(id)
+            self.snapshot.extend(cached)
+            # the answers there will be, ours and cached ones included
+            self.snapshotAnswers = len(self.snapshot) + len(asked)
+            if not asked:
+                # answers still on their way to an earlier request don't count
+                self.floodSeq.value += 1
+            elif not cached:
+                self.globalBroadcast('Snapshot?')
+            else:
+                self.globalBroadcast('Snapshot?', ':'.join(map(str, asked)))
+        return start
+
+    # the result of the request sent at start, whose answers are kept for
+    # the next one
+    def collectSnapshot(self, start):
+        replies = self.snapshot[:]
+        self.snapshotCache.update({id: (self.snapshotCut[id], location) for id, location in replies if id != self.myID})
+        return Snapshot(self.snapshotCut, replies, self.snapshotIDs, self.clock() - start)
+
+    def snapshotComplete(self):
+        return len(self.snapshot) >= self.snapshotAnswers
 
     # compare 2 vectors and update the first with the most recent values
     # arr0 = vector to store result
     # arr1 and arr2 = vectors to compare
     def updateT(self, arr0, arr1, arr2):
+        if self.sparse:
+            # arr0 starts out no larger than arr1 and clocks only grow, so
+            # it only has to be raised where the others have entries
+            for arr in (arr1, arr2):
+                if arr is not arr0:
+                    for i, value in list(nonzero(arr)):
+                        if value > arr0[i]:
+                            arr0[i] = value
+            return
+        if self.vectorized:
+            kernels.maximum(arr0, arr1, arr2, self.numNodes)
+            return
         for i in range(self.numNodes):
             arr0[i] = max(arr1[i], arr2[i])
 
@@ -381,40 +831,77 @@ class Node():
     # matrix0 = matrix to store result
     # matrix1 and matrix2 = matrices to compare
     def updateS(self, matrix0, matrix1, matrix2):
+        if self.sparse:
+            # as in updateT, matrix0 is S and matrix1 a changed copy of it
+            for matrix in (matrix1, matrix2):
+                if matrix is not matrix0:
+                    for (i, j), value in nonzeroCells(matrix):
+                        if value > matrix0.get(i, j):
+                            matrix0.setCell(i, j, value)
+            return
+        if self.vectorized:
+            kernels.maximumMatrix(matrix0, matrix1, matrix2, self.numNodes)
+            return
         for i in range(self.numNodes):
             for j in range(self.numNodes):
                 matrix1[i][j] = max(matrix1[i][j], matrix2[i][j])
             matrix0[i] = matrix1[i]
 
+    # a copy of S to change before merging it back in with updateS
+    def copyS(self):
+        if self.sparse:
+            return self.S.copy()
+        if self.vectorized:
+            return kernels.copyMatrix(self.S, self.numNodes)
+        tempS = []
+        for row in self.S:
+            tempS.append(list(row))
+        return tempS
+
     # converts a matrix to a string for sending purposes
     def matrixToStr(self, matrix):
-        result = ""
-        for row in matrix:
-            result += ':'.join(map(str, row)) + '|'
-        return result[:-1]
+        return wire.matrixToStr(matrix)
 
     # checks if a 2D array is symmetric
+    # Matrix and SparseMatrix keep a running count of asymmetric pairs,
+    # anything else (the Manager backend, plain lists) is scanned, with
+    # NumPy if it is there
     def isSymmetric(self, matrix):
-        for i in range(self.numNodes):
-            for j in range(self.numNodes):
-                if (matrix[i][j] != matrix[j][i]):
-                    return False
-        return True
+        if isinstance(matrix, (Matrix, SparseMatrix)):
+            return matrix.isSymmetric()
+        size = len(matrix)
+        if kernels.available() and size >= kernels.SCAN_SIZE:
+            return kernels.isSymmetric(matrix, size)
+        return scanSymmetric(matrix)
 
     def isActive(self):
         return self.active
 
+    # metrics report (see metrics.py) plus the current size of the event
+    # log and neighbor table, None if the node was made without metrics
+    def stats(self):
+        if self.metrics is None:
+            return None
+        report = self.metrics.report()
+        report['events'] = len(self.e)
+        report['activeNeighbors'] = len(self.activeNeighbors)
+        report['connectedNeighbors'] = len(self.connectedNeighbors)
+        return report
+
+    # append stats() as a JSON line to path every interval seconds until
+    # the node exits
+    def dumpStats(self, path, interval=1.0):
+        self.statsDump = MetricsDump(self.stats, path, interval)
+
     # print different values
-    # prints the network image from the node's perspective
-    def printNetwork(self):
+    # prints the network image from the node's perspective, the cells up
+    # to radius away from us, or the whole grid with radius=None
+    def printNetwork(self, radius=RADIUS):
         # make sure the network image is up to date
         self.updateNetworkImage()
         # print the network in a readable format
-        for row in self.networkImage:
-            result = '|'
-            for x in row:
-                result += x
-            print(result+'|')
+        for row in self.networkImage.rows(radius):
+            print(row)
 
     def printT(self):
         print('T:\n'+ str(self.T))
@@ -433,108 +920,474 @@ class Node():
             print(event)
 
     def moveUp(self):
-        # self.internalEvent()
-
-        if self.row == 0:
-            # Exits network
-            self.exit()
-        else:
-            # let people know you're moving too far away
-            for neighbor in self.activeNeighbors:
-                if neighbor[0] == self.row+2:
-                    self.send('Goodbye', neighbor[3]) # neighbor location
-                    # update arrays
-                    self.activeNeighbors.remove(neighbor)
-                    self.connectedNeighbors.remove(neighbor[2])
-                    # update T
-                    self.T[self.myID] += 1
-                    # update S
-                    tempS = []
-                    for row in self.S:
-                        tempS.append(row)
-                    tempS[self.myID][neighbor[2]] += 1
-                    self.updateS(self.S, tempS, tempS)
-            # move for real
-            self.updateLocation(self.myLocation - self.networkSize)
+        return self.move(-1, 0)
 
     def moveDown(self):
-        # self.internalEvent()
-
-        if self.row+1 == self.networkSize:
-            # Exits network
-            self.exit()
-        else:
-            # let people know you're moving too far away
-            for neighbor in self.activeNeighbors:
-                if neighbor[0] == self.row-2:
-                    self.send('Goodbye', neighbor[3]) # neighbor location
-                    # update arrays
-                    self.activeNeighbors.remove(neighbor)
-                    self.connectedNeighbors.remove(neighbor[2])
-                    # update T
-                    self.T[self.myID] += 1
-                    # update S
-                    tempS = []
-                    for row in self.S:
-                        tempS.append(row)
-                    tempS[self.myID][neighbor[2]] += 1
-                    self.updateS(self.S, tempS, tempS)
-
-            # move for real
-            self.updateLocation(self.myLocation + self.networkSize)
+        return self.move(1, 0)
 
     def moveLeft(self):
-        # self.internalEvent()
-
-        if self.column == 0:
-            # Exits network
-            self.exit()
-        else:
-            # let people know you're moving too far away
-            for neighbor in self.activeNeighbors:
-                if neighbor[1] == self.column+2:
-                    self.send('Goodbye', neighbor[3]) # neighbor location
-                    # update arrays
-                    self.activeNeighbors.remove(neighbor)
-                    self.connectedNeighbors.remove(neighbor[2])
-                    # update T
-                    self.T[self.myID] += 1
-                    # update S
-                    tempS = []
-                    for row in self.S:
-                        tempS.append(row)
-                    tempS[self.myID][neighbor[2]] += 1
-                    self.updateS(self.S, tempS, tempS)
-            # move for real
-            self.updateLocation(self.myLocation - 1)
+        return self.move(0, -1)
 
     def moveRight(self):
-        # self.internalEvent()
-
-        if self.column+1 == self.networkSize:
-            # Exits network
-            self.exit()
-        else:
-            # let people know you're moving too far away
-            for neighbor in self.activeNeighbors:
-                if neighbor[1] == self.column-2:
-                    self.send('Goodbye', neighbor[3]) # neighbor location
-                    # update arrays
-                    self.activeNeighbors.remove(neighbor)
-                    self.connectedNeighbors.remove(neighbor[2])
-                    # update T
-                    self.T[self.myID] += 1
-                    # update S
-                    tempS = []
-                    for row in self.S:
-                        tempS.append(row)
-                    tempS[self.myID][neighbor[2]] += 1
-                    self.updateS(self.S, tempS, tempS)
+        return self.move(0, 1)
+
+    # move one cell, leaving the network if that steps off the grid
+    # everything the move sends before it waits for replies is batched
+    def move(self, dRow, dColumn):
+        with self.outbox.batch():
+            newLocation = self.prepareMove(dRow, dColumn)
+            if newLocation is None:
+                # Exits network
+                return self.exit()
             # move for real
-            self.updateLocation(self.myLocation + 1)
+            return self.updateLocation(newLocation)
+
+    # say goodbye to the neighbors a one cell move takes us out of range of
+    # returns the new location, or None if the move leaves the grid
+    def prepareMove(self, dRow, dColumn):
+        newRow = self.row + dRow
+        newColumn = self.column + dColumn
+        if newRow < 0 or newColumn < 0 or newRow >= self.networkSize or newColumn >= self.networkSize:
+            return None
+
+        # let people know you're moving too far away
+        # (anyone two cells behind us in the direction of the move)
+        if dRow != 0:
+            departing = self.activeNeighbors.inRow(self.row - 2*dRow)
+        else:
+            departing = self.activeNeighbors.inColumn(self.column - 2*dColumn)
+        self.leave(departing)
+        return newRow * self.networkSize + newColumn
+
+    # 'Off' from paper for every neighbor in departing (activeNeighbors
+    # entries), with one Goodbye encoded for all of them
+    def leave(self, departing):
+        if not departing:
+            return
+        # the same message for everyone, encoded once
+        self.sendAll('Goodbye', [neighbor[3] for neighbor in departing]) # neighbor locations
+        for neighbor in departing:
+            # update arrays
+            self.activeNeighbors.remove(neighbor[2])
+            self.connectedNeighbors.remove(neighbor[2])
+            self.lastSent.pop(neighbor[2], None)
+            if self.metrics is not None:
+                with self.lock:
+                    self.metrics.linkDown()
+        with self.lock:
+            # update T, one event per neighbor
+            self.T[self.myID] += len(departing)
+            # update S, all in one merge
+            tempS = self.copyS()
+            for neighbor in departing:
+                tempS[self.myID][neighbor[2]] += 1
+            self.updateS(self.S, tempS, tempS)
+
+    # move to location one cell at a time, along our row first and then
+    # the column, with a single discovery at the end (see movePath)
+    def moveTo(self, location):
+        return self.movePath(self.pathTo(location))
+
+    # move through path, a list of cells each one step up, down, left or
+    # right of the one before. Every cell is logged as a move event, as the
+    # one cell moves would, but only the neighbors out of range of the last
+    # cell get a Goodbye, and discovery runs once, there.
+    def movePath(self, path):
+        with self.outbox.batch():
+            if self.preparePath(path):
+                self.discover()
+
+    # check path, say goodbye and log the moves
+    # returns False if path is empty
+    def preparePath(self, path):
+        previous = self.myLocation
+        for cell in path:
+            if cell < 0 or cell >= self.networkSize * self.networkSize:
+                raise ValueError('cell %d is not in the grid' % cell)
+            dRow = abs(cell // self.networkSize - previous // self.networkSize)
+            dColumn = abs(cell % self.networkSize - previous % self.networkSize)
+            if dRow + dColumn != 1:
+                raise ValueError('cell %d is not next to cell %d' % (cell, previous))
+            previous = cell
+        if not path:
+            return False
+
+        # everyone who won't be in range of where we end up
+        row = path[-1] // self.networkSize
+        column = path[-1] % self.networkSize
+        self.leave([neighbor for neighbor in self.activeNeighbors.entries()
+                    if abs(neighbor[0] - row) > 2 or abs(neighbor[1] - column) > 2])
+
+        # only the last cell goes into the directory, cells on the way
+        # may be someone else's
+        self.directory.vacate(self.myLocation, self.myPort)
+        for cell in path:
+            self.myLocation = cell
+            self.internalEvent() # logs the movement event
+        self.directory.register(self.myLocation, self.myPort)
+        return True
+
+    # cells from here to location, along our row first and then the column
+    def pathTo(self, location):
+        row, column = self.row, self.column
+        path = []
+        while column != location % self.networkSize:
+            column += 1 if location % self.networkSize > column else -1
+            path.append(row * self.networkSize + column)
+        while row != location // self.networkSize:
+            row += 1 if location // self.networkSize > row else -1
+            path.append(row * self.networkSize + column)
+        return path
 
     def exit(self):
         self.broadcast('Exiting')
+        # nothing can go out once the transport is closed
+        self.outbox.flush()
+        self.stopListening()
+        if self.groups is not None:
+            self.groups.close()
+        self.directory.vacate(self.myLocation, self.myPort)
+        self.directory.close()
+        if self.statsDump is not None:
+            self.statsDump.stop()
+        with self.lock:
+            self.checkpoint()
+            self.e.close()
+        self.active = False
+
+# the default transport: a UDP socket, and a listener process that hands
+# every datagram it receives to receive(datagram, address)
+class UDPTransport():
+
+    def __init__(self):
+        self.sendSocket = socket(AF_INET, SOCK_DGRAM)
+        # more sockets the listener reads from (listenTo)
+        self.sockets = []
+
+    # have the listener hand over what arrives on sock as well, call
+    # before open()
+    def listenTo(self, sock):
+        self.sockets.append(sock)
+
+    # bind and start listening, returns the port we got
+    # (the one asked for if it is free, otherwise any free one)
+    def open(self, port, receive):
+        self.listenSocket = socket(AF_INET, SOCK_DGRAM)
+        try:
+            self.listenSocket.bind(('', port))
+        except OSError:
+            self.listenSocket.bind(('', 0))
+            port = self.listenSocket.getsockname()[1]
+
+        self.listenP = multiprocessing.Process(target=self.listen, args=(receive,))
+        self.listenP.start()
+        return port
+
+    # always listening function
+    def listen(self, receive):
+        sockets = [self.listenSocket] + self.sockets
+        ready = sockets
+        while True:
+            if len(sockets) > 1:
+                ready, writable, failed = select.select(sockets, [], [])
+            for sock in ready:
+                datagram, senderAddr = sock.recvfrom(wire.RECEIVE_SIZE)
+                receive(datagram, senderAddr)
+
+    def sendto(self, data, address):
+        self.sendSocket.sendto(data, address)
+
+    def close(self):
         self.listenP.terminate()
         self.listenP.join()
-        self.active = False
\ No newline at end of file
+        self.listenSocket.close()
+
+# UDPTransport with the reliability layer (see reliable.py) under it
+#
+# The layer's windows and timers, and the acks, belong to the listener
+# process, which owns the socket the acks come back to. The main process
+# hands what it sends to the listener through a pipe, replies the listener
+# sends itself go straight in. Best effort datagrams go out of the send
+# socket around the layer, as `inner`.
+class ReliableUDPTransport(UDPTransport):
+
+    def __init__(self, window=WINDOW):
+        UDPTransport.__init__(self)
+        self.inner = self.sendSocket
+        self.window = window
+        # the layer, only ever set in the listener process
+        self.layer = None
+        self.outgoing, self.pipe = multiprocessing.Pipe(duplex=False)
+
+    def listen(self, receive):
+        timers = Timers(time.monotonic)
+        self.layer = ReliableTransport(window=self.window, clock=time.monotonic, schedule=timers.schedule)
+        self.layer.attach(self.listenSocket, receive)
+        sockets = [self.listenSocket, self.outgoing] + self.sockets
+        while True:
+            ready, writable, failed = select.select(sockets, [], [], timers.wait())
+            for sock in ready:
+                if sock is self.outgoing:
+                    data, address = sock.recv()
+                    self.layer.sendto(data, address)
+                else:
+                    datagram, senderAddr = sock.recvfrom(wire.RECEIVE_SIZE)
+                    self.datagramReceived(datagram, senderAddr)
+            timers.run()
+
+    # everything that arrives goes through the layer, which passes on what
+    # isn't framed (best effort datagrams, announcements) as it is
+    def datagramReceived(self, datagram, address):
+        self.layer.datagramReceived(datagram, address)
+
+    def sendto(self, data, address):
+        if self.layer is None:
+            self.pipe.send((data, address))
+        else:
+            self.layer.sendto(data, address)
+
+# result of Node.getSnapshot()
+class Snapshot():
+
+    # cut: the L the request was sent with
+    # replies: [id, location] pairs as received
+    # expected: ids of the nodes the snapshot is of
+    def __init__(self, cut, replies, expected, elapsed):
+        self.cut = cut
+        # node id -> [location, cut time]
+        self.nodes = {}
+        for reply in replies:
+            id = reply[0]
+            self.nodes[id] = [int(reply[1]), cut[id]]
+        # ids of the nodes that did not answer in time, or weren't asked as
+        # the cut has nothing of them yet
+        self.missing = []
+        for id in expected:
+            if id not in self.nodes:
+                self.missing.append(id)
+        # seconds it took
+        self.elapsed = elapsed
+
+    def isComplete(self):
+        return len(self.missing) == 0
+
+    def __repr__(self):
+        lines = []
+        for id in sorted(self.nodes):
+            lines.append('node ' + str(id) + ': location ' + str(self.nodes[id][0]) + ', cut time ' + str(self.nodes[id][1]))
+        if self.missing:
+            lines.append('missing: ' + ', '.join(map(str, self.missing)))
+        return '\n'.join(lines)
+
+# A node that keeps all its state in plain objects in this process, for
+# transports that deliver in this process too. Waiting for replies runs
+# the transport, so any number of LocalNodes can share one LoopbackNetwork
+# (see loopback.py) and simulate a large grid deterministically in virtual
+# time:
+#
+#   network = LoopbackNetwork(latency=0.001, loss=0.01, seed=1)
+#   nodes = [LocalNode(10, i, 'sim', 0, 100, i, network.transport()) for i in range(100)]
+#   nodes[0].getSnapshot()
+class LocalNode(Node):
+
+    def __init__(self, networkSize, location, name, basis, numNodes, id, transport, wireFormat='binary',
+                 discoveryQuiet=LOOPBACK_QUIET, discoveryTimeout=2.0, wait=True, eventRetention=None,
+                 journal=None, checkpointInterval=100, metrics=False, sparse=False, vectorized=None):
+        self.setup(networkSize, location, name, basis, numNodes, id, wireFormat,
+                   transport.directory(networkSize, basis),
+                   discoveryQuiet, discoveryTimeout, eventRetention, journal, checkpointInterval, metrics, sparse,
+                   vectorized)
+        self.transport = transport
+
+        self.startListening()
+        self.discover(wait)
+
+    # state in plain objects, shared with AsyncNode
+    # sparse=True keeps T, S and L in SparseVector/SparseMatrix, which grow
+    # as new ids show up, so numNodes may then be None (unknown)
+    def setup(self, networkSize, location, name, basis, numNodes, id, wireFormat, directory,
+              discoveryQuiet, discoveryTimeout, eventRetention, journal, checkpointInterval, metrics, sparse,
+              vectorized):
+        if sparse and journal is not None:
+            raise ValueError('a journal needs a fixed numNodes, sparse clocks grow')
+        self.configure(networkSize, location, name, basis, numNodes, id, wireFormat, directory)
+        self.sparse = sparse
+        self.metrics = Metrics() if metrics else None
+
+        # everything runs in one thread, this only matters if other
+        # threads touch the node
+        self.lock = threading.RLock()
+        self.progress = threading.Condition(self.lock)
+        self.discovery = Discovery(self.numNodes, discoveryQuiet, discoveryTimeout, clock=self.clock)
+        self.floodSeq = ctypes.c_longlong(int(time.time() * 1000))
+        if sparse:
+            self.T = SparseVector(id + 1)
+            self.S = SparseMatrix(id + 1)
+            self.S[self.myID][self.myID] = 1
+            self.L = SparseVector(id + 1)
+            self.peerEpoch = SparseVector()
+        else:
+            self.T = Vector(self.numNodes)
+            self.S = Matrix(self.numNodes, self.initialS())
+            self.L = Vector(self.numNodes)
+            self.peerEpoch = Vector(self.numNodes)
+            self.vectorized = kernels.enabled(vectorized, self.numNodes)
+        self.e = EventLog(self.myID, eventRetention, journal, self.numNodes, checkpointInterval)
+        self.restore()
+        self.snapshot = []
+        self.snapshotCache = {}
+        self.activeNeighbors = NeighborTable(self.networkSize)
+        self.connectedNeighbors = []
+
+    def clock(self):
+        return self.transport.clock()
+
+    # runs the network until something arrives or timeout has passed
+    def pause(self, timeout):
+        self.transport.wait(timeout)
+
+# lets an AsyncNode receive datagrams from its asyncio endpoint
+# (receive is the node's, or its ReliableTransport's)
+class NodeProtocol(asyncio.DatagramProtocol):
+
+    def __init__(self, receive):
+        self.receive = receive
+
+    def datagram_received(self, data, addr):
+        self.receive(data, addr)
+
+    def error_received(self, exc):
+        # e.g. ICMP errors for empty cells, UDP gives no guarantees anyway
+        pass
+
+# Node runtime without any extra processes. Each node is an asyncio
+# datagram endpoint, so any number of nodes can share one event loop and
+# one process, and T, S, L and the neighbor lists are plain objects.
+# Methods that wait on the network (start, waitForDiscovery,
+# updateLocation, the moves, getSnapshot) are coroutines, everything else
+# works exactly as in Node.
+#
+#   node = AsyncNode(networkSize, location, name, basis, numNodes, id)
+#   await node.start()
+#   await node.moveUp()
+class AsyncNode(LocalNode):
+
+    def __init__(self, networkSize, location, name, basis, numNodes, id, wireFormat='binary',
+                 discoveryQuiet=QUIET, discoveryTimeout=2.0, eventRetention=None,
+                 journal=None, checkpointInterval=100, directoryPath=None, metrics=False, sparse=False,
+                 vectorized=None, reliable=False, multicast=False):
+        self.setup(networkSize, location, name, basis, numNodes, id, wireFormat,
+                   Directory(networkSize, basis, directoryPath),
+                   discoveryQuiet, discoveryTimeout, eventRetention, journal, checkpointInterval, metrics, sparse,
+                   vectorized)
+        # set whenever a reply someone may be waiting for has been recorded
+        self.wakeup = asyncio.Event()
+        # the datagram endpoint, once start() has created it
+        self.transport = None
+        # acknowledge and retransmit what we send to other nodes (see
+        # reliable.py), every node of the grid has to do the same
+        self.reliable = reliable
+        # announce ourselves to multicast groups (see multicast.py)
+        self.multicast = multicast
+
+    # join the network: bind, then look for neighbors
+    # with wait=False, await waitForDiscovery() to know when that is done
+    async def start(self, wait=True):
+        # resolve the host once instead of on every send
+        loop = asyncio.get_running_loop()
+        addresses = await loop.getaddrinfo(self.myName, None, family=AF_INET, type=SOCK_DGRAM)
+        self.myName = addresses[0][4][0]
+
+        await self.startListening()
+        await self.discover(wait)
+        return self
+
+    async def startListening(self):
+        self.reassembler = wire.Reassembler()
+        loop = asyncio.get_running_loop()
+        receive = self.receive
+        if self.reliable:
+            reliable = ReliableTransport(clock=self.clock, schedule=loop.call_later)
+            receive = reliable.datagramReceived
+        try:
+            transport, protocol = await loop.create_datagram_endpoint(lambda: NodeProtocol(receive), local_addr=('0.0.0.0', self.myPort))
+        except OSError:
+            transport, protocol = await loop.create_datagram_endpoint(lambda: NodeProtocol(receive), local_addr=('0.0.0.0', 0))
+            self.myPort = transport.get_extra_info('sockname')[1]
+        self.directory.register(self.myLocation, self.myPort)
+        # the endpoint's transport has the same sendto() and close() as ours
+        if self.reliable:
+            reliable.attach(transport, self.receive)
+            transport = reliable
+        self.transport = transport
+        if self.multicast:
+            self.groups = Multicast.open(self.networkSize, groupPort(self.basis))
+            if self.groups is not None:
+                endpoint, protocol = await loop.create_datagram_endpoint(lambda: NodeProtocol(receive), sock=self.groups.socket)
+                self.groups.attach(endpoint)
+
+    def stopListening(self):
+        self.transport.close()
+
+    async def discover(self, wait=True):
+        self.neighbors = self.calculateNeighbors()
+        self.checkForNeighbors()
+        if wait:
+            await self.waitForDiscovery()
+
+    async def waitForDiscovery(self):
+        with self.outbox.unbatched():
+            remaining = self.discovery.remaining()
+            while remaining > 0:
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+                remaining = self.discovery.remaining()
+        self.updateNetworkImage()
+
+    async def waitFor(self, done, timeout):
+        deadline = self.clock() + timeout
+        with self.outbox.unbatched():
+            while not done():
+                remaining = deadline - self.clock()
+                if remaining <= 0:
+                    return False
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+        return True
+
+    def clock(self):
+        return time.monotonic()
+
+    def notifyProgress(self):
+        self.wakeup.set()
+
+    async def updateLocation(self, newLocation):
+        self.relocate(newLocation)
+        await self.discover()
+
+    async def move(self, dRow, dColumn):
+        with self.outbox.batch():
+            newLocation = self.prepareMove(dRow, dColumn)
+            if newLocation is None:
+                self.exit()
+            else:
+                await self.updateLocation(newLocation)
+
+    async def moveTo(self, location):
+        await self.movePath(self.pathTo(location))
+
+    async def movePath(self, path):
+        with self.outbox.batch():
+            if self.preparePath(path):
+                await self.discover()
+
+    async def getSnapshot(self, timeout=2.0):
+        start = self.requestSnapshot()
+        await self.waitFor(self.snapshotComplete, timeout)
+        return self.collectSnapshot(start)
@@ -0,0 +1,165 @@
+import heapq
+import random
+import errno
+from directory import MemoryDirectory
+
+# An in-memory network for running many nodes in one process.
+#
+# Datagrams are not sent anywhere, they go into a queue ordered by the
+# (virtual) time they are due to arrive. Nothing happens until someone
+# runs the network: step() jumps the clock to the next datagram and hands
+# it to the receive() of whoever has that port open, which may send more.
+# Nodes waiting for replies (LocalNode) run the network themselves.
+#
+# Every datagram takes `latency` seconds plus a random extra delay of up
+# to `jitter` seconds, so with jitter > 0 datagrams sent close together
+# can overtake each other. Each one is lost with probability `loss`.
+# All randomness comes from one generator seeded with `seed`, and equal
+# arrival times are broken by send order, so the same scenario always
+# plays out the same way.
+#
+# schedule() puts a callback in the same queue, for timers (reliable.py)
+# that have to run in the same virtual time as everything else.
+
+# first port handed out to open(0)
+EPHEMERAL_PORT = 49152
+
+class LoopbackNetwork():
+
+    def __init__(self, latency=0.001, jitter=0.0, loss=0.0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.random = random.Random(seed)
+        self.now = 0.0
+        # (arrival time, send order, port, data, source port), port is None
+        # for a Timer
+        self.queue = []
+        self.order = 0
+        # port -> receive(datagram, address)
+        self.endpoints = {}
+        self.nextPort = EPHEMERAL_PORT
+        # (networkSize, basis) -> the directory of that grid
+        self.directories = {}
+        self.sent = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    # a transport for one node on this network
+    def transport(self):
+        return LoopbackTransport(self)
+
+    def clock(self):
+        return self.now
+
+    # the cell -> port directory every node of a grid on this network shares
+    def directory(self, networkSize, basis):
+        key = (networkSize, basis)
+        if key not in self.directories:
+            self.directories[key] = MemoryDirectory(networkSize, basis)
+        return self.directories[key]
+
+    # start delivering datagrams for port to receive, port 0 picks a free one
+    # returns the port
+    def bind(self, port, receive):
+        if port == 0:
+            while self.nextPort in self.endpoints:
+                self.nextPort += 1
+            port = self.nextPort
+        elif port in self.endpoints:
+            raise OSError(errno.EADDRINUSE, 'port %d is in use' % port)
+        self.endpoints[port] = receive
+        return port
+
+    def unbind(self, port):
+        self.endpoints.pop(port, None)
+
+    def post(self, data, sourcePort, port):
+        self.sent += 1
+        if self.loss and self.random.random() < self.loss:
+            self.dropped += 1
+            return
+        delay = self.latency
+        if self.jitter:
+            delay += self.random.uniform(0, self.jitter)
+        heapq.heappush(self.queue, (self.now + delay, self.order, port, data, sourcePort))
+        self.order += 1
+
+    # call callback() delay seconds from now, unless the Timer returned is
+    # cancelled first
+    def schedule(self, delay, callback):
+        timer = Timer(callback)
+        heapq.heappush(self.queue, (self.now + delay, self.order, None, timer, None))
+        self.order += 1
+        return timer
+
+    # deliver the next datagram (or run the next timer) if it is due by
+    # `until` (any time if None), returns False if there was none
+    def step(self, until=None):
+        if not self.queue or (until is not None and self.queue[0][0] > until):
+            return False
+        arrival, order, port, data, sourcePort = heapq.heappop(self.queue)
+        if port is None:
+            # cancelled timers don't move the clock
+            if data.callback is not None:
+                self.now = max(self.now, arrival)
+                data.callback()
+            return True
+        self.now = max(self.now, arrival)
+        receive = self.endpoints.get(port)
+        if receive is None:
+            # nobody listening, as with UDP the datagram is just gone
+            self.dropped += 1
+        else:
+            self.delivered += 1
+            receive(data, ('loopback', sourcePort))
+        return True
+
+    # deliver datagrams until there are none left, the clock passes until,
+    # or done() returns True
+    def run(self, until=None, done=None):
+        while done is None or not done():
+            if not self.step(until):
+                break
+        if until is not None and self.now < until and (done is None or not done()):
+            self.now = until
+
+class Timer():
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def cancel(self):
+        self.callback = None
+
+# one node's endpoint, the same interface as UDPTransport in lib.py
+class LoopbackTransport():
+
+    def __init__(self, network):
+        self.network = network
+        self.port = None
+
+    def open(self, port, receive):
+        self.port = self.network.bind(port, receive)
+        return self.port
+
+    def sendto(self, data, address):
+        self.network.post(data, self.port, address[1])
+
+    def close(self):
+        self.network.unbind(self.port)
+
+    def clock(self):
+        return self.network.now
+
+    def directory(self, networkSize, basis):
+        return self.network.directory(networkSize, basis)
+
+    def schedule(self, delay, callback):
+        return self.network.schedule(delay, callback)
+
+    # let up to timeout seconds pass, returning early after a delivery so
+    # the caller can check whether what it waits for has happened
+    def wait(self, timeout):
+        if not self.network.step(self.network.now + timeout):
+            self.network.now += timeout
@@ -0,0 +1,163 @@
+import json
+import time
+import threading
+import multiprocessing
+import wire
+
+# Counters for what a node is doing.
+#
+# Per message type (the types in wire.TYPES, anything else counts as '')
+# it keeps the number and total size of the messages sent and received,
+# and a histogram of how long handleMessage took for them. Bucket 0 holds
+# times under 1us, bucket k times from 2^(k-1) up to 2^k microseconds.
+# It also counts messages that could not be parsed and links to
+# neighbors going up and down.
+#
+# Everything is in flat arrays, with shared=True in shared memory so the
+# listener process and the main process count into the same place. Adding
+# to them isn't atomic, so nodes only count while they hold their lock,
+# or updates from the two processes would get lost. A node
+# without metrics has None instead of a Metrics, and every call site
+# checks for that first, so turning them off costs one comparison.
+
+BUCKETS = 24
+
+# positions in the counts array, per message type
+SENT = 0
+SENT_BYTES = 1
+RECEIVED = 2
+RECEIVED_BYTES = 3
+
+# positions in the other counters array
+PARSE_FAILURES = 0
+LINKS_UP = 1
+LINKS_DOWN = 2
+
+def typeCode(msgType):
+    name, sep, arg = msgType.partition('|')
+    return wire.TYPE_CODES.get(name + sep, 0)
+
+# bucket for a handler time in seconds
+def bucket(seconds):
+    return min(int(seconds * 1e6).bit_length(), BUCKETS - 1)
+
+# upper end of a bucket in microseconds
+def bucketLimit(index):
+    return 1 << index
+
+class Metrics():
+
+    def __init__(self, shared=False):
+        types = len(wire.TYPES)
+        if shared:
+            self.counts = multiprocessing.RawArray('q', 4 * types)
+            self.histogram = multiprocessing.RawArray('q', BUCKETS * types)
+            self.handlerTime = multiprocessing.RawArray('d', types)
+            self.other = multiprocessing.RawArray('q', 3)
+        else:
+            self.counts = [0]*(4 * types)
+            self.histogram = [0]*(BUCKETS * types)
+            self.handlerTime = [0.0]*types
+            self.other = [0]*3
+
+    def sent(self, msgType, size):
+        offset = 4 * typeCode(msgType)
+        self.counts[offset + SENT] += 1
+        self.counts[offset + SENT_BYTES] += size
+
+    # a message was received and handled in `seconds`
+    def received(self, msgType, size, seconds):
+        code = typeCode(msgType)
+        offset = 4 * code
+        self.counts[offset + RECEIVED] += 1
+        self.counts[offset + RECEIVED_BYTES] += size
+        self.histogram[BUCKETS * code + bucket(seconds)] += 1
+        self.handlerTime[code] += seconds
+
+    def parseFailure(self):
+        self.other[PARSE_FAILURES] += 1
+
+    def linkUp(self):
+        self.other[LINKS_UP] += 1
+
+    def linkDown(self):
+        self.other[LINKS_DOWN] += 1
+
+    # everything as plain dicts and lists, message types by name
+    def report(self):
+        counts = self.counts[:]
+        histogram = self.histogram[:]
+        handlerTime = self.handlerTime[:]
+        types = {}
+        for code, name in enumerate(wire.TYPES):
+            offset = 4 * code
+            if not any(counts[offset:offset + 4]):
+                continue
+            buckets = histogram[BUCKETS * code:BUCKETS * (code + 1)]
+            received = counts[offset + RECEIVED]
+            types[name.rstrip('|') or 'other'] = {
+                'sent': counts[offset + SENT],
+                'sentBytes': counts[offset + SENT_BYTES],
+                'received': received,
+                'receivedBytes': counts[offset + RECEIVED_BYTES],
+                'handlerMeanUs': handlerTime[code] / received * 1e6 if received else 0.0,
+                'handlerP50Us': percentile(buckets, 0.5),
+                'handlerP99Us': percentile(buckets, 0.99),
+                'histogram': buckets,
+            }
+        return {
+            'types': types,
+            'parseFailures': self.other[PARSE_FAILURES],
+            'linksUp': self.other[LINKS_UP],
+            'linksDown': self.other[LINKS_DOWN],
+        }
+
+# upper end (in us) of the bucket the given fraction of samples falls in
+def percentile(buckets, fraction):
+    total = sum(buckets)
+    if total == 0:
+        return 0
+    seen = 0
+    for index, count in enumerate(buckets):
+        seen += count
+        if seen >= fraction * total:
+            return bucketLimit(index)
+    return bucketLimit(BUCKETS - 1)
+
+# a report as a table, for the node.py 'stats' command
+def formatReport(report):
+    lines = ['type        sent    bytes  received    bytes  mean(us)  p50(us)  p99(us)']
+    for name, row in sorted(report['types'].items()):
+        lines.append('%-9s %6d %8d %9d %8d %9.1f %8d %8d' % (name, row['sent'], row['sentBytes'],
+                     row['received'], row['receivedBytes'], row['handlerMeanUs'],
+                     row['handlerP50Us'], row['handlerP99Us']))
+    for key in sorted(report):
+        if key != 'types':
+            lines.append('%s: %s' % (key, report[key]))
+    return '\n'.join(lines)
+
+# appends report() as a JSON line to path every interval seconds, until
+# stop() is called
+class MetricsDump():
+
+    def __init__(self, report, path, interval):
+        self.report = report
+        self.path = path
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.write()
+
+    def write(self):
+        line = json.dumps({'time': time.time(), 'stats': self.report()})
+        with open(self.path, 'a') as f:
+            f.write(line + '\n')
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        self.write()
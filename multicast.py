@@ -0,0 +1,125 @@
+import sys
+import socket
+import struct
+import wire
+
+# Neighbor discovery over IP multicast.
+#
+# broadcast('Hello?') sends one datagram to each of the up to 24 cells
+# around us, whether anyone is there or not. With multicast the grid is
+# cut into BLOCK x BLOCK regions, each with a group of its own. A node
+# joins the groups of every region its 5x5 window touches (at most four,
+# as BLOCK is at least 5) and announces itself with one datagram to the
+# group of the region it is in. Anyone in range of us has our cell in
+# their window, so they have joined that group. Others in the same
+# regions get the datagram too, and Node.handleMessage drops 'Hello?' from
+# nodes out of range.
+#
+# All of a grid's groups use one port, which every node on the machine
+# binds with SO_REUSEADDR, and the default interface is loopback, as the
+# nodes of a grid share a machine anyway (see directory.py). Where the
+# groups can't be joined (no multicast route, too many memberships),
+# open() returns None or follow() False, and the node sends its 'Hello?'
+# to every cell as before.
+
+BLOCK = 5
+# 239.192.0.0/14, organization local scope
+GROUP_BASE = 0xEFC00000
+GROUPS = 1 << 18
+INTERFACE = '127.0.0.1'
+TTL = 1
+# Linux delivers a group's datagrams to every socket on the port unless
+# this is off (the socket module doesn't have the constant)
+IP_MULTICAST_ALL = 49
+
+# port a grid's groups use, next to the ones its cells use
+def groupPort(basis):
+    return basis - 1
+
+class Multicast():
+
+    # networkSize is the grid's, port where its groups are (groupPort)
+    def __init__(self, networkSize, port, interface=INTERFACE):
+        self.networkSize = networkSize
+        self.port = port
+        self.interface = socket.inet_aton(interface)
+        # indexes of the regions whose groups we are in
+        self.joined = set()
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if sys.platform.startswith('linux'):
+                self.socket.setsockopt(socket.IPPROTO_IP, IP_MULTICAST_ALL, 0)
+            self.socket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, self.interface)
+            self.socket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, TTL)
+            self.socket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+            self.socket.bind(('', port))
+        except OSError:
+            self.socket.close()
+            raise
+        # the asyncio endpoint over socket, if an AsyncNode made one
+        self.transport = None
+
+    # a Multicast for the grid, or None if multicast can't be used here
+    @classmethod
+    def open(cls, networkSize, port, interface=INTERFACE):
+        try:
+            return cls(networkSize, port, interface)
+        except OSError:
+            return None
+
+    # from now on send and close through an asyncio endpoint over socket
+    def attach(self, transport):
+        self.transport = transport
+
+    # index of the region a cell is in
+    def region(self, location):
+        regions = -(-self.networkSize // BLOCK)
+        row, column = divmod(location, self.networkSize)
+        return (row // BLOCK) * regions + column // BLOCK
+
+    def group(self, region):
+        return socket.inet_ntoa(struct.pack('>I', GROUP_BASE + region % GROUPS))
+
+    # regions the 5x5 window around a cell touches
+    def window(self, location):
+        regions = -(-self.networkSize // BLOCK)
+        row, column = divmod(location, self.networkSize)
+        last = self.networkSize - 1
+        rows = range(max(row - 2, 0) // BLOCK, min(row + 2, last) // BLOCK + 1)
+        columns = range(max(column - 2, 0) // BLOCK, min(column + 2, last) // BLOCK + 1)
+        return set(r * regions + c for r in rows for c in columns)
+
+    # be in the groups for the window around location and no others
+    # returns False if that didn't work out, announcements can't be relied
+    # on until it does
+    def follow(self, location):
+        wanted = self.window(location)
+        try:
+            for region in self.joined - wanted:
+                self.membership(socket.IP_DROP_MEMBERSHIP, region)
+                self.joined.discard(region)
+            for region in wanted - self.joined:
+                self.membership(socket.IP_ADD_MEMBERSHIP, region)
+                self.joined.add(region)
+        except OSError:
+            return False
+        return True
+
+    def membership(self, option, region):
+        request = socket.inet_aton(self.group(region)) + self.interface
+        self.socket.setsockopt(socket.IPPROTO_IP, option, request)
+
+    # send an encoded message to the group of the region location is in
+    def announce(self, data, location):
+        address = (self.group(self.region(location)), self.port)
+        sender = self.socket if self.transport is None else self.transport
+        for datagram in wire.fragment(data):
+            sender.sendto(datagram, address)
+
+    def close(self):
+        self.joined.clear()
+        if self.transport is None:
+            self.socket.close()
+        else:
+            self.transport.close()
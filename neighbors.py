@@ -0,0 +1,141 @@
+from multiprocessing.managers import BaseProxy
+
+# The nodes we currently hear from (activeNeighbors), keyed by node id.
+#
+# Every entry is [row, column, id, location], as in the list this
+# replaces. Besides the table by id there are indexes by cell, by row and
+# by column, so adding, moving, evicting and looking up a neighbor are
+# dict operations, and a move can find everyone in the row or column it
+# leaves behind without looking at anyone else.
+class NeighborTable():
+
+    def __init__(self, networkSize):
+        self.networkSize = networkSize
+        # id -> entry
+        self.byID = {}
+        # location -> id
+        self.byCell = {}
+        # row / column -> {id: entry}
+        self.byRow = {}
+        self.byColumn = {}
+
+    # add a neighbor, or move it if we already know it somewhere else
+    def update(self, id, location):
+        old = self.byID.get(id)
+        if old is not None:
+            if old[3] == location:
+                return
+            self.remove(id)
+        entry = [location // self.networkSize, location % self.networkSize, id, location]
+        self.byID[id] = entry
+        self.byCell[location] = id
+        self.byRow.setdefault(entry[0], {})[id] = entry
+        self.byColumn.setdefault(entry[1], {})[id] = entry
+
+    # forget a neighbor, returns its entry or None if it wasn't there
+    def remove(self, id):
+        entry = self.byID.pop(id, None)
+        if entry is None:
+            return None
+        if self.byCell.get(entry[3]) == id:
+            del self.byCell[entry[3]]
+        self.evict(self.byRow, entry[0], id)
+        self.evict(self.byColumn, entry[1], id)
+        return entry
+
+    def evict(self, index, key, id):
+        ids = index[key]
+        del ids[id]
+        if not ids:
+            del index[key]
+
+    # entry of a neighbor by id, or None
+    def get(self, id):
+        return self.byID.get(id)
+
+    # entry of the neighbor in a cell, or None
+    def at(self, location):
+        id = self.byCell.get(location)
+        return None if id is None else self.byID[id]
+
+    def inRow(self, row):
+        return list(self.byRow.get(row, {}).values())
+
+    def inColumn(self, column):
+        return list(self.byColumn.get(column, {}).values())
+
+    # all entries, in the order they were added
+    def entries(self):
+        return list(self.byID.values())
+
+    # location -> id of every neighbor, what the network image is drawn from
+    def cells(self):
+        return dict(self.byCell)
+
+    def clear(self):
+        self.byID.clear()
+        self.byCell.clear()
+        self.byRow.clear()
+        self.byColumn.clear()
+
+    def __contains__(self, id):
+        return id in self.byID
+
+    def __len__(self):
+        return len(self.byID)
+
+    def __iter__(self):
+        return iter(self.entries())
+
+    def __eq__(self, other):
+        return self.entries() == list(other)
+
+    def __repr__(self):
+        return str(self.entries())
+
+# proxy for a NeighborTable living in a Manager server process
+class NeighborTableProxy(BaseProxy):
+
+    _exposed_ = ('update', 'remove', 'get', 'at', 'inRow', 'inColumn', 'entries', 'cells', 'clear', '__contains__', '__len__')
+
+    def update(self, id, location):
+        return self._callmethod('update', (id, location))
+
+    def remove(self, id):
+        return self._callmethod('remove', (id,))
+
+    def get(self, id):
+        return self._callmethod('get', (id,))
+
+    def at(self, location):
+        return self._callmethod('at', (location,))
+
+    def inRow(self, row):
+        return self._callmethod('inRow', (row,))
+
+    def inColumn(self, column):
+        return self._callmethod('inColumn', (column,))
+
+    def entries(self):
+        return self._callmethod('entries')
+
+    def cells(self):
+        return self._callmethod('cells')
+
+    def clear(self):
+        return self._callmethod('clear')
+
+    def __contains__(self, id):
+        return self._callmethod('__contains__', (id,))
+
+    def __len__(self):
+        return self._callmethod('__len__')
+
+    def __iter__(self):
+        return iter(self.entries())
+
+    def __eq__(self, other):
+        return self.entries() == list(other)
+
+    def __repr__(self):
+        return str(self.entries())
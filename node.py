@@ -1,63 +1,148 @@
 import sys
+import asyncio
+import inspect
 from socket import *
-from lib import Node
+from lib import Node, AsyncNode, Snapshot
+from workload import runCommand, readScript, runScript, runScriptAsync, launch, summarize, formatSummary
 import time
 
 MESSAGE_LIMIT = 4096
 
-myLocation = int(sys.argv[1])
-myID = int(sys.argv[2])
-
-sizeOfNetwork = 8
-numNodes = 3
-name = "isengard.mines.edu"
-basisPort = 57955
-
-me = Node(sizeOfNetwork, myLocation, name, basisPort, numNodes, myID)
-
-while True:
-
-    command = input("What to do? ")
-
-    commandArr = command.split(' ')
-
-    if commandArr[0] == 'print':
-        if len(commandArr) == 1:
-            print("Make sure to include print arguments")
-            continue
-        optionsArr = commandArr[1].split(',')
-        if 'N' in optionsArr:
-            me.printNetwork()
-        if 'T' in optionsArr:
-            me.printT()
-        if 'L' in optionsArr:
-            me.printL()
-        if 'S' in optionsArr:
-            me.printS()
-        if 'E' in optionsArr:
-            me.printE()
-    elif commandArr[0] == 'internal':
-        me.internalEvent()
-    elif commandArr[0] == 'external':
-        if len(commandArr) == 1:
-            print("Make sure to include destination node")
-            continue
-        me.externalSend(int(commandArr[1]))
-    elif commandArr[0] == 'snapshot':
-        me.getSnapshot()
-    elif commandArr[0] == 'move-up':
-        me.moveUp()
-    elif commandArr[0] == 'move-down':
-        me.moveDown()
-    elif commandArr[0] == 'move-left':
-        me.moveLeft()
-    elif commandArr[0] == 'move-right':
-        me.moveRight()
-    elif commandArr[0] == 'exit':
-        me.exit()
-    else:
-        print('Command not recognized')
+# Usage:
+#
+#   python node.py LOCATION ID [process|asyncio] [options]
+#       one node, taking commands from the terminal, or from a script
+#   python node.py --launch COUNT --script FILE [options]
+#       COUNT asyncio nodes spread over worker processes, running a script
+#
+# options:
+#   --size N         the grid is N x N cells (8)
+#   --nodes N        numNodes of a single process node (3)
+#   --host NAME      where the nodes are (isengard.mines.edu, localhost
+#                    with --launch)
+#   --basis PORT     first port of the grid (57955)
+#   --script FILE    run the commands in FILE (see workload.py) and report
+#                    how long each one took
+#   --fast           don't wait for script lines to be due
+#   --workers N      worker processes for --launch (one per CPU)
+#   --stats FILE     append the node's stats to FILE every STATS_INTERVAL
+#                    seconds (see metrics.py)
+#   --multicast      announce nodes to multicast groups instead of sending
+#                    'Hello?' to every cell around them (see multicast.py)
+#   --reliable       acknowledge and retransmit messages to other nodes (see
+#                    reliable.py), every node of the grid needs it
+
+STATS_INTERVAL = 5.0
+
+# the value after `name` on the command line (taken out of sys.argv), or
+# default if it isn't there
+def option(name, default, convert=str):
+    if name not in sys.argv:
+        return default
+    i = sys.argv.index(name)
+    value = convert(sys.argv[i + 1])
+    del sys.argv[i:i + 2]
+    return value
+
+# whether `name` is on the command line (taken out of sys.argv)
+def flag(name):
+    if name not in sys.argv:
+        return False
+    sys.argv.remove(name)
+    return True
+
+# every command with how long it took, then the totals per command
+def report(completions):
+    for completion in completions:
+        print(completion)
+    print(formatSummary(summarize(completions)))
+
+def main():
+    me = Node(sizeOfNetwork, myLocation, name, basisPort, numNodes, myID, metrics=True, multicast=multicast,
+              reliable=reliable)
+    if statsFile is not None:
+        me.dumpStats(statsFile, STATS_INTERVAL)
+    if scriptFile is not None:
+        report(runScript(me, readScript(scriptFile), fast))
+        if me.isActive():
+            me.exit()
+        return
+
+    while True:
+
+        command = input("What to do? ")
+
+        result = runCommand(me, command)
+        if isinstance(result, Snapshot):
+            print(result)
+
+        if not me.isActive():
+            print('I have exited the network')
+            break
 
-    if not me.isActive():
-        print('I have exited the network')
-        break
\ No newline at end of file
+async def asyncMain():
+    # sparse clocks grow as nodes show up, so nobody needs to know numNodes
+    me = AsyncNode(sizeOfNetwork, myLocation, name, basisPort, None, myID, metrics=True, sparse=True,
+                   multicast=multicast, reliable=reliable)
+    await me.start()
+    if statsFile is not None:
+        me.dumpStats(statsFile, STATS_INTERVAL)
+    if scriptFile is not None:
+        report(await runScriptAsync(me, readScript(scriptFile), fast))
+        if me.isActive():
+            me.exit()
+        return
+    loop = asyncio.get_running_loop()
+
+    while True:
+
+        # read input without blocking the node
+        command = await loop.run_in_executor(None, input, "What to do? ")
+
+        result = runCommand(me, command)
+        if inspect.isawaitable(result):
+            result = await result
+        if isinstance(result, Snapshot):
+            print(result)
+
+        if not me.isActive():
+            print('I have exited the network')
+            break
+
+def launchMain():
+    if scriptFile is None:
+        print('--launch needs a --script to run')
+        return
+    steps = readScript(scriptFile)
+    start = time.monotonic()
+    completions = launch(launchCount, steps, sizeOfNetwork, name, basisPort, workers, fast, multicast=multicast,
+                         reliable=reliable)
+    report(completions)
+    print('%d nodes, %d commands in %.2f s' % (launchCount, len(completions), time.monotonic() - start))
+
+if __name__ == '__main__':
+    statsFile = option('--stats', None)
+    multicast = flag('--multicast')
+    reliable = flag('--reliable')
+    fast = flag('--fast')
+    scriptFile = option('--script', None)
+    launchCount = option('--launch', None, int)
+    workers = option('--workers', None, int)
+    sizeOfNetwork = option('--size', 8, int)
+    numNodes = option('--nodes', 3, int)
+    name = option('--host', 'localhost' if launchCount is not None else "isengard.mines.edu")
+    basisPort = option('--basis', 57955, int)
+
+    if launchCount is None:
+        myLocation = int(sys.argv[1])
+        myID = int(sys.argv[2])
+        # 'process' runs the listener in its own process, 'asyncio' runs the node
+        # on an event loop in this one
+        runtime = sys.argv[3] if len(sys.argv) > 3 else 'process'
+
+    if launchCount is not None:
+        launchMain()
+    elif runtime == 'asyncio':
+        asyncio.run(asyncMain())
+    else:
+        main()
@@ -0,0 +1,84 @@
+import contextlib
+import wire
+
+# Outgoing messages of one node.
+#
+# Normally a message goes out the moment it is sent. Inside a batch()
+# block messages are queued per destination port instead, and when the
+# outermost block ends every queue goes out as one datagram (wire.batch),
+# so a handler or a move that sends several messages to the same node
+# costs one packet. A queue that would grow past `limit` bytes is sent
+# early, and a message that is bigger than that on its own goes out alone
+# (and is fragmented as usual).
+#
+# Nodes never hold messages back while they wait for replies: unbatched()
+# sends everything queued and switches batching off until the wait is
+# over, so a reply we owe someone can't get stuck behind our own wait.
+#
+# Messages sent with reliable=False (discovery and exit broadcasts, see
+# reliable.py) are batched apart from the rest, so a batch is either
+# reliable or not as a whole.
+
+# most bytes put into one batch, small enough not to be split by IP
+LIMIT = 1400
+
+class Outbox():
+
+    # transmit(data, port, reliable) puts one encoded message or batch on
+    # the wire
+    def __init__(self, transmit, limit=LIMIT):
+        self.transmit = transmit
+        self.limit = limit
+        # (port, reliable) -> encoded messages waiting to go there
+        self.queues = {}
+        # (port, reliable) -> bytes the batch for them would take
+        self.sizes = {}
+        # how many batch() blocks we are in
+        self.depth = 0
+
+    @contextlib.contextmanager
+    def batch(self):
+        self.depth += 1
+        try:
+            yield
+        finally:
+            self.depth -= 1
+            if self.depth == 0:
+                self.flush()
+
+    @contextlib.contextmanager
+    def unbatched(self):
+        self.flush()
+        depth = self.depth
+        self.depth = 0
+        try:
+            yield
+        finally:
+            self.depth = depth
+
+    def send(self, data, port, reliable=True):
+        if self.depth == 0:
+            self.transmit(data, port, reliable)
+            return
+        key = (port, reliable)
+        size = wire.BATCH_LENGTH.size + len(data)
+        if key in self.queues and self.sizes[key] + size > self.limit:
+            self.flushQueue(key)
+        if key not in self.queues:
+            self.queues[key] = []
+            self.sizes[key] = wire.BATCH_HEADER.size
+        self.queues[key].append(data)
+        self.sizes[key] += size
+
+    def flush(self):
+        for key in list(self.queues):
+            self.flushQueue(key)
+
+    def flushQueue(self, key):
+        messages = self.queues.pop(key)
+        del self.sizes[key]
+        port, reliable = key
+        if len(messages) == 1:
+            self.transmit(messages[0], port, reliable)
+        else:
+            self.transmit(wire.batch(messages), port, reliable)
@@ -0,0 +1,309 @@
+import time
+import heapq
+import struct
+import collections
+
+# Reliable, ordered delivery over a datagram transport.
+#
+# ReliableTransport wraps another transport (LoopbackTransport, or an
+# AsyncNode's asyncio endpoint) and has the same open/sendto/close
+# interface, so a node doesn't know it is there. Everything sent to one
+# address gets a sequence number and is delivered to the receiver exactly
+# once and in order. Datagrams that don't start with MAGIC are passed
+# through untouched (see the best effort broadcasts below). That only
+# works one way: a node without the layer can't read framed datagrams, so
+# either every node of a grid uses it or none does.
+#
+#   data  MAGIC B, DATA B, session Q, sequence I, then the datagram
+#   ack   MAGIC B, ACK B, session Q, next sequence expected I
+#
+# Acks are cumulative. Up to `window` datagrams per peer may be waiting
+# for theirs, anything beyond that queues until the window moves. The
+# oldest unacknowledged datagram is sent again when its timer runs out,
+# or straight away after three acks that didn't move the window (fast
+# retransmit). The timeout follows the measured round trip time as in TCP
+# (RFC 6298): rto = srtt + 4 * rttvar, doubled on every timeout, and round
+# trips of datagrams that had to be sent twice aren't measured (Karn).
+#
+# A peer that hasn't acknowledged anything after MAX_RETRIES timeouts is
+# given up on: what is still queued for it is dropped, as UDP would, and
+# the next datagram for it starts a new session. Sessions count up, and a
+# receiver that sees a newer session forgets the old one, so neither side
+# waits forever for datagrams the other has forgotten about. They follow
+# the wall clock in microseconds (see newSession), so a node that is
+# restarted still starts newer sessions than it had before, which its
+# peers would otherwise take for old ones and drop.
+#
+# Only messages to nodes that are there need this. Nodes send 'Hello?' and
+# 'Exiting' to every cell around them, most of them empty, straight
+# through `inner` instead (Node.transmit with reliable=False), so nobody
+# retries them against cells nobody is in or delivers them late to a node
+# that has moved in since.
+#
+# The wrapped transport must deliver acks to the address datagrams were
+# sent from, and timers need schedule(delay, callback) returning something
+# with cancel(); the loopback network and asyncio both have that, and
+# Timers below does it for a select() loop. The process Node sends from
+# one socket and receives in another process, so its layer lives in the
+# listener process and sends from the socket acks come back to (see
+# ReliableUDPTransport in lib.py).
+
+MAGIC = 0xD4
+DATA = 0
+ACK = 1
+FRAME = struct.Struct('<BBQI')
+
+# datagrams in flight per peer
+WINDOW = 32
+# out of order datagrams a receiver keeps per peer
+RECEIVE_WINDOW = 64
+INITIAL_RTO = 0.1
+MIN_RTO = 0.005
+MAX_RTO = 2.0
+# timeouts in a row before a peer is given up on
+MAX_RETRIES = 10
+DUPLICATE_ACKS = 3
+
+# the last session started in this process
+lastSession = 0
+
+# a session number greater than any this process, or one that ran before
+# it, has used: the time in microseconds, unless sessions were started
+# faster than that
+def newSession():
+    global lastSession
+    lastSession = max(lastSession + 1, int(time.time() * 1e6))
+    return lastSession
+
+# schedule(delay, callback) for a loop that waits in select(): wait()
+# says for how long, run() calls whatever is due
+class Timers():
+
+    def __init__(self, clock):
+        self.clock = clock
+        # (due, order, Timer)
+        self.queue = []
+        self.order = 0
+
+    def schedule(self, delay, callback):
+        timer = Timer(callback)
+        heapq.heappush(self.queue, (self.clock() + delay, self.order, timer))
+        self.order += 1
+        return timer
+
+    # seconds until the next timer is due, None if there is none
+    def wait(self):
+        while self.queue and self.queue[0][2].callback is None:
+            heapq.heappop(self.queue)
+        if not self.queue:
+            return None
+        return max(self.queue[0][0] - self.clock(), 0)
+
+    def run(self):
+        now = self.clock()
+        while self.queue and self.queue[0][0] <= now:
+            callback = heapq.heappop(self.queue)[2].callback
+            if callback is not None:
+                callback()
+
+class Timer():
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def cancel(self):
+        self.callback = None
+
+# what we have sent to one address
+class Channel():
+
+    def __init__(self, address, session):
+        self.address = address
+        self.session = session
+        # sequence number of the next new datagram
+        self.next = 0
+        # oldest one not acknowledged yet
+        self.base = 0
+        # sequence -> [datagram, time sent, times sent]
+        self.inFlight = {}
+        # datagrams waiting for room in the window
+        self.waiting = collections.deque()
+        self.timer = None
+        self.duplicateAcks = 0
+        self.timeouts = 0
+        self.srtt = None
+        self.rttvar = None
+        self.rto = INITIAL_RTO
+
+    def sample(self, rtt):
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar += 0.25 * (abs(self.srtt - rtt) - self.rttvar)
+            self.srtt += 0.125 * (rtt - self.srtt)
+        self.rto = min(max(self.srtt + 4 * self.rttvar, MIN_RTO), MAX_RTO)
+
+# what we have received from one address
+class Receiver():
+
+    def __init__(self, session):
+        self.session = session
+        self.expected = 0
+        # sequence -> datagram, for ones that arrived early
+        self.early = {}
+
+class ReliableTransport():
+
+    # inner is the transport to wrap, clock() and schedule(delay, callback)
+    # default to its own
+    def __init__(self, inner=None, window=WINDOW, clock=None, schedule=None):
+        self.inner = inner
+        self.window = window
+        self.clock = clock or inner.clock
+        self.schedule = schedule or inner.schedule
+        self.receive = None
+        # address -> Channel, and session -> Channel for the acks
+        self.channels = {}
+        self.sessions = {}
+        # address -> Receiver
+        self.receivers = {}
+        self.sent = 0
+        self.retransmitted = 0
+        self.duplicates = 0
+        self.gaveUp = 0
+
+    def open(self, port, receive):
+        self.receive = receive
+        return self.inner.open(port, self.datagramReceived)
+
+    # for an inner transport that is already open and hands its datagrams
+    # to datagramReceived
+    def attach(self, inner, receive):
+        self.inner = inner
+        self.receive = receive
+
+    def close(self):
+        for channel in self.channels.values():
+            if channel.timer is not None:
+                channel.timer.cancel()
+        self.channels.clear()
+        self.sessions.clear()
+        self.inner.close()
+
+    # the wrapped loopback transport's directory() and wait(), for LocalNode
+    def directory(self, networkSize, basis):
+        return self.inner.directory(networkSize, basis)
+
+    def wait(self, timeout):
+        self.inner.wait(timeout)
+
+    def sendto(self, data, address):
+        channel = self.channels.get(address)
+        if channel is None:
+            channel = Channel(address, newSession())
+            self.channels[address] = channel
+            self.sessions[channel.session] = channel
+        if len(channel.inFlight) < self.window:
+            self.transmit(channel, channel.next, data)
+            channel.next += 1
+        else:
+            channel.waiting.append(data)
+
+    def transmit(self, channel, seq, data):
+        entry = channel.inFlight.get(seq)
+        if entry is None:
+            channel.inFlight[seq] = [data, self.clock(), 1]
+        else:
+            entry[1] = self.clock()
+            entry[2] += 1
+            self.retransmitted += 1
+        self.sent += 1
+        self.inner.sendto(FRAME.pack(MAGIC, DATA, channel.session, seq) + data, channel.address)
+        if channel.timer is None:
+            self.startTimer(channel)
+
+    def startTimer(self, channel):
+        channel.timer = self.schedule(channel.rto, lambda: self.timeout(channel))
+
+    def stopTimer(self, channel):
+        if channel.timer is not None:
+            channel.timer.cancel()
+            channel.timer = None
+
+    def timeout(self, channel):
+        channel.timer = None
+        if not channel.inFlight or self.channels.get(channel.address) is not channel:
+            return
+        channel.timeouts += 1
+        if channel.timeouts > MAX_RETRIES:
+            self.giveUp(channel)
+            return
+        channel.rto = min(channel.rto * 2, MAX_RTO)
+        self.transmit(channel, channel.base, channel.inFlight[channel.base][0])
+
+    def giveUp(self, channel):
+        self.stopTimer(channel)
+        del self.channels[channel.address]
+        del self.sessions[channel.session]
+        self.gaveUp += 1
+
+    def datagramReceived(self, data, address):
+        if not data or data[0] != MAGIC:
+            self.receive(data, address)
+            return
+        if len(data) < FRAME.size:
+            return
+        magic, kind, session, seq = FRAME.unpack_from(data)
+        if kind == ACK:
+            self.acknowledged(session, seq)
+        elif kind == DATA:
+            self.dataReceived(session, seq, data[FRAME.size:], address)
+
+    def acknowledged(self, session, ack):
+        channel = self.sessions.get(session)
+        if channel is None or ack > channel.next:
+            return
+        if ack <= channel.base:
+            if ack == channel.base and channel.inFlight:
+                channel.duplicateAcks += 1
+                if channel.duplicateAcks == DUPLICATE_ACKS:
+                    self.transmit(channel, channel.base, channel.inFlight[channel.base][0])
+            return
+        now = self.clock()
+        newest = channel.inFlight[ack - 1]
+        if newest[2] == 1:
+            channel.sample(now - newest[1])
+        for seq in range(channel.base, ack):
+            del channel.inFlight[seq]
+        channel.base = ack
+        channel.duplicateAcks = 0
+        channel.timeouts = 0
+        self.stopTimer(channel)
+        while channel.waiting and len(channel.inFlight) < self.window:
+            self.transmit(channel, channel.next, channel.waiting.popleft())
+            channel.next += 1
+        if channel.inFlight and channel.timer is None:
+            self.startTimer(channel)
+
+    def dataReceived(self, session, seq, data, address):
+        receiver = self.receivers.get(address)
+        if receiver is None or session > receiver.session:
+            receiver = self.receivers[address] = Receiver(session)
+        elif session < receiver.session:
+            # from a session the sender has given up on
+            return
+        if seq == receiver.expected:
+            receiver.expected += 1
+            self.receive(data, address)
+            while receiver.expected in receiver.early:
+                early = receiver.early.pop(receiver.expected)
+                receiver.expected += 1
+                self.receive(early, address)
+        elif receiver.expected < seq < receiver.expected + RECEIVE_WINDOW:
+            if seq in receiver.early:
+                self.duplicates += 1
+            receiver.early[seq] = data
+        else:
+            self.duplicates += 1
+        self.inner.sendto(FRAME.pack(MAGIC, ACK, session, receiver.expected), address)
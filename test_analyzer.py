@@ -0,0 +1,195 @@
+import os
+import random
+import shutil
+import tempfile
+import itertools
+import unittest
+import kernels
+from journal import Journal, CRC
+from loopback import LoopbackNetwork
+from lib import LocalNode
+
+if kernels.available():
+    import analyzer
+    from analyzer import CutAnalyzer, readJournal
+
+# events of numNodes nodes that do internal events and send to each other
+# at random, as {id: [[T, location], ...]}
+def randomTraffic(numNodes, steps, seed):
+    rng = random.Random(seed)
+    T = [[0]*numNodes for i in range(numNodes)]
+    events = {i: [] for i in range(numNodes)}
+    inFlight = []
+    for step in range(steps):
+        i = rng.randrange(numNodes)
+        if inFlight and rng.random() < 0.4:
+            to, sent = inFlight.pop(rng.randrange(len(inFlight)))
+            T[to] = [max(a, b) for a, b in zip(T[to], sent)]
+            i = to
+        T[i][i] += 1
+        events[i].append([T[i][:], rng.randrange(64)])
+        if rng.random() < 0.5:
+            inFlight.append((rng.randrange(numNodes), T[i][:]))
+    return events
+
+# every consistent cut up to bound, the slow way
+def consistentCuts(events, bound):
+    numNodes = len(events)
+    choices = [[0] + [T[i] for T, location in events[i] if T[i] <= bound[i]] for i in range(numNodes)]
+    last = {i: {T[i]: T for T, location in events[i]} for i in range(numNodes)}
+    cuts = []
+    for cut in itertools.product(*choices):
+        if all(cut[i] == 0 or all(a <= b for a, b in zip(last[i][cut[i]], cut)) for i in range(numNodes)):
+            cuts.append(list(cut))
+    return cuts
+
+@unittest.skipUnless(kernels.available(), 'NumPy is not installed')
+class TestCutAnalyzer(unittest.TestCase):
+
+    def setUp(self):
+        # 0 sends to 1 at 2, 1 sends to 2 at 3
+        self.events = {
+            0: [[[1, 0, 0], 10], [[2, 0, 0], 11], [[3, 0, 0], 12]],
+            1: [[[0, 1, 0], 20], [[2, 2, 0], 21], [[2, 3, 0], 22]],
+            2: [[[0, 0, 1], 30], [[2, 3, 2], 31]],
+        }
+        self.analyzer = CutAnalyzer()
+        for id, events in self.events.items():
+            self.analyzer.ingest(id, events)
+
+    def test_latest_cut(self):
+        """Test the latest consistent cut of everything and at or before a bound."""
+        self.assertEqual(len(self.analyzer), 8)
+        self.assertEqual(self.analyzer.latestCut(), [3, 3, 2])
+        # node 1's last events depend on node 0's second, and node 2's on them
+        self.assertEqual(self.analyzer.latestCut([1, 3, 2]), [1, 1, 1])
+        self.assertEqual(self.analyzer.latestCut([2, 2, 5]), [2, 2, 1])
+
+    def test_consistency_and_locations(self):
+        """Test consistency checks and the locations at a cut."""
+        self.assertFalse(self.analyzer.isConsistent([1, 2, 0]))
+        self.assertTrue(self.analyzer.isConsistent([2, 2, 0]))
+        snapshot = self.analyzer.snapshot([2, 2, 0])
+        self.assertEqual(snapshot.nodes, {0: [11, 2], 1: [21, 2]})
+        self.assertTrue(snapshot.isComplete())
+
+    def test_lattice_matches_brute_force(self):
+        """Test that the lattice has every consistent cut between two, once each."""
+        for seed in range(5):
+            events = randomTraffic(4, 40, seed)
+            cutAnalyzer = CutAnalyzer(4)
+            for id in events:
+                cutAnalyzer.ingest(id, events[id])
+            high = cutAnalyzer.latestCut()
+            everything = consistentCuts(events, high)
+            low = everything[len(everything) // 3]
+            lattice = list(cutAnalyzer.lattice(low, high))
+            self.assertEqual(lattice[0], low)
+            expected = [cut for cut in everything if all(a <= b for a, b in zip(low, cut))]
+            self.assertEqual(sorted(lattice), sorted(expected))
+
+    def test_latest_cut_matches_brute_force(self):
+        """Test that the latest cut under a bound is the largest consistent cut under it."""
+        rng = random.Random(3)
+        for seed in range(5):
+            events = randomTraffic(3, 30, seed)
+            cutAnalyzer = CutAnalyzer()
+            for id in events:
+                cutAnalyzer.ingest(id, events[id])
+            for i in range(10):
+                bound = [rng.randrange(len(events[id]) + 2) for id in range(3)]
+                cuts = consistentCuts(events, bound)
+                latest = [max(cut[id] for cut in cuts) for id in range(3)]
+                self.assertEqual(cutAnalyzer.latestCut(bound), latest)
+
+    def test_lattice_checks_its_ends(self):
+        """Test that inconsistent or crossed ends are refused."""
+        with self.assertRaises(ValueError):
+            list(self.analyzer.lattice([1, 2, 0], [3, 3, 2]))
+        with self.assertRaises(ValueError):
+            list(self.analyzer.lattice([2, 2, 0], [1, 1, 1]))
+
+    def test_streaming_ingestion(self):
+        """Test that events in several chunks, out of order, repeated or of growing width index the same."""
+        events = randomTraffic(5, 200, 1)
+        expected = CutAnalyzer()
+        for id in events:
+            expected.ingest(id, events[id])
+        original = analyzer.CHUNK
+        analyzer.CHUNK = 7
+        self.addCleanup(setattr, analyzer, 'CHUNK', original)
+        cutAnalyzer = CutAnalyzer()
+        for id in events:
+            shuffled = events[id] + events[id][:3]
+            random.Random(id).shuffle(shuffled)
+            # sparse clocks leave out the trailing zeros
+            for T, location in shuffled:
+                width = max([i + 1 for i, value in enumerate(T) if value])
+                cutAnalyzer.ingest(id, [[T[:width], location]])
+        self.assertEqual(len(cutAnalyzer), len(expected))
+        self.assertEqual(cutAnalyzer.latestCut(), expected.latestCut())
+        bound = [len(events[id]) // 2 for id in events]
+        self.assertEqual(cutAnalyzer.latestCut(bound), expected.latestCut(bound))
+        cut = cutAnalyzer.latestCut(bound)
+        self.assertEqual(cutAnalyzer.snapshot(cut).nodes, expected.snapshot(cut).nodes)
+
+@unittest.skipUnless(kernels.available(), 'NumPy is not installed')
+class TestJournalIngestion(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_read_journal(self):
+        """Test that a journal reads back as arrays, up to a torn record."""
+        journal = Journal(self.path, 3, segmentRecords=4)
+        for t in range(1, 11):
+            journal.append([t, 0, 2*t], t % 4)
+        journal.close()
+        clocks = []
+        locations = []
+        for segmentClocks, segmentLocations in readJournal(self.path):
+            clocks.extend(segmentClocks.tolist())
+            locations.extend(segmentLocations.tolist())
+        self.assertEqual(clocks, [[t, 0, 2*t] for t in range(1, 11)])
+        self.assertEqual(locations, [t % 4 for t in range(1, 11)])
+        # tear the 7th record
+        with open(os.path.join(self.path, 'events-000001.seg'), 'r+b') as f:
+            f.seek(12 + 2*(CRC.size + 32))
+            f.write(b'\xff')
+        cutAnalyzer = CutAnalyzer()
+        cutAnalyzer.ingestJournal(0, self.path)
+        self.assertEqual(len(cutAnalyzer), 6)
+        self.assertEqual(cutAnalyzer.snapshot([6]).nodes, {0: [2, 6]})
+        # the events depend on node 2's, which aren't there
+        self.assertEqual(cutAnalyzer.latestCut(), [0, 0, 0])
+
+@unittest.skipUnless(kernels.available(), 'NumPy is not installed')
+class TestNodeEvents(unittest.TestCase):
+
+    def test_matches_live_snapshot(self):
+        """Test that the analyzer places nodes where a snapshot of the running grid did."""
+        network = LoopbackNetwork(latency=0.001, jitter=0.002, seed=5)
+        nodes = [LocalNode(8, location, 'sim', 0, 4, i, network.transport())
+                 for i, location in enumerate([0, 1, 8, 9])]
+        for node in nodes:
+            for peer in list(node.connectedNeighbors):
+                node.externalSend(peer)
+        network.run()
+        result = nodes[0].getSnapshot()
+        nodes[3].moveRight()
+        nodes[1].externalSend(0)
+        network.run()
+        cutAnalyzer = CutAnalyzer(4)
+        for node in nodes:
+            cutAnalyzer.ingest(node.myID, node.e.events())
+        self.assertTrue(cutAnalyzer.isConsistent(result.cut))
+        self.assertEqual(cutAnalyzer.snapshot(result.cut).nodes, result.nodes)
+        latest = cutAnalyzer.latestCut()
+        self.assertEqual(latest, [node.T[node.myID] for node in nodes])
+        self.assertEqual(cutAnalyzer.snapshot(latest).nodes[3][0], nodes[3].myLocation)
+
+if __name__ == "__main__":
+    unittest.main()
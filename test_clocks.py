@@ -0,0 +1,77 @@
+import unittest
+import random
+from clocks import SharedVector, SharedMatrix, SparseVector, SparseMatrix, scanSymmetric
+
+class TestSharedClocks(unittest.TestCase):
+
+    def test_vector_behaves_like_list(self):
+        """Test that a shared vector supports the list operations Node uses."""
+        T = SharedVector(3)
+        T[1] += 2
+        self.assertEqual(list(T), [0, 2, 0])
+        self.assertEqual(T[:], [0, 2, 0])
+        L = SharedVector(3)
+        L[:] = T[:]
+        self.assertEqual(str(L), '[0, 2, 0]')
+
+    def test_matrix_rows_are_views(self):
+        """Test that rows of a shared matrix write through to the matrix."""
+        S = SharedMatrix(3, [[1, 0, 0], [0, 0, 0], [0, 0, 0]])
+        S[0][2] += 1
+        S[1] = [4, 5, 6]
+        self.assertEqual(S.toList(), [[1, 0, 1], [4, 5, 6], [0, 0, 0]])
+        self.assertEqual([list(row) for row in S], S.toList())
+        self.assertEqual(repr(S[1]), '[4, 5, 6]')
+
+    def test_symmetry_count_matches_scan(self):
+        """Test that the running asymmetric pair count agrees with a full scan."""
+        rng = random.Random(4)
+        S = SharedMatrix(6, [[1 if i == j else 0 for j in range(6)] for i in range(6)])
+        self.assertTrue(S.isSymmetric())
+        for step in range(500):
+            i, j = rng.randrange(6), rng.randrange(6)
+            if rng.random() < 0.5:
+                S[i][j] += 1
+            else:
+                row = list(S[i])
+                row[j] = max(row[j], S[j][i])
+                S[i] = row
+            self.assertEqual(S.isSymmetric(), scanSymmetric(S))
+            self.assertEqual(S.asymmetric.value, sum(S[a][b] != S[b][a] for a in range(6) for b in range(a)))
+
+class TestSparseClocks(unittest.TestCase):
+
+    def test_vector_grows(self):
+        """Test that a sparse vector reads unset ids as 0 and grows to fit new ones."""
+        T = SparseVector()
+        T[4] += 3
+        self.assertEqual(len(T), 5)
+        self.assertEqual(T, [0, 0, 0, 0, 3])
+        self.assertEqual(dict(T.items()), {4: 3})
+        L = SparseVector(2)
+        L[:] = T[:]
+        T[1] = 1
+        self.assertEqual(L, [0, 0, 0, 0, 3])
+        T[4] = 0
+        self.assertEqual(dict(T.items()), {1: 1})
+
+    def test_matrix_matches_dense(self):
+        """Test that a sparse matrix stores only non-zero cells and agrees with a dense one."""
+        rng = random.Random(9)
+        dense = SharedMatrix(6)
+        S = SparseMatrix()
+        for step in range(500):
+            i, j = rng.randrange(6), rng.randrange(6)
+            value = rng.choice([0, 0, 1, 2])
+            dense[i][j] = value
+            S[i][j] = value
+            self.assertEqual(S.isSymmetric(), dense.isSymmetric())
+        padded = [row + [0]*(6 - len(S)) for row in S.toList()] + [[0]*6]*(6 - len(S))
+        self.assertEqual(padded, dense.toList())
+        self.assertEqual(len(S.items()), sum(1 for row in dense for x in row if x))
+        copy = S.copy()
+        copy[0][5] += 1
+        self.assertNotEqual(copy.get(0, 5), S.get(0, 5))
+
+if __name__ == "__main__":
+    unittest.main()
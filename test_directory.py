@@ -0,0 +1,54 @@
+import os
+import sys
+import subprocess
+import shutil
+import tempfile
+import unittest
+from directory import Directory
+
+class TestDirectory(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.directory = Directory(4, 6000, os.path.join(self.path, 'grid'))
+
+    def tearDown(self):
+        self.directory.close()
+        shutil.rmtree(self.path)
+
+    def test_unregistered_cell_uses_grid_port(self):
+        """Test that cells nobody registered are addressed as basis + cell."""
+        self.assertEqual(self.directory.lookup(5), 6005)
+
+    def test_register_and_vacate(self):
+        """Test that a node is found at the cell it registered and not after it left."""
+        self.directory.register(5, 6002)
+        self.assertEqual(self.directory.lookup(5), 6002)
+        self.directory.vacate(5, 6002)
+        self.assertIsNone(self.directory.lookup(5))
+
+    def test_vacate_keeps_newcomer(self):
+        """Test that leaving a cell someone else has moved into doesn't evict them."""
+        self.directory.register(5, 6002)
+        self.directory.register(5, 6009)
+        self.directory.vacate(5, 6002)
+        self.assertEqual(self.directory.lookup(5), 6009)
+
+    def test_shared_between_instances(self):
+        """Test that every node mapping the same file sees the same entries."""
+        other = Directory(4, 6000, os.path.join(self.path, 'grid'))
+        self.directory.register(3, 6010)
+        self.assertEqual(other.lookup(3), 6010)
+        other.close()
+
+    def test_cell_of_dead_process_is_empty(self):
+        """Test that a cell registered by a process that is gone is taken as empty."""
+        process = subprocess.Popen([sys.executable, '-c', 'pass'])
+        process.wait()
+        self.directory.entries[5] = process.pid << 16 | 6002
+        self.assertIsNone(self.directory.lookup(5))
+        self.directory.register(6, 6003)
+        self.assertEqual(self.directory.lookup(6), 6003)
+
+if __name__ == '__main__':
+    unittest.main()
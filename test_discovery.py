@@ -0,0 +1,57 @@
+import unittest
+from discovery import Discovery, QUIET
+
+class TestDiscovery(unittest.TestCase):
+
+    def setUp(self):
+        self.discovery = Discovery(numNodes=4, minQuiet=0.01, timeout=2.0)
+
+    def test_complete_when_every_cell_answers(self):
+        """Test that a round ends as soon as every asked cell has answered."""
+        self.discovery.begin(2, now=100.0)
+        self.discovery.reply(1, now=100.001)
+        self.assertFalse(self.discovery.isComplete(now=100.001))
+        self.discovery.reply(1, now=100.002)  # duplicates don't count
+        self.assertFalse(self.discovery.isComplete(now=100.002))
+        self.discovery.reply(2, now=100.002)
+        self.assertTrue(self.discovery.isComplete(now=100.002))
+
+    def test_complete_when_quiet(self):
+        """Test that a round ends once nothing has arrived for the quiet period."""
+        self.discovery.begin(24, now=100.0)
+        self.discovery.reply(1, now=100.001)
+        quiet = self.discovery.quietPeriod()
+        self.assertAlmostEqual(self.discovery.remaining(now=100.001), quiet)
+        self.assertTrue(self.discovery.isComplete(now=100.001 + quiet))
+
+    def test_default_waits_for_a_busy_listener(self):
+        """Test that by default a round with no replies lasts as long as a loaded listener may take to answer."""
+        discovery = Discovery(numNodes=4)
+        discovery.begin(8, now=100.0)
+        self.assertEqual(discovery.quietPeriod(), QUIET)
+        self.assertFalse(discovery.isComplete(now=100.1))
+        self.assertTrue(discovery.isComplete(now=100.0 + QUIET))
+
+    def test_quiet_period_adapts_to_rtt(self):
+        """Test that slow replies stretch the quiet period, up to the timeout."""
+        fast = self.discovery.quietPeriod()
+        for i in range(20):
+            self.discovery.begin(24, now=i * 10.0)
+            self.discovery.reply(1, now=i * 10.0 + 0.2)
+        self.assertGreater(self.discovery.quietPeriod(), fast)
+        self.assertLessEqual(self.discovery.quietPeriod(), 2.0)
+        self.discovery.begin(24, now=1000.0)
+        self.assertLessEqual(self.discovery.remaining(now=1000.0), 2.0)
+
+    def test_new_round_resets_answers(self):
+        """Test that answers from an earlier round don't count towards the next one."""
+        self.discovery.begin(1, now=100.0)
+        self.discovery.reply(3, now=100.001)
+        self.assertTrue(self.discovery.isComplete(now=100.001))
+        self.discovery.begin(1, now=200.0)
+        self.assertFalse(self.discovery.isComplete(now=200.0))
+        self.discovery.reply(3, now=200.001)
+        self.assertTrue(self.discovery.isComplete(now=200.001))
+
+if __name__ == "__main__":
+    unittest.main()
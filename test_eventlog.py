@@ -0,0 +1,57 @@
+import unittest
+from eventlog import EventLog
+
+# event of node 0 at its own time t
+def event(t, location=5):
+    return [[t, 0, 0], location]
+
+class TestEventLog(unittest.TestCase):
+
+    def test_find(self):
+        """Test that events are found by the node's own clock component."""
+        log = EventLog(0)
+        for t in range(1, 6):
+            log.append(event(t, location=t + 10))
+        self.assertEqual(log.find(3), event(3, location=13))
+        self.assertIsNone(log.find(9))
+        self.assertEqual(len(log), 5)
+
+    def test_duplicate_time_keeps_first(self):
+        """Test that a second event with the same own time doesn't replace the first."""
+        log = EventLog(0)
+        log.append(event(1, location=2))
+        log.append(event(1, location=3))
+        self.assertEqual(log.find(1)[1], 2)
+        self.assertEqual(len(log), 1)
+
+    def test_prune_with_retention(self):
+        """Test that only `retention` events before the cut are kept."""
+        log = EventLog(0, retention=2)
+        for t in range(1, 11):
+            log.append(event(t))
+        self.assertEqual(log.prune(8), 5)
+        self.assertEqual([e[0][0] for e in log], [6, 7, 8, 9, 10])
+        self.assertIsNone(log.find(5))
+        self.assertEqual(log.find(6), event(6))
+        self.assertEqual(log.prune(8), 0)
+
+    def test_no_retention_keeps_everything(self):
+        """Test that without a retention policy nothing is ever pruned."""
+        log = EventLog(0)
+        for t in range(1, 11):
+            log.append(event(t))
+        self.assertEqual(log.prune(10), 0)
+        self.assertEqual(len(log), 10)
+
+    def test_bounded_under_retention(self):
+        """Test that a long history stays bounded when the cut keeps advancing."""
+        log = EventLog(0, retention=0)
+        for t in range(1, 1001):
+            log.append(event(t))
+            log.prune(t)
+        self.assertEqual(len(log), 1)
+        self.assertLessEqual(len(log.order), 2)
+        self.assertEqual(log.find(1000), event(1000))
+
+if __name__ == '__main__':
+    unittest.main()
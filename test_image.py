@@ -0,0 +1,40 @@
+import unittest
+from image import NetworkImage
+from neighbors import NeighborTable
+
+class TestNetworkImage(unittest.TestCase):
+
+    def setUp(self):
+        # 6x6 grid, we are node 0 in cell 14 (row 2, column 2)
+        self.table = NeighborTable(6)
+        self.table.update(3, 15)
+        self.table.update(7, 35)
+
+    def test_whole_grid(self):
+        """Test that the whole grid shows us, our neighbors and the cells in range."""
+        image = NetworkImage(6, 14, 0, self.table.cells())
+        self.assertEqual(list(image.rows(None)), [
+            '|+++++-|',
+            '|+++++-|',
+            '|++03+-|',
+            '|+++++-|',
+            '|+++++-|',
+            '|-----7|',
+        ])
+
+    def test_viewport_is_clipped(self):
+        """Test that a viewport shows only the cells within radius of us."""
+        image = NetworkImage(6, 14, 0, self.table.cells())
+        self.assertEqual(list(image.rows(1)), ['|+++|', '|+03|', '|+++|'])
+        self.assertEqual(list(image.rows(3)), list(image.rows(None))[:6])
+
+    def test_large_grid_rows_are_generated(self):
+        """Test that rows of a large grid are produced one at a time, not all up front."""
+        image = NetworkImage(2000, 2000*1000 + 1000, 5, {})
+        rows = image.rows(None)
+        self.assertEqual(next(rows), '|' + '-'*2000 + '|')
+        self.assertEqual(sum(1 for row in rows), 1999)
+        self.assertEqual(list(image.rows(0)), ['|5|'])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import shutil
+import tempfile
+import unittest
+from journal import Journal, JournalError, CRC
+from eventlog import EventLog
+
+class TestJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_events_survive_reopen(self):
+        """Test that events are read back in order, across segments."""
+        journal = Journal(self.path, 3, segmentRecords=4)
+        for t in range(1, 11):
+            journal.append([t, 0, 2*t], t % 4)
+        journal.close()
+        journal = Journal(self.path, 3, segmentRecords=4)
+        self.assertEqual(journal.recovered, [[[t, 0, 2*t], t % 4] for t in range(1, 11)])
+        # appends carry on after the last event
+        journal.append([11, 0, 22], 3)
+        journal.close()
+        self.assertEqual(len(Journal(self.path, 3, segmentRecords=4).recovered), 11)
+
+    def test_torn_record_is_dropped(self):
+        """Test that a record whose crc doesn't match ends the journal."""
+        journal = Journal(self.path, 2, segmentRecords=8)
+        for t in range(1, 4):
+            journal.append([t, 0], 1)
+        # corrupt the body of the last record, as a crash halfway through would
+        start = journal.offset(2) + CRC.size
+        journal.map[start] ^= 0xFF
+        journal.close()
+        journal = Journal(self.path, 2, segmentRecords=8)
+        self.assertEqual(len(journal.recovered), 2)
+        self.assertEqual(journal.position, 2)
+
+    def test_recover_from_checkpoint_and_tail(self):
+        """Test that T comes from the events after the latest checkpoint."""
+        journal = Journal(self.path, 2)
+        journal.append([1, 0], 0)
+        journal.checkpoint([1, 0], [1, 0, 0, 1], [1, 0])
+        journal.append([2, 0], 0)
+        journal.checkpoint([2, 0], [2, 1, 1, 2], [2, 0])
+        journal.append([3, 4], 0)
+        journal.close()
+        state = Journal(self.path, 2).recover()
+        self.assertEqual(state['T'], [3, 4])
+        self.assertEqual(state['S'], [[2, 1], [1, 2]])
+        self.assertEqual(state['L'], [2, 0])
+
+    def test_nothing_to_recover(self):
+        """Test that an empty journal has no state to restart from."""
+        self.assertIsNone(Journal(self.path, 2).recover())
+
+    def test_different_settings_rejected(self):
+        """Test that a journal written for another number of nodes isn't misread."""
+        journal = Journal(self.path, 2)
+        journal.append([1, 0], 0)
+        journal.close()
+        with self.assertRaises(JournalError):
+            Journal(self.path, 3)
+
+    def test_eventlog_checkpoint_due(self):
+        """Test that the event log asks for a checkpoint every interval and reloads its events."""
+        log = EventLog(0, journalPath=self.path, numNodes=2, checkpointInterval=3)
+        due = [log.append([[t, 0], 1]) for t in range(1, 7)]
+        self.assertEqual(due, [False, False, True, True, True, True])
+        log.checkpoint([6, 0], [1, 0, 0, 1], [6, 0])
+        self.assertFalse(log.append([[7, 0], 1]))
+        log.close()
+        log = EventLog(0, journalPath=self.path, numNodes=2)
+        self.assertEqual(len(log), 7)
+        self.assertEqual(log.recover()['T'], [7, 0])
+        log.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import random
+import unittest
+import kernels
+from clocks import Vector, Matrix, SharedVector, SharedMatrix, SparseVector, SparseMatrix, scanSymmetric
+from loopback import LoopbackNetwork
+from lib import LocalNode
+
+@unittest.skipUnless(kernels.available(), 'NumPy is not installed')
+class TestKernels(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = random.Random(12)
+
+    def randomMatrix(self, size):
+        return [[self.rng.choice([0, 0, 1, 5, 1 << 40]) for j in range(size)] for i in range(size)]
+
+    def test_maximum_matches_loops(self):
+        """Test that the vector merge gives exactly what the Python loop does, for every kind of input."""
+        for cls in (Vector, SharedVector):
+            a = [self.rng.randrange(1 << 50) for i in range(9)]
+            b = [self.rng.randrange(1 << 50) for i in range(9)]
+            sparse = SparseVector(5)
+            sparse[3] = 1 << 52
+            for other in (b, sparse):
+                T = cls(9, a)
+                kernels.maximum(T, T, other, 9)
+                self.assertEqual(T[:], [max(a[i], other[i]) for i in range(9)])
+
+    def test_maximum_matrix_matches_loops(self):
+        """Test that the matrix merge is exact and leaves the asymmetric pair count right."""
+        for cls in (Matrix, SharedMatrix):
+            for step in range(20):
+                first = self.randomMatrix(7)
+                second = self.randomMatrix(7)
+                S = cls(7, first)
+                temp = kernels.copyMatrix(S, 7)
+                temp[2][3] += 1
+                kernels.maximumMatrix(S, temp, second, 7)
+                expected = [[max(first[i][j] + (i == 2 and j == 3), second[i][j]) for j in range(7)] for i in range(7)]
+                self.assertEqual(S.toList(), expected)
+                self.assertEqual(S.isSymmetric(), scanSymmetric(expected))
+                self.assertEqual(S.asymmetric.value, sum(expected[i][j] != expected[j][i] for i in range(7) for j in range(i)))
+
+    def test_symmetry(self):
+        """Test that the transpose comparison agrees with the scan."""
+        for step in range(20):
+            matrix = self.randomMatrix(5)
+            if step % 2:
+                matrix = [[max(matrix[i][j], matrix[j][i]) for j in range(5)] for i in range(5)]
+            self.assertEqual(kernels.isSymmetric(matrix, 5), scanSymmetric(matrix))
+        sparse = SparseMatrix(3)
+        sparse[0][2] = 4
+        self.assertFalse(kernels.isSymmetric(sparse, 3))
+
+    def test_nodes_agree(self):
+        """Test that nodes merging with NumPy end up with the same clocks as nodes that don't."""
+        runs = []
+        for vectorized in (False, True):
+            network = LoopbackNetwork(latency=0.001, jitter=0.002, seed=8)
+            nodes = [LocalNode(5, location, 'sim', 0, 6, i, network.transport(), vectorized=vectorized)
+                     for i, location in enumerate([0, 1, 6, 7, 12, 13])]
+            self.assertEqual(nodes[0].vectorized, vectorized)
+            for node in nodes:
+                for peer in list(node.connectedNeighbors):
+                    node.externalSend(peer)
+            nodes[2].moveRight()
+            nodes[5].moveDown()
+            network.run()
+            runs.append([(node.T[:], node.S.toList(), node.L[:], node.S.asymmetric.value) for node in nodes])
+        self.assertEqual(runs[0], runs[1])
+
+class TestFallback(unittest.TestCase):
+
+    def test_enabled(self):
+        """Test that nodes only use the kernels when NumPy is there, and by default only for large clocks."""
+        self.assertFalse(kernels.enabled(True, None))
+        self.assertEqual(kernels.enabled(True, 3), kernels.available())
+        self.assertFalse(kernels.enabled(None, kernels.AUTO_SIZE - 1))
+        self.assertFalse(kernels.enabled(False, 1000))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,277 @@
+import unittest
+import random
+import itertools
+from loopback import LoopbackNetwork
+from lib import LocalNode, RESYNC
+import wire
+
+class TestLoopbackNetwork(unittest.TestCase):
+
+    def setUp(self):
+        self.received = []
+
+    def receiver(self, name):
+        return lambda datagram, address: self.received.append((name, datagram, self.network.now))
+
+    def test_delivery_after_latency(self):
+        """Test that datagrams arrive in order, latency seconds after they were sent."""
+        self.network = LoopbackNetwork(latency=0.5)
+        a = self.network.transport()
+        b = self.network.transport()
+        a.open(1, self.receiver('a'))
+        b.open(2, self.receiver('b'))
+        a.sendto(b'one', ('loopback', 2))
+        a.sendto(b'two', ('loopback', 2))
+        self.network.run()
+        self.assertEqual(self.received, [('b', b'one', 0.5), ('b', b'two', 0.5)])
+
+    def test_port_in_use(self):
+        """Test that a taken port is refused and port 0 picks a free one."""
+        self.network = LoopbackNetwork()
+        self.network.transport().open(5, self.receiver('a'))
+        with self.assertRaises(OSError):
+            self.network.transport().open(5, self.receiver('b'))
+        self.assertNotEqual(self.network.transport().open(0, self.receiver('b')), 5)
+
+    def test_loss_and_reordering_are_deterministic(self):
+        """Test that the same seed loses and reorders the same datagrams."""
+        runs = []
+        for i in range(2):
+            self.received = []
+            self.network = LoopbackNetwork(latency=0.001, jitter=0.01, loss=0.2, seed=7)
+            a = self.network.transport()
+            a.open(1, self.receiver('a'))
+            for k in range(50):
+                a.sendto(bytes([k]), ('loopback', 1))
+            self.network.run()
+            runs.append([datagram[0] for name, datagram, now in self.received])
+        self.assertEqual(runs[0], runs[1])
+        self.assertLess(len(runs[0]), 50)
+        self.assertNotEqual(runs[0], sorted(runs[0]))
+
+    def test_wait_advances_clock(self):
+        """Test that waiting with nothing in flight just lets the time pass."""
+        self.network = LoopbackNetwork()
+        transport = self.network.transport()
+        transport.wait(0.25)
+        self.assertEqual(transport.clock(), 0.25)
+
+class TestLocalNode(unittest.TestCase):
+
+    def startNodes(self, network, locations):
+        return [LocalNode(5, location, 'sim', 0, len(locations), i, network.transport())
+                for i, location in enumerate(locations)]
+
+    def test_nodes_connect_without_sockets(self):
+        """Test that nodes on a loopback network find each other and exchange messages."""
+        network = LoopbackNetwork()
+        a, b, c = self.startNodes(network, [0, 2, 4])
+        self.assertEqual(a.connectedNeighbors, [1])
+        self.assertEqual(sorted(b.connectedNeighbors), [0, 2])
+        b.externalSend(0)
+        network.run()
+        self.assertEqual(a.T[1], b.T[1])
+        result = a.getSnapshot()
+        self.assertTrue(result.isComplete())
+        a.moveDown()
+        self.assertEqual(b.activeNeighbors.get(0)[3], 5)
+
+    def test_same_seed_same_run(self):
+        """Test that a lossy, reordering run is reproduced exactly from its seed."""
+        runs = []
+        for i in range(2):
+            network = LoopbackNetwork(latency=0.001, jitter=0.002, loss=0.1, seed=11)
+            nodes = self.startNodes(network, [0, 1, 6, 7, 12])
+            for node in nodes:
+                for peer in list(node.connectedNeighbors):
+                    node.externalSend(peer)
+            nodes[2].moveRight()
+            network.run()
+            runs.append(([list(node.T) for node in nodes], network.now, network.dropped))
+        self.assertEqual(runs[0], runs[1])
+
+    def test_sparse_clocks_match_dense(self):
+        """Test that nodes with sparse clocks end up with the same clocks as dense ones."""
+        runs = []
+        for sparse in (False, True):
+            network = LoopbackNetwork(latency=0.001, jitter=0.002, seed=5)
+            nodes = [LocalNode(5, location, 'sim', 0, 5, i, network.transport(), sparse=sparse)
+                     for i, location in enumerate([0, 1, 6, 7, 12])]
+            for node in nodes:
+                for peer in list(node.connectedNeighbors):
+                    node.externalSend(peer)
+            nodes[2].moveRight()
+            network.run()
+            runs.append(([list(node.T) + [0]*(5 - len(node.T)) for node in nodes],
+                         [node.isSymmetric(node.S) for node in nodes]))
+        self.assertEqual(runs[0], runs[1])
+
+    def test_lost_delta_is_resent(self):
+        """Test that entries a lost External carried reach the peer with the next one."""
+        for sparse in (False, True):
+            network = LoopbackNetwork()
+            a, b, c = self.startNodes(network, [0, 1, 2]) if not sparse else \
+                [LocalNode(5, location, 'sim', 0, 3, i, network.transport(), sparse=True)
+                 for i, location in enumerate([0, 1, 2])]
+            b.externalSend(0)
+            for i in range(3):
+                c.externalSend(1)
+            network.run()
+            network.loss = 1.0
+            b.externalSend(0)
+            network.run()
+            network.loss = 0.0
+            b.externalSend(0)
+            network.run()
+            self.assertEqual(a.T[2], b.T[2])
+            self.assertEqual(a.S[1][2], b.S[1][2])
+
+    def test_lossy_deltas_match_full_clocks(self):
+        """Test that once messages get through again, deltas leave the same clocks as full clocks do."""
+        runs = []
+        for wireFormat in ('binary', 'text'):
+            network = LoopbackNetwork(latency=0.001, jitter=0.002, seed=9)
+            # two cells apart, so most of what a node hears of others is relayed
+            locations = [row*8 + column for row in range(0, 8, 2) for column in range(0, 8, 2)]
+            nodes = [LocalNode(8, location, 'sim', 0, 16, i, network.transport(), wireFormat=wireFormat)
+                     for i, location in enumerate(locations)]
+            network.loss = 0.3
+            rng = random.Random(4)
+            for k in range(200):
+                node = rng.choice(nodes)
+                if node.connectedNeighbors:
+                    node.externalSend(rng.choice(list(node.connectedNeighbors)))
+                network.run()
+            # one node at a time, so what was lost doesn't just change again
+            network.loss = 0.0
+            for node in nodes:
+                for k in range(RESYNC + 1):
+                    for peer in list(node.connectedNeighbors):
+                        node.externalSend(peer)
+                    network.run()
+            runs.append(([list(node.T) for node in nodes], [[list(row) for row in node.S] for node in nodes]))
+        self.assertEqual(runs[0], runs[1])
+
+    def test_exit_reaches_each_node_once(self):
+        """Test that a node the directory has in two cells gets one 'Exiting', and a repeated one is harmless."""
+        network = LoopbackNetwork()
+        a, b = self.startNodes(network, [0, 1])
+        # as if b had left cell 5 without vacating it and come back in cell 1
+        network.directory(5, 0).register(5, b.myPort)
+        sent = network.sent
+        a.exit()
+        network.run()
+        self.assertEqual(network.sent - sent, 1)
+        self.assertEqual(b.connectedNeighbors, [])
+        T = list(b.T)
+        b.handleMessage(a.encode('Exiting'))
+        self.assertEqual(list(b.T), T)
+
+    def test_sparse_nodes_join_without_numNodes(self):
+        """Test that sparse nodes grow their clocks for ids they have never seen."""
+        network = LoopbackNetwork()
+        a = LocalNode(5, 0, 'sim', 0, None, 0, network.transport(), sparse=True)
+        b = LocalNode(5, 1, 'sim', 0, None, 40, network.transport(), sparse=True)
+        self.assertEqual(len(a.T), 41)
+        self.assertEqual(sorted(dict(a.S.items())), [(0, 0), (0, 40), (40, 0), (40, 40)])
+        b.externalSend(0)
+        network.run()
+        result = a.getSnapshot()
+        self.assertTrue(result.isComplete())
+        self.assertEqual(sorted(result.nodes), [0, 40])
+
+    def test_snapshot_of_nodes_outside_the_cut(self):
+        """Test that nodes the cut has nothing of are missing without a request or a wait."""
+        network = LoopbackNetwork()
+        a, b, c = [LocalNode(8, location, 'sim', 0, 3, i, network.transport())
+                   for i, location in enumerate([0, 1, 63])]
+        result = a.getSnapshot()
+        self.assertEqual(result.missing, [2])
+        self.assertEqual(sorted(result.nodes), [0, 1])
+        self.assertLess(result.elapsed, 0.1)
+        # alone, with no events of its own yet: nobody to ask
+        network = LoopbackNetwork()
+        lone = LocalNode(5, 0, 'sim', 0, 1, 0, network.transport())
+        sent = network.sent
+        result = lone.getSnapshot()
+        self.assertEqual(result.missing, [0])
+        self.assertLess(result.elapsed, 0.1)
+        self.assertEqual(network.sent, sent)
+
+    def test_snapshots_reuse_answers(self):
+        """Test that repeated snapshots only ask nodes whose part of the cut moved."""
+        network = LoopbackNetwork()
+        nodes = self.startNodes(network, [0, 1, 2, 3, 4])
+        for node in nodes:
+            for peer in list(node.connectedNeighbors):
+                node.externalSend(peer)
+        network.run()
+        first = nodes[0].getSnapshot()
+        self.assertTrue(first.isComplete())
+        sent = network.sent
+        again = nodes[0].getSnapshot()
+        self.assertEqual(network.sent, sent)
+        self.assertEqual(again.nodes, first.nodes)
+        self.assertTrue(again.isComplete())
+        # news from node 3 reaches node 0 through 1
+        for sender, receiver in [(4, 3), (3, 1), (1, 0)]:
+            nodes[sender].externalSend(receiver)
+        network.run()
+        requests = []
+        handleMessage = nodes[1].handleMessage
+        def record(message):
+            msgType = wire.decode(message)[0]
+            if msgType.startswith('Snapshot?|'):
+                requests.append(msgType)
+            handleMessage(message)
+        nodes[1].handleMessage = record
+        result = nodes[0].getSnapshot()
+        self.assertTrue(result.isComplete())
+        moved = [id for id in range(1, 5) if result.cut[id] != first.cut[id]]
+        self.assertEqual(moved, [1, 2, 3])
+        self.assertEqual({request.split('|')[3] for request in requests}, {'1:2:3'})
+        # a Goodbye drops the sender's answer
+        nodes[2].moveDown()
+        self.assertIn(2, nodes[0].snapshotCache)
+        nodes[2].moveRight()
+        network.run()
+        self.assertNotIn(2, nodes[0].snapshotCache)
+
+    def test_path_matches_single_moves(self):
+        """Test that moving along a path ends like the one cell moves, with less traffic."""
+        runs = []
+        for path in (False, True):
+            network = LoopbackNetwork()
+            nodes = self.startNodes(network, [10, 0, 1, 20, 4, 24])
+            mover = nodes[0]
+            sent = network.sent
+            if path:
+                mover.movePath([11, 12, 13, 14])
+            else:
+                for i in range(4):
+                    mover.moveRight()
+            network.run()
+            runs.append((sorted(mover.connectedNeighbors), [0 in node.connectedNeighbors for node in nodes],
+                         mover.T[0], [cell for cell, events in itertools.groupby(event[1] for event in mover.e)],
+                         network.sent - sent))
+        self.assertEqual(runs[0][:4], runs[1][:4])
+        self.assertEqual(runs[1][0], [4, 5])
+        self.assertEqual(runs[1][3], [10, 11, 12, 13, 14])
+        self.assertLess(runs[1][4], runs[0][4])
+
+    def test_move_to_checks_path(self):
+        """Test that moveTo goes along the row and then the column, and bad paths change nothing."""
+        network = LoopbackNetwork()
+        a, b = self.startNodes(network, [0, 1])
+        self.assertEqual(a.pathTo(12), [1, 2, 7, 12])
+        with self.assertRaises(ValueError):
+            a.movePath([1, 3])
+        with self.assertRaises(ValueError):
+            a.movePath([-5])
+        self.assertEqual(a.myLocation, 0)
+        a.moveTo(12)
+        self.assertEqual(a.myLocation, 12)
+        self.assertEqual(b.activeNeighbors.get(0)[3], 12)
+
+if __name__ == '__main__':
+    unittest.main()
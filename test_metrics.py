@@ -0,0 +1,148 @@
+import os
+import json
+import tempfile
+import unittest
+from metrics import Metrics, MetricsDump, bucket, percentile, formatReport
+from loopback import LoopbackNetwork
+from lib import LocalNode
+
+class TestMetrics(unittest.TestCase):
+
+    def test_counts_by_type(self):
+        """Test that messages and bytes are counted under their type, with arguments ignored."""
+        for shared in (False, True):
+            metrics = Metrics(shared)
+            metrics.sent('External', 40)
+            metrics.sent('External', 10)
+            metrics.sent('Snapshot?|1|2', 30)
+            metrics.received('Snapshot|1|2|0:3', 25, 0.0001)
+            report = metrics.report()
+            self.assertEqual(report['types']['External']['sent'], 2)
+            self.assertEqual(report['types']['External']['sentBytes'], 50)
+            self.assertEqual(report['types']['Snapshot?']['sent'], 1)
+            self.assertEqual(report['types']['Snapshot']['received'], 1)
+            self.assertNotIn('Hello', report['types'])
+
+    def test_histogram(self):
+        """Test that handler times land in power of two microsecond buckets."""
+        self.assertEqual(bucket(0.0000005), 0)
+        self.assertEqual(bucket(0.000003), 2)
+        self.assertEqual(bucket(100.0), 23)
+        buckets = [0]*24
+        buckets[3] = 98
+        buckets[10] = 2
+        self.assertEqual(percentile(buckets, 0.5), 8)
+        self.assertEqual(percentile(buckets, 0.99), 1024)
+        self.assertEqual(percentile([0]*24, 0.5), 0)
+
+    def test_dump(self):
+        """Test that stopping a dump writes one last JSON line."""
+        path = os.path.join(tempfile.mkdtemp(), 'stats.jsonl')
+        metrics = Metrics()
+        metrics.parseFailure()
+        dump = MetricsDump(metrics.report, path, 60)
+        dump.stop()
+        with open(path) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(json.loads(lines[0])['stats']['parseFailures'], 1)
+
+# a lock that knows whether it is held
+class DepthLock():
+
+    def __init__(self, lock):
+        self.lock = lock
+        self.depth = 0
+
+    def __enter__(self):
+        self.lock.acquire()
+        self.depth += 1
+
+    def __exit__(self, *exc):
+        self.depth -= 1
+        self.lock.release()
+
+# Metrics that note every update made without holding lock
+class LockedMetrics(Metrics):
+
+    def __init__(self, lock):
+        Metrics.__init__(self)
+        self.lock = lock
+        self.calls = []
+        self.unlocked = []
+
+    def check(self, name):
+        self.calls.append(name)
+        if self.lock.depth == 0:
+            self.unlocked.append(name)
+
+    def sent(self, msgType, size):
+        self.check('sent')
+        Metrics.sent(self, msgType, size)
+
+    def received(self, msgType, size, seconds):
+        self.check('received')
+        Metrics.received(self, msgType, size, seconds)
+
+    def parseFailure(self):
+        self.check('parseFailure')
+        Metrics.parseFailure(self)
+
+    def linkUp(self):
+        self.check('linkUp')
+        Metrics.linkUp(self)
+
+    def linkDown(self):
+        self.check('linkDown')
+        Metrics.linkDown(self)
+
+class TestNodeMetrics(unittest.TestCase):
+
+    def test_node_stats(self):
+        """Test that a node counts its traffic, link churn and garbage it receives."""
+        network = LoopbackNetwork()
+        a = LocalNode(5, 0, 'sim', 0, 2, 0, network.transport(), metrics=True)
+        b = LocalNode(5, 1, 'sim', 0, 2, 1, network.transport(), metrics=True)
+        b.externalSend(0)
+        network.run()
+        a.receive(b'\xff\xff garbage', ('loopback', 1))
+        b.moveRight()
+        b.moveRight()
+        network.run()
+        stats = a.stats()
+        self.assertEqual(stats['types']['External']['received'], 1)
+        self.assertEqual(stats['types']['Goodbye']['received'], 1)
+        self.assertEqual(stats['parseFailures'], 1)
+        self.assertEqual(stats['linksUp'], 1)
+        self.assertEqual(stats['linksDown'], 1)
+        self.assertEqual(stats['activeNeighbors'], 0)
+        self.assertEqual(b.stats()['types']['External']['sent'], 1)
+        self.assertIn('External', formatReport(stats))
+
+    def test_counted_under_lock(self):
+        """Test that a node only counts while it holds its lock, as the listener process counts too."""
+        network = LoopbackNetwork()
+        a = LocalNode(5, 0, 'sim', 0, 2, 0, network.transport(), metrics=True)
+        b = LocalNode(5, 1, 'sim', 0, 2, 1, network.transport(), metrics=True)
+        for node in (a, b):
+            node.lock = DepthLock(node.lock)
+            node.metrics = LockedMetrics(node.lock)
+        b.externalSend(0)
+        network.run()
+        a.receive(b'\xff\xff garbage', ('loopback', 1))
+        b.moveRight()
+        b.moveRight()
+        network.run()
+        self.assertEqual(a.metrics.unlocked + b.metrics.unlocked, [])
+        self.assertIn('linkDown', b.metrics.calls)
+        self.assertIn('parseFailure', a.metrics.calls)
+
+    def test_off_by_default(self):
+        """Test that a node without metrics reports nothing."""
+        network = LoopbackNetwork()
+        node = LocalNode(5, 0, 'sim', 0, 1, 0, network.transport())
+        self.assertIsNone(node.metrics)
+        self.assertIsNone(node.stats())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import unittest
+import asyncio
+from unittest.mock import patch
+from multicast import Multicast
+from lib import AsyncNode
+
+class TestRegions(unittest.TestCase):
+
+    def setUp(self):
+        # 12x12 grid, regions of 5x5 cells, 3 regions to a side
+        self.groups = Multicast.open(12, 47399)
+        if self.groups is None:
+            self.skipTest('multicast not available')
+
+    def tearDown(self):
+        self.groups.close()
+
+    def test_window_covers_everyone_in_range(self):
+        """Test that the region of every cell in range of a node is one it has joined."""
+        for location in range(144):
+            window = self.groups.window(location)
+            self.assertLessEqual(len(window), 4)
+            row, column = divmod(location, 12)
+            for other in range(144):
+                if abs(other // 12 - row) <= 2 and abs(other % 12 - column) <= 2:
+                    self.assertIn(self.groups.region(other), window)
+
+    def test_follow_joins_and_leaves(self):
+        """Test that moving leaves the groups of regions no longer in the window."""
+        self.assertTrue(self.groups.follow(0))
+        self.assertEqual(self.groups.joined, {0})
+        self.assertTrue(self.groups.follow(5*12 + 5))
+        self.assertEqual(self.groups.joined, {0, 1, 3, 4})
+        self.assertTrue(self.groups.follow(143))
+        self.assertEqual(self.groups.joined, {4, 5, 7, 8})
+
+class TestMulticastDiscovery(unittest.IsolatedAsyncioTestCase):
+
+    async def startNodes(self, basis):
+        # node 3 is out of range of everyone
+        nodes = [AsyncNode(12, location, 'localhost', basis, 4, i, multicast=True, metrics=True)
+                 for i, location in enumerate([0, 1, 26, 100])]
+        for node in nodes:
+            await node.start()
+        self.addCleanup(lambda: [node.exit() for node in nodes if node.isActive()])
+        return nodes
+
+    async def test_one_announcement_finds_neighbors(self):
+        """Test that nodes on loopback find the nodes in range with one datagram each."""
+        nodes = await self.startNodes(47400)
+        if any(node.groups is None for node in nodes):
+            self.skipTest('multicast not available')
+        self.assertEqual([sorted(node.connectedNeighbors) for node in nodes], [[1, 2], [0, 2], [0, 1], []])
+        self.assertEqual(nodes[0].stats()['types']['Hello?']['sent'], 1)
+        await nodes[2].moveTo(40)
+        await asyncio.sleep(0.05)
+        self.assertEqual(nodes[2].connectedNeighbors, [])
+        self.assertEqual([sorted(node.connectedNeighbors) for node in nodes[:2]], [[1], [0]])
+
+    async def test_falls_back_to_unicast(self):
+        """Test that nodes that can't use multicast send 'Hello?' to every cell instead."""
+        with patch('multicast.Multicast.follow', return_value=False):
+            nodes = await self.startNodes(47450)
+        self.assertEqual([sorted(node.connectedNeighbors) for node in nodes], [[1, 2], [0, 2], [0, 1], []])
+        self.assertGreater(nodes[0].stats()['types']['Hello?']['sent'], 1)
+
+    async def test_unavailable_multicast(self):
+        """Test that a node without multicast at all still discovers its neighbors."""
+        with patch('multicast.Multicast.open', return_value=None):
+            nodes = await self.startNodes(47500)
+        self.assertTrue(all(node.groups is None for node in nodes))
+        self.assertEqual(sorted(nodes[0].connectedNeighbors), [1, 2])
+
+if __name__ == "__main__":
+    unittest.main()
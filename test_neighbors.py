@@ -0,0 +1,55 @@
+import unittest
+from neighbors import NeighborTable
+
+class TestNeighborTable(unittest.TestCase):
+
+    def setUp(self):
+        # 4x4 grid
+        self.table = NeighborTable(4)
+
+    def test_update_and_lookup(self):
+        """Test that neighbors are found by id and by cell."""
+        self.table.update(1, 5)
+        self.table.update(2, 6)
+        self.assertEqual(self.table.get(1), [1, 1, 1, 5])
+        self.assertEqual(self.table.at(6), [1, 2, 2, 6])
+        self.assertIsNone(self.table.at(7))
+        self.assertIn(2, self.table)
+        self.assertEqual(self.table, [[1, 1, 1, 5], [1, 2, 2, 6]])
+
+    def test_update_moves_neighbor(self):
+        """Test that a neighbor seen at a new location leaves its old cell, row and column."""
+        self.table.update(1, 5)
+        self.table.update(1, 10)
+        self.assertEqual(len(self.table), 1)
+        self.assertIsNone(self.table.at(5))
+        self.assertEqual(self.table.inRow(1), [])
+        self.assertEqual(self.table.inColumn(1), [])
+        self.assertEqual(self.table.inRow(2), [[2, 2, 1, 10]])
+
+    def test_remove(self):
+        """Test that removing returns the entry and clears every index."""
+        self.table.update(1, 5)
+        self.assertEqual(self.table.remove(1), [1, 1, 1, 5])
+        self.assertIsNone(self.table.remove(1))
+        self.assertEqual(self.table.byCell, {})
+        self.assertEqual(self.table.byRow, {})
+        self.assertEqual(self.table.byColumn, {})
+
+    def test_row_and_column(self):
+        """Test that the row and column indexes hold exactly the neighbors there."""
+        for id, location in ((1, 0), (2, 1), (3, 4), (4, 5)):
+            self.table.update(id, location)
+        self.assertEqual([entry[2] for entry in self.table.inRow(0)], [1, 2])
+        self.assertEqual([entry[2] for entry in self.table.inColumn(1)], [2, 4])
+        self.assertEqual(self.table.inColumn(3), [])
+
+    def test_cell_taken_over(self):
+        """Test that a stale neighbor leaving doesn't evict the node now in its cell."""
+        self.table.update(1, 5)
+        self.table.update(2, 5)
+        self.table.remove(1)
+        self.assertEqual(self.table.at(5), [1, 1, 2, 5])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,11 +1,19 @@
+import os
+import shutil
+import tempfile
 import unittest
+import asyncio
 from unittest.mock import patch, MagicMock
-from lib import Node
+import random
+import time
+from lib import Node, AsyncNode, ReliableUDPTransport
+from reliable import MAGIC
 
 class TestNode(unittest.TestCase):
 
     def setUp(self):
         """Simplified setup with mocked sockets and listen process."""
+        self.path = tempfile.mkdtemp()
         self.network_size = 5
         self.name = "localhost"
         self.basis_port = 5000
@@ -22,12 +30,14 @@ class TestNode(unittest.TestCase):
                 name=self.name,
                 basis=self.basis_port + self.node_id * 10,
                 numNodes=self.num_nodes,
-                id=self.node_id
+                id=self.node_id,
+                directoryPath=os.path.join(self.path, 'grid')
             )
 
     def tearDown(self):
         if self.node.isActive():
             self.node.exit()
+        shutil.rmtree(self.path)
 
     def test_initialization(self):
         """Test that Node initializes correctly."""
@@ -64,30 +74,52 @@ class TestNode(unittest.TestCase):
 
     def test_snapshot_state_capture(self):
         """Test that a snapshot captures the current state."""
-        self.node.T[self.node.myID] = 10  #Simulate state changes
-        self.node.getSnapshot()
-        snapshot = list(self.node.snapshot)  #Convert to list
-        self.assertGreater(len(snapshot), 0, "Snapshot is empty")  #Snapshot is not empty
-        self.assertEqual(snapshot[self.node.myID], 10)  #Check state is captured
+        for i in range(10):
+            self.node.internalEvent()
+        result = self.node.getSnapshot()
+        self.assertEqual(result.cut[self.node.myID], 10)
+        self.assertEqual(result.nodes[self.node.myID], [0, 10])
+        # nobody else is in the cut yet, so they are missing without a wait
+        self.assertEqual(result.missing, [1, 2])
+        self.assertLess(result.elapsed, 1.0)
 
     def test_snapshot_consistency(self):
         """Test that a snapshot is consistent across events."""
-        self.node.T[self.node.myID] = 5  #Simulate initial state
-        self.node.getSnapshot()
-        snapshot_before = list(self.node.snapshot)  #Convert to list
+        self.node.internalEvent()
+        before = self.node.getSnapshot()
 
-        self.node.T[self.node.myID] = 10  #State change
-        self.node.getSnapshot()
-        snapshot_after = list(self.node.snapshot)
+        self.node.moveRight()
+        self.node.internalEvent()
+        after = self.node.getSnapshot()
+
+        self.assertGreater(after.cut[self.node.myID], before.cut[self.node.myID])
+        self.assertEqual(before.nodes[self.node.myID][0], 0)
+        self.assertEqual(after.nodes[self.node.myID][0], 1)
 
-        self.assertGreater(len(snapshot_after), 0, "Snapshot is empty after state change")  #Snapshot is not empty
-        self.assertNotEqual(snapshot_before, snapshot_after)  #Snapshots reflect changes
-        self.assertEqual(snapshot_after[self.node.myID], 10)  #Verify updated state
+    def test_move_keeps_listener(self):
+        """Test that moving updates the directory instead of restarting the listener."""
+        listener = self.node.transport.listenP
+        self.node.moveRight()
+        self.assertIs(self.node.transport.listenP, listener)
+        self.assertEqual(self.node.myLocation, 1)
+        self.assertEqual(self.node.column, 1)
+        self.assertEqual(self.node.directory.lookup(1), self.node.myPort)
+        self.assertIsNone(self.node.directory.lookup(0))
+
+    def test_hello_connects(self):
+        """Test that a Hello? from a new neighbor updates T, S and the neighbor lists."""
+        self.node.handleMessage(b'Hello?,1,1,0:0:0,0:0:0|0:1:0|0:0:0,0:0:0')
+        self.assertIn(1, list(self.node.connectedNeighbors))
+        self.assertEqual(list(self.node.T), [1, 1, 0])
+        self.assertEqual(self.node.S[0][1], 1)
+        self.assertEqual(self.node.S[1][0], 1)
+        self.assertEqual(list(self.node.L), [1, 1, 0])
 
 class TestNodeNetwork(unittest.TestCase):
 
     def setUp(self):
         """Simplified setup for a small network of nodes."""
+        self.path = tempfile.mkdtemp()
         self.network_size = 5
         self.name = "localhost"
         self.basis_port = 5000
@@ -105,7 +137,8 @@ class TestNodeNetwork(unittest.TestCase):
                     name=self.name,
                     basis=self.basis_port + i * 10,
                     numNodes=self.num_nodes,
-                    id=i
+                    id=i,
+                    directoryPath=os.path.join(self.path, 'grid')
                 )
                 self.nodes.append(node)
 
@@ -113,11 +146,213 @@ class TestNodeNetwork(unittest.TestCase):
         for node in self.nodes:
             if node.isActive():
                 node.exit()
+        shutil.rmtree(self.path)
 
     def test_network_initialization(self):
         """Test that all nodes initialize without errors."""
         for node in self.nodes:
             self.assertTrue(node.isActive())
 
+class TestDeltaEncoding(unittest.TestCase):
+
+    def setUp(self):
+        """Two connected nodes out of a larger id space, with mocked sockets."""
+        self.path = tempfile.mkdtemp()
+        self.num_nodes = 12
+        self.nodes = []
+
+        with patch("lib.socket") as MockSocket, patch("lib.multiprocessing.Process") as MockProcess:
+            self.mock_socket = MockSocket.return_value
+            for i in range(2):
+                self.nodes.append(Node(networkSize=5, location=i, name="localhost", basis=5000, numNodes=self.num_nodes, id=i,
+                                       directoryPath=os.path.join(self.path, 'grid')))
+
+    def tearDown(self):
+        for node in self.nodes:
+            if node.isActive():
+                node.exit()
+        shutil.rmtree(self.path)
+
+    def deliver(self, receiver):
+        """Hand the last datagram any node sent to receiver and return it."""
+        message = self.mock_socket.sendto.call_args[0][0]
+        receiver.handleMessage(message)
+        return message
+
+    def test_external_sends_delta(self):
+        """Test that repeated External messages only carry changed entries but merge the same."""
+        a, b = self.nodes
+        a.send('Hello?', b.myLocation)
+        self.deliver(b)
+        self.deliver(a)
+
+        sizes = []
+        for i in range(2):
+            a.internalEvent()
+            a.externalSend(b.myID)
+            expectedT = [max(x, y) for x, y in zip(a.T, b.T)]
+            expectedT[b.myID] += 1
+            expectedS = [[max(x, y) for x, y in zip(rowA, rowB)] for rowA, rowB in zip(a.S, b.S)]
+            sizes.append(len(self.deliver(b)))
+            self.assertEqual(list(b.T), expectedT)
+            self.assertEqual([list(row) for row in b.S], expectedS)
+        self.assertLess(sizes[1], sizes[0])
+
+class TestJournalRecovery(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def startNode(self):
+        with patch("lib.socket"), patch("lib.multiprocessing.Process"):
+            return Node(networkSize=5, location=0, name="localhost", basis=5000, numNodes=3, id=0,
+                        journal=self.path, checkpointInterval=2, directoryPath=os.path.join(self.path, 'grid'))
+
+    def test_restart_restores_clocks(self):
+        """Test that a node restarted on the same journal picks up its clocks and events."""
+        node = self.startNode()
+        for i in range(5):
+            node.internalEvent()
+        T, S, L = list(node.T), [list(row) for row in node.S], list(node.L)
+        node.exit()
+        node.manager.shutdown()
+
+        node = self.startNode()
+        self.assertEqual(list(node.T), T)
+        self.assertEqual([list(row) for row in node.S], S)
+        self.assertEqual(list(node.L), L)
+        self.assertEqual(len(node.e), 5)
+        node.internalEvent()
+        self.assertEqual(node.T[0], T[0] + 1)
+        node.exit()
+
+class TestAsyncNode(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        """Two nodes sharing one event loop, on real loopback sockets."""
+        self.nodes = [AsyncNode(5, i, "localhost", 47000, 2, i) for i in range(2)]
+        await asyncio.gather(*[node.start() for node in self.nodes])
+
+    async def asyncTearDown(self):
+        for node in self.nodes:
+            if node.isActive():
+                node.exit()
+
+    async def test_nodes_connect_and_exchange(self):
+        """Test that nodes on one loop find each other and exchange messages."""
+        a, b = self.nodes
+        self.assertEqual(a.connectedNeighbors, [1])
+        self.assertEqual(b.connectedNeighbors, [0])
+        self.assertTrue(a.isSymmetric(a.S))
+
+        b.externalSend(0)
+        await asyncio.sleep(0.1)
+        self.assertEqual(a.T[0], b.T[0] + 1)
+
+        await b.moveRight()
+        self.assertEqual(b.myLocation, 2)
+        self.assertEqual(a.activeNeighbors, [[0, 2, 1, 2]])
+
+    async def test_snapshot_returns_early(self):
+        """Test that a snapshot returns as soon as every node answered, with structured results."""
+        a, b = self.nodes
+        result = await a.getSnapshot(timeout=5.0)
+        self.assertTrue(result.isComplete())
+        self.assertEqual(result.missing, [])
+        self.assertEqual(result.nodes, {0: [0, a.L[0]], 1: [1, a.L[1]]})
+        self.assertLess(result.elapsed, 1.0)
+
+class TestFlood(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        """Three nodes in a row where the outer two are out of each other's range."""
+        self.nodes = [AsyncNode(5, 2*i, "localhost", 47100, 3, i) for i in range(3)]
+        await asyncio.gather(*[node.start() for node in self.nodes])
+
+    async def asyncTearDown(self):
+        for node in self.nodes:
+            if node.isActive():
+                node.exit()
+
+    async def test_snapshot_reaches_every_hop(self):
+        """Test that a snapshot request is relayed to nodes out of range and answered along the same path."""
+        a, b, c = self.nodes
+        self.assertEqual(sorted(a.connectedNeighbors), [1])
+        self.assertEqual(sorted(b.connectedNeighbors), [0, 2])
+        # bring c into a's cut
+        b.externalSend(0)
+        await asyncio.sleep(0.1)
+
+        with patch.object(a.transport, "sendto", wraps=a.transport.sendto) as sendto:
+            result = await a.getSnapshot(timeout=5.0)
+        self.assertTrue(result.isComplete())
+        self.assertEqual(sorted(result.nodes), [0, 1, 2])
+        self.assertEqual(result.nodes[2][0], 4)
+        # one request per live link, not one per grid cell
+        self.assertEqual(sendto.call_count, 1)
+        self.assertIn((0, a.floodSeq.value), c.floods)
+
+# drops a share of the framed datagrams that arrive, acks included
+class LossyTransport(ReliableUDPTransport):
+
+    def __init__(self, loss, seed):
+        ReliableUDPTransport.__init__(self)
+        self.loss = loss
+        self.random = random.Random(seed)
+
+    def datagramReceived(self, datagram, address):
+        if datagram[0] == MAGIC and self.random.random() < self.loss:
+            return
+        ReliableUDPTransport.datagramReceived(self, datagram, address)
+
+class TestReliableNode(unittest.TestCase):
+
+    def setUp(self):
+        """Two process nodes over real UDP, losing 10% of what the reliable layer sends."""
+        self.path = tempfile.mkdtemp()
+        self.nodes = [Node(5, i, "localhost", 47300, 2, i, directoryPath=os.path.join(self.path, 'grid'),
+                           transport=LossyTransport(0.1, i)) for i in range(2)]
+
+    def tearDown(self):
+        for node in self.nodes:
+            if node.isActive():
+                node.exit()
+        shutil.rmtree(self.path)
+
+    def test_externals_arrive_despite_loss(self):
+        """Test that every External reaches the other node, acked and retransmitted by the listeners."""
+        a, b = self.nodes
+        self.assertEqual(list(a.connectedNeighbors), [1])
+        for i in range(20):
+            a.externalSend(1)
+        deadline = time.monotonic() + 10.0
+        while b.T[0] < a.T[0] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(b.T[0], a.T[0])
+
+class TestSnapshotOutsideCut(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        """Two nodes of three, the third never shows up."""
+        self.nodes = [AsyncNode(5, i, "localhost", 47200, 3, i) for i in range(2)]
+        await asyncio.gather(*[node.start() for node in self.nodes])
+
+    async def asyncTearDown(self):
+        for node in self.nodes:
+            if node.isActive():
+                node.exit()
+
+    async def test_snapshot_without_node_in_cut(self):
+        """Test that a node the cut has nothing of is missing at once instead of waited for."""
+        a, b = self.nodes
+        self.assertEqual(a.L[2], 0)
+        result = await a.getSnapshot(timeout=5.0)
+        self.assertEqual(result.missing, [2])
+        self.assertEqual(sorted(result.nodes), [0, 1])
+        self.assertLess(result.elapsed, 1.0)
+
 if __name__ == "__main__":
     unittest.main()
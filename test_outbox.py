@@ -0,0 +1,77 @@
+import unittest
+import wire
+from outbox import Outbox
+from loopback import LoopbackNetwork
+from lib import LocalNode
+
+class TestOutbox(unittest.TestCase):
+
+    def setUp(self):
+        self.sent = []
+        self.outbox = Outbox(lambda data, port, reliable: self.sent.append((port, data)), limit=100)
+
+    def test_sends_right_away_outside_batch(self):
+        """Test that without a batch every message goes out immediately and alone."""
+        self.outbox.send(b'one', 1)
+        self.assertEqual(self.sent, [(1, b'one')])
+
+    def test_batch_coalesces_per_port(self):
+        """Test that a batch sends one datagram per destination, in order."""
+        with self.outbox.batch():
+            self.outbox.send(b'one', 1)
+            with self.outbox.batch():
+                self.outbox.send(b'two', 2)
+                self.outbox.send(b'three', 1)
+            self.assertEqual(self.sent, [])
+        self.assertEqual(self.sent, [(1, wire.batch([b'one', b'three'])), (2, b'two')])
+        self.assertEqual(wire.unbatch(self.sent[0][1]), [b'one', b'three'])
+
+    def test_limit(self):
+        """Test that a queue about to pass the size limit is sent early."""
+        with self.outbox.batch():
+            for i in range(3):
+                self.outbox.send(bytes(40), 1)
+            self.assertEqual(len(self.sent), 1)
+        self.assertEqual([len(wire.unbatch(data)) for port, data in self.sent], [2, 1])
+
+    def test_unbatched(self):
+        """Test that waiting inside a batch flushes it and sends straight away until the wait is over."""
+        with self.outbox.batch():
+            self.outbox.send(b'one', 1)
+            with self.outbox.unbatched():
+                self.assertEqual(self.sent, [(1, b'one')])
+                self.outbox.send(b'two', 1)
+                self.assertEqual(len(self.sent), 2)
+            self.outbox.send(b'three', 1)
+            self.assertEqual(len(self.sent), 2)
+        self.assertEqual(self.sent[2], (1, b'three'))
+
+    def test_best_effort_batched_apart(self):
+        """Test that messages that needn't be reliable don't share a datagram with ones that must."""
+        sent = []
+        outbox = Outbox(lambda data, port, reliable: sent.append((port, data, reliable)))
+        with outbox.batch():
+            outbox.send(b'one', 1)
+            outbox.send(b'two', 1, reliable=False)
+            outbox.send(b'three', 1)
+        self.assertEqual(sent, [(1, wire.batch([b'one', b'three']), True), (1, b'two', False)])
+
+class TestNodeBatching(unittest.TestCase):
+
+    def test_batched_externals(self):
+        """Test that messages sent in node.batch() arrive in one datagram and are all handled."""
+        network = LoopbackNetwork()
+        a = LocalNode(5, 0, 'sim', 0, 2, 0, network.transport())
+        b = LocalNode(5, 1, 'sim', 0, 2, 1, network.transport())
+        sent = network.sent
+        before = a.T[0]
+        with b.batch():
+            for i in range(5):
+                b.externalSend(0)
+        network.run()
+        self.assertEqual(network.sent, sent + 1)
+        self.assertEqual(a.T[1], b.T[1])
+        self.assertEqual(a.T[0], before + 5)
+
+if __name__ == '__main__':
+    unittest.main()
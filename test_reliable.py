@@ -0,0 +1,160 @@
+import time
+import unittest
+from unittest.mock import patch
+from loopback import LoopbackNetwork
+from reliable import ReliableTransport, Timers, MAX_RETRIES
+from lib import LocalNode
+
+class TestReliableTransport(unittest.TestCase):
+
+    def setUp(self):
+        self.received = []
+
+    def endpoints(self, network, **kwargs):
+        a = ReliableTransport(network.transport(), **kwargs)
+        b = ReliableTransport(network.transport())
+        a.open(1, lambda datagram, address: None)
+        b.open(2, lambda datagram, address: self.received.append(datagram))
+        return a, b
+
+    def test_in_order_exactly_once_under_loss(self):
+        """Test that datagrams arrive once each and in order despite loss and reordering."""
+        network = LoopbackNetwork(latency=0.001, jitter=0.01, loss=0.3, seed=5)
+        a, b = self.endpoints(network)
+        for k in range(200):
+            a.sendto(k.to_bytes(2, 'little'), ('loopback', 2))
+        network.run()
+        self.assertEqual([int.from_bytes(d, 'little') for d in self.received], list(range(200)))
+        self.assertGreater(a.retransmitted, 0)
+        self.assertEqual(a.gaveUp, 0)
+        self.assertFalse(a.channels[('loopback', 2)].inFlight)
+
+    def test_window_limits_datagrams_in_flight(self):
+        """Test that no more than window datagrams wait for an ack and the rest queue."""
+        network = LoopbackNetwork(latency=0.01)
+        a, b = self.endpoints(network, window=4)
+        for k in range(10):
+            a.sendto(bytes([k]), ('loopback', 2))
+        channel = a.channels[('loopback', 2)]
+        self.assertEqual(len(channel.inFlight), 4)
+        self.assertEqual(len(channel.waiting), 6)
+        network.run()
+        self.assertEqual(self.received, [bytes([k]) for k in range(10)])
+        self.assertEqual(a.retransmitted, 0)
+        self.assertIsNotNone(channel.srtt)
+
+    def test_gives_up_and_starts_new_session(self):
+        """Test that an unreachable peer is given up on and a later datagram still gets through."""
+        network = LoopbackNetwork(latency=0.001)
+        a, b = self.endpoints(network)
+        a.sendto(b'lost', ('loopback', 3))
+        network.run()
+        self.assertEqual(a.gaveUp, 1)
+        self.assertEqual(a.retransmitted, MAX_RETRIES)
+        self.assertNotIn(('loopback', 3), a.channels)
+        a.sendto(b'one', ('loopback', 2))
+        network.run()
+        first = a.channels[('loopback', 2)].session
+        a.channels.clear()
+        a.sendto(b'two', ('loopback', 2))
+        network.run()
+        self.assertGreater(a.channels[('loopback', 2)].session, first)
+        self.assertEqual(self.received, [b'one', b'two'])
+
+    def test_restarted_sender_is_heard(self):
+        """Test that a sender restarted on the same address starts a session its peer takes as new."""
+        network = LoopbackNetwork(latency=0.001)
+        a, b = self.endpoints(network)
+        for k in range(3):
+            a.sendto(bytes([k]), ('loopback', 2))
+        network.run()
+        a.close()
+        # a new process a second later, which knows nothing of the sessions before
+        with patch('reliable.lastSession', 0), patch('reliable.time.time', return_value=time.time() + 1):
+            restarted = ReliableTransport(network.transport())
+            restarted.open(1, lambda datagram, address: None)
+            restarted.sendto(b'again', ('loopback', 2))
+        network.run()
+        self.assertEqual(self.received, [bytes([k]) for k in range(3)] + [b'again'])
+        self.assertEqual(restarted.gaveUp, 0)
+        self.assertFalse(restarted.channels[('loopback', 2)].inFlight)
+
+    def test_plain_datagrams_pass_through(self):
+        """Test that datagrams that aren't framed (best effort broadcasts) are delivered as they are."""
+        network = LoopbackNetwork()
+        a, b = self.endpoints(network)
+        plain = network.transport()
+        plain.open(3, lambda datagram, address: None)
+        plain.sendto(b'\xd1plain', ('loopback', 2))
+        network.run()
+        self.assertEqual(self.received, [b'\xd1plain'])
+
+class TestTimers(unittest.TestCase):
+
+    def test_due_in_order_unless_cancelled(self):
+        """Test that timers run in the order they are due and cancelled ones don't run."""
+        now = [0.0]
+        timers = Timers(lambda: now[0])
+        calls = []
+        self.assertIsNone(timers.wait())
+        timers.schedule(0.2, lambda: calls.append('late'))
+        timers.schedule(0.1, lambda: calls.append('early'))
+        cancelled = timers.schedule(0.05, lambda: calls.append('cancelled'))
+        cancelled.cancel()
+        self.assertAlmostEqual(timers.wait(), 0.1)
+        timers.run()
+        self.assertEqual(calls, [])
+        now[0] = 0.15
+        timers.run()
+        self.assertEqual(calls, ['early'])
+        now[0] = 0.3
+        self.assertEqual(timers.wait(), 0)
+        timers.run()
+        self.assertEqual(calls, ['early', 'late'])
+        self.assertIsNone(timers.wait())
+
+class TestReliableNodes(unittest.TestCase):
+
+    def test_links_consistent_under_loss(self):
+        """Test that nodes over a lossy network agree on their links when the layer is used."""
+        network = LoopbackNetwork(latency=0.001, jitter=0.002, loss=0.1, seed=3)
+        locations = [0, 1, 2, 5, 6, 7, 10, 11, 12]
+        nodes = [LocalNode(5, location, 'sim', 0, len(locations), i,
+                           ReliableTransport(network.transport()))
+                 for i, location in enumerate(locations)]
+        network.run()
+        for node in nodes:
+            for peer in list(node.connectedNeighbors):
+                node.externalSend(peer)
+        nodes[8].moveRight()
+        network.run()
+        for p, node in enumerate(nodes):
+            for q, other in enumerate(nodes):
+                if p != q:
+                    self.assertEqual(q in node.connectedNeighbors, p in other.connectedNeighbors)
+
+    def test_broadcasts_to_empty_cells_are_not_retransmitted(self):
+        """Test that 'Hello?' and 'Exiting' to cells nobody is in go out once and aren't retried."""
+        network = LoopbackNetwork(latency=0.001)
+        # like the file directory, cells nobody registered resolve to a port
+        directory = network.directory(8, 0)
+        for cell in range(64):
+            directory.register(cell, 1000 + cell)
+        transports = [ReliableTransport(network.transport()) for i in range(2)]
+        a = LocalNode(8, 9, 'sim', 0, 2, 0, transports[0])
+        b = LocalNode(8, 12, 'sim', 0, 2, 1, transports[1])
+        sent = network.sent
+        a.moveRight()
+        network.run()
+        self.assertEqual(a.connectedNeighbors, [1])
+        self.assertEqual(b.connectedNeighbors, [0])
+        a.exit()
+        network.run()
+        self.assertEqual(b.connectedNeighbors, [])
+        self.assertEqual([transport.retransmitted for transport in transports], [0, 0])
+        self.assertEqual([transport.gaveUp for transport in transports], [0, 0])
+        # a 'Hello?' and an 'Exiting' per cell, and the handshakes
+        self.assertLess(network.sent - sent, 2*24 + 10)
+
+if __name__ == "__main__":
+    unittest.main()
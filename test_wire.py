@@ -0,0 +1,70 @@
+import unittest
+import wire
+
+class TestWire(unittest.TestCase):
+
+    def setUp(self):
+        self.T = [3, 0, 7]
+        self.S = [[1, 1, 0], [1, 1, 0], [0, 0, 2]]
+        self.L = [3, 0, 0]
+
+    def test_binary_round_trip(self):
+        """Test that every message type survives binary encoding."""
+        for msgType in ['Hello?', 'Hello', 'Goodbye', 'Exiting', 'External', 'Snapshot?', 'Snapshot|12', 'Snapshot?|3|7', 'Snapshot|3|7|1:12|2:4', 'Test message']:
+            data = wire.encode(msgType, 4, 2, self.T, self.S, self.L)
+            self.assertEqual(wire.decode(data), (msgType, 4, 2, self.T, self.S, self.L))
+
+    def test_text_round_trip(self):
+        """Test that the text format is still understood."""
+        data = wire.encode('Hello?', 4, 2, self.T, self.S, self.L, 'text')
+        self.assertEqual(data, b'Hello?,4,2,3:0:7,1:1:0|1:1:0|0:0:2,3:0:0')
+        self.assertEqual(wire.decode(data), ('Hello?', 4, 2, self.T, self.S, self.L))
+
+    def test_binary_is_smaller(self):
+        """Test that small clocks take one byte per entry."""
+        binary = wire.encode('External', 4, 2, self.T, self.S, self.L)
+        text = wire.encode('External', 4, 2, self.T, self.S, self.L, 'text')
+        self.assertLess(len(binary), len(text))
+
+    def test_delta_and_missing_sections(self):
+        """Test that deltas decode as zero-filled clocks and omitted sections as None."""
+        data = wire.encode('External', 4, 2, {2: 300}, {(0, 1): 5}, None, size=3)
+        self.assertEqual(wire.decode(data), ('External', 4, 2, [0, 0, 300], [[0, 5, 0], [0, 0, 0], [0, 0, 0]], None))
+        data = wire.encode('Goodbye', 4, 2, None, None, None, size=3)
+        self.assertEqual(wire.decode(data), ('Goodbye', 4, 2, None, None, None))
+
+    def test_large_message_is_fragmented(self):
+        """Test that messages bigger than a datagram are split and reassembled."""
+        n = 200
+        T = [300]*n
+        S = [[i + j for j in range(n)] for i in range(n)]
+        L = [0]*n
+        data = wire.encode('External', 1, 0, T, S, L)
+        datagrams = wire.fragment(data)
+        self.assertGreater(len(datagrams), 1)
+        for datagram in datagrams:
+            self.assertLessEqual(len(datagram), wire.MAX_DATAGRAM)
+
+        reassembler = wire.Reassembler()
+        results = [reassembler.add(datagram, ('127.0.0.1', 1)) for datagram in reversed(datagrams)]
+        self.assertEqual(results[:-1], [None] * (len(datagrams) - 1))
+        self.assertEqual(wire.decode(results[-1]), ('External', 1, 0, T, S, L))
+
+    def test_malformed_message(self):
+        """Test that garbage raises WireError instead of crashing the listener."""
+        with self.assertRaises(wire.WireError):
+            wire.decode(b'Hello?,1')
+        with self.assertRaises(wire.WireError):
+            wire.decode(wire.encode('Hello', 0, 0, self.T, self.S, self.L)[:-1])
+
+    def test_batch(self):
+        """Test that batched messages come back out in order and truncated batches are refused."""
+        messages = [wire.encode('External', 4, 2, self.T, self.S, self.L), b'', wire.encode('Goodbye', 4, 2, None, None, None)]
+        data = wire.batch(messages)
+        self.assertEqual(wire.unbatch(data), messages)
+        self.assertEqual(wire.unbatch(messages[0]), [messages[0]])
+        with self.assertRaises(wire.WireError):
+            wire.unbatch(data[:-1])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+from loopback import LoopbackNetwork
+from lib import LocalNode
+from workload import Completion, parseScript, runScript, launch, launchLocation, summarize
+
+class TestScript(unittest.TestCase):
+
+    def test_parse_delays_and_ids(self):
+        """Test that delays add up and lines without an id are for every node."""
+        steps = parseScript(['# warm up', '', 'internal', '+0.5 1 external 0', '+0.25 move-up', '2 snapshot'])
+        self.assertEqual([(step.due, step.id, step.command) for step in steps],
+                         [(0.0, None, 'internal'), (0.5, 1, 'external 0'), (0.75, None, 'move-up'),
+                          (0.75, 2, 'snapshot')])
+        self.assertTrue(steps[0].isFor(5))
+        self.assertFalse(steps[1].isFor(0))
+
+    def test_parse_errors(self):
+        """Test that bad delays and lines without a command are refused with their line number."""
+        with self.assertRaisesRegex(ValueError, 'line 2'):
+            parseScript(['internal', '+soon internal'])
+        with self.assertRaisesRegex(ValueError, 'line 1'):
+            parseScript(['+1 3'])
+
+    def test_launch_locations(self):
+        """Test that launched nodes fill a block from the corner and must fit the grid."""
+        self.assertEqual([launchLocation(i, 5, 8) for i in range(5)], [0, 1, 2, 8, 9])
+        with self.assertRaises(ValueError):
+            launch(10, [], 3, 'localhost', 0)
+
+    def test_summary(self):
+        """Test the count and percentiles per command word."""
+        completions = [Completion(0, 0, 'external %d' % i, i / 100) for i in range(1, 101)]
+        completions.append(Completion(0, 0, 'internal', 0.5))
+        summary = summarize(completions)
+        self.assertEqual(sorted(summary), ['external', 'internal'])
+        self.assertEqual(summary['external']['count'], 100)
+        self.assertAlmostEqual(summary['external']['mean'], 0.505)
+        self.assertEqual(summary['external']['p50'], 0.51)
+        self.assertEqual(summary['external']['p99'], 1.0)
+        self.assertEqual(summary['internal']['max'], 0.5)
+
+class TestRunScript(unittest.TestCase):
+
+    def test_steps_run_when_due(self):
+        """Test that a node on a loopback network runs its lines in order, each when it is due."""
+        network = LoopbackNetwork()
+        a, b = [LocalNode(5, location, 'sim', 0, 2, i, network.transport()) for i, location in enumerate([0, 1])]
+        steps = parseScript(['+1 0 external 1', '1 internal', '+2 move-down', '0 internal'])
+        transport = network.transport()
+        completions = runScript(a, steps, clock=transport.clock, sleep=transport.wait)
+        self.assertEqual([(c.due, c.command) for c in completions],
+                         [(1.0, 'external 1'), (3.0, 'move-down'), (3.0, 'internal')])
+        self.assertGreaterEqual(network.now, 3.0)
+        self.assertEqual(a.myLocation, 5)
+        self.assertEqual(b.T[0], 2)
+
+    def test_fast_and_exit(self):
+        """Test that fast runs don't wait and nothing runs after the node exits."""
+        network = LoopbackNetwork()
+        a = LocalNode(5, 0, 'sim', 0, 1, 0, network.transport())
+        transport = network.transport()
+        steps = parseScript(['+10 internal', 'exit', 'internal'])
+        completions = runScript(a, steps, fast=True, clock=transport.clock, sleep=transport.wait)
+        self.assertEqual([c.command for c in completions], ['internal', 'exit'])
+        self.assertLess(network.now, 10)
+
+class TestLaunch(unittest.TestCase):
+
+    def test_nodes_across_workers(self):
+        """Test that launched nodes in two workers reach each other and report every command."""
+        steps = parseScript(['internal', '0 external 3', '3 external 0', '+0.1 1 move-to 10'])
+        completions = launch(4, steps, 6, 'localhost', 47700, workers=2, fast=True)
+        self.assertEqual(sorted((c.id, c.command) for c in completions),
+                         [(0, 'external 3'), (0, 'internal'), (1, 'internal'), (1, 'move-to 10'),
+                          (2, 'internal'), (3, 'external 0'), (3, 'internal')])
+        self.assertTrue(all(c.elapsed >= 0 for c in completions))
+
+if __name__ == "__main__":
+    unittest.main()
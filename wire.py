@@ -0,0 +1,326 @@
+import sys
+import struct
+import random
+from array import array
+from clocks import SparseVector, SparseMatrix
+
+# Encoding of the messages nodes exchange.
+#
+# Binary format (version 2), all integers little-endian:
+#   header  magic B, version B, type code B, width B, flags B, location I,
+#           id I, n I
+#   arg     length H followed by that many utf-8 bytes (e.g. everything
+#           after 'Snapshot|', empty for most messages)
+#   body    the sections T (n values), S (n*n values, row-major) and L
+#           (n values), in that order, each only if its flag is set
+# A section may instead be a delta: count I, then `count` indices as I
+# (flat row-major indices for S) and `count` values. Entries that are not
+# listed decode as 0, which leaves the receiver's max() merge unchanged.
+# Deltas decode as a SparseVector or SparseMatrix (see clocks.py), so a
+# receiver never has to expand them. Nodes with sparse clocks send every
+# section this way, as a delta against all zeros.
+# Every value is stored in `width` bytes, the smallest of 1, 2, 4 or 8
+# that fits them all, so a small grid early in its life costs one byte per
+# entry.
+#
+# Messages larger than MAX_DATAGRAM are split into fragments. Each fragment
+# is a datagram of its own with header
+#   magic B, version B, message id I, index H, count H
+# followed by a slice of the encoded message. Reassembler puts them back
+# together on the receiving side.
+#
+# Several small messages for the same node can share a datagram (see
+# outbox.py). A batch is
+#   magic B, version B, count H
+# followed by `count` messages, each as length I and then the message.
+#
+# The text format is the original 'type,location,id,T,S,L' string with
+# ':' between values and '|' between rows of S. decode() accepts both,
+# so nodes using either format can talk to each other.
+
+VERSION = 2
+MAGIC = 0xD1
+FRAGMENT_MAGIC = 0xD2
+BATCH_MAGIC = 0xD3
+
+# largest datagram we ever hand to sendto (the UDP limit is 65507)
+MAX_DATAGRAM = 60000
+# largest datagram we are prepared to receive
+RECEIVE_SIZE = 65535
+# partially received messages kept around at once
+MAX_PENDING = 64
+
+TYPES = ['', 'Hello?', 'Hello', 'Goodbye', 'Exiting', 'External', 'Snapshot?', 'Snapshot|', 'Snapshot?|']
+TYPE_CODES = dict((name, code) for code, name in enumerate(TYPES))
+
+HEADER = struct.Struct('<BBBBBIII')
+ARG_LENGTH = struct.Struct('<H')
+COUNT = struct.Struct('<I')
+
+# flags: which sections are present and which of them are deltas
+HAS_T = 1
+HAS_S = 2
+HAS_L = 4
+DELTA_T = 8
+DELTA_S = 16
+DELTA_L = 32
+FRAGMENT_HEADER = struct.Struct('<BBIHH')
+BATCH_HEADER = struct.Struct('<BBH')
+BATCH_LENGTH = struct.Struct('<I')
+
+# array typecode for each value width
+WIDTHS = {}
+for typecode in 'BHILQ':
+    WIDTHS.setdefault(array(typecode).itemsize, typecode)
+
+class WireError(Exception):
+    pass
+
+# smallest width (in bytes) that fits every value
+def valueWidth(largest):
+    if largest < 1 << 8:
+        return 1
+    if largest < 1 << 16:
+        return 2
+    if largest < 1 << 32:
+        return 4
+    return 8
+
+def packValues(values, width):
+    data = array(WIDTHS[width], values)
+    if width > 1 and sys.byteorder == 'big':
+        data.byteswap()
+    return data.tobytes()
+
+def unpackValues(data, width):
+    values = array(WIDTHS[width])
+    values.frombytes(data)
+    if width > 1 and sys.byteorder == 'big':
+        values.byteswap()
+    return values.tolist()
+
+# encode a message in the binary format
+# T, S and L may each be None (left out), a full vector/matrix, or a dict
+# of changed entries ({index: value} for T and L, {(i, j): value} for S).
+# size is the number of nodes and is only needed when nothing is full
+def encodeBinary(msgType, location, id, T, S, L, size=None):
+    name, sep, arg = msgType.partition('|')
+    code = TYPE_CODES.get(name + sep, 0)
+    if code == 0:
+        arg = msgType
+    arg = arg.encode()
+
+    flags = 0
+    n = size
+    # (is delta, indices, values) for each section that is present
+    sections = []
+    for section, present, delta in ((T, HAS_T, DELTA_T), (S, HAS_S, DELTA_S), (L, HAS_L, DELTA_L)):
+        if section is None:
+            continue
+        flags |= present
+        if isinstance(section, dict):
+            flags |= delta
+            if section is S:
+                indices = [i*n + j for (i, j) in section]
+            else:
+                indices = list(section)
+            sections.append((True, indices, list(section.values())))
+        elif section is S:
+            sections.append((False, None, [x for row in S for x in row]))
+            n = len(S)
+        else:
+            values = list(section)
+            sections.append((False, None, values))
+            n = len(values)
+    if n is None:
+        n = 0
+
+    largest = 0
+    for isDelta, indices, values in sections:
+        if values:
+            largest = max(largest, max(values))
+    width = valueWidth(largest)
+
+    parts = [HEADER.pack(MAGIC, VERSION, code, width, flags, location, id, n), ARG_LENGTH.pack(len(arg)), arg]
+    for isDelta, indices, values in sections:
+        if isDelta:
+            parts.append(COUNT.pack(len(indices)))
+            parts.append(packValues(indices, 4))
+        parts.append(packValues(values, width))
+    return b''.join(parts)
+
+def decodeBinary(data):
+    if len(data) < HEADER.size + ARG_LENGTH.size:
+        raise WireError('truncated header')
+    magic, version, code, width, flags, location, id, n = HEADER.unpack_from(data)
+    if version != VERSION:
+        raise WireError('unsupported version ' + str(version))
+    if code >= len(TYPES) or width not in WIDTHS:
+        raise WireError('malformed header')
+
+    offset = HEADER.size
+    argLength = ARG_LENGTH.unpack_from(data, offset)[0]
+    offset += ARG_LENGTH.size
+    arg = data[offset:offset + argLength].decode()
+    offset += argLength
+    msgType = arg if code == 0 else TYPES[code] + arg
+
+    # T, S (flattened) and L, None when absent
+    sections = []
+    for present, delta, length in ((HAS_T, DELTA_T, n), (HAS_S, DELTA_S, n*n), (HAS_L, DELTA_L, n)):
+        if not flags & present:
+            sections.append(None)
+            continue
+        if flags & delta:
+            if len(data) < offset + COUNT.size:
+                raise WireError('truncated delta')
+            count = COUNT.unpack_from(data, offset)[0]
+            offset += COUNT.size
+            indices = unpackValues(data[offset:offset + 4*count], 4)
+            offset += 4*count
+            values = unpackValues(data[offset:offset + width*count], width)
+            offset += width*count
+            if len(indices) != count or len(values) != count:
+                raise WireError('truncated delta')
+            if indices and max(indices) >= length:
+                raise WireError('delta index out of range')
+            if present == HAS_S:
+                section = SparseMatrix(n)
+                for index, value in zip(indices, values):
+                    section.setCell(index // n, index % n, value)
+            else:
+                section = SparseVector(n)
+                for index, value in zip(indices, values):
+                    section[index] = value
+            sections.append(section)
+        else:
+            values = unpackValues(data[offset:offset + width*length], width)
+            offset += width*length
+            if len(values) != length:
+                raise WireError('truncated section')
+            sections.append(values)
+    if offset != len(data):
+        raise WireError('body does not match header')
+
+    T, S, L = sections
+    if S is not None and not isinstance(S, SparseMatrix):
+        S = [S[i*n:(i+1)*n] for i in range(n)]
+    return msgType, location, id, T, S, L
+
+# converts a matrix to a string for sending purposes
+def matrixToStr(matrix):
+    return '|'.join(':'.join(map(str, row)) for row in matrix)
+
+# encode a message in the original text format
+def encodeText(msgType, location, id, T, S, L):
+    return (msgType+','+str(location)+','+str(id)+','+':'.join(map(str, T))+','+matrixToStr(S)+','+':'.join(map(str, L))).encode()
+
+def decodeText(data):
+    msgSplit = data.decode().split(',')
+    if len(msgSplit) != 6:
+        raise WireError('expected 6 fields, got ' + str(len(msgSplit)))
+    msgType = msgSplit[0]
+    senderLocation = int(msgSplit[1])
+    senderID = int(msgSplit[2])
+    senderT = [int(x) for x in msgSplit[3].split(':')]
+    senderS = []
+    for row in msgSplit[4].split('|'):
+        senderS.append([int(x) for x in row.split(':')])
+    senderL = [int(x) for x in msgSplit[5].split(':')]
+    return msgType, senderLocation, senderID, senderT, senderS, senderL
+
+# encode a message in the given format ('binary' or 'text')
+# the text format always needs full T, S and L
+def encode(msgType, location, id, T, S, L, wireFormat='binary', size=None):
+    if wireFormat == 'text':
+        return encodeText(msgType, location, id, T, S, L)
+    return encodeBinary(msgType, location, id, T, S, L, size)
+
+# decode a complete message in either format
+# returns (msgType, location, id, T, S, L)
+def decode(data):
+    if not data:
+        raise WireError('empty message')
+    try:
+        if data[0] == MAGIC:
+            return decodeBinary(data)
+        return decodeText(data)
+    except ValueError as error:
+        raise WireError(str(error))
+
+# split an encoded message into datagrams no larger than MAX_DATAGRAM
+def fragment(data):
+    if len(data) <= MAX_DATAGRAM:
+        return [data]
+    chunkSize = MAX_DATAGRAM - FRAGMENT_HEADER.size
+    count = (len(data) + chunkSize - 1) // chunkSize
+    if count > 0xFFFF:
+        raise WireError('message too large')
+    messageID = random.getrandbits(32)
+    return [FRAGMENT_HEADER.pack(FRAGMENT_MAGIC, VERSION, messageID, i, count) + data[i*chunkSize:(i+1)*chunkSize]
+            for i in range(count)]
+
+# put several encoded messages into one datagram
+def batch(messages):
+    parts = [BATCH_HEADER.pack(BATCH_MAGIC, VERSION, len(messages))]
+    for message in messages:
+        parts.append(BATCH_LENGTH.pack(len(message)))
+        parts.append(message)
+    return b''.join(parts)
+
+# the messages in a datagram made by batch(), anything else is one message
+def unbatch(data):
+    if not data or data[0] != BATCH_MAGIC:
+        return [data]
+    if len(data) < BATCH_HEADER.size:
+        raise WireError('truncated batch')
+    magic, version, count = BATCH_HEADER.unpack_from(data)
+    if version != VERSION:
+        raise WireError('unsupported version ' + str(version))
+    messages = []
+    offset = BATCH_HEADER.size
+    for i in range(count):
+        if len(data) < offset + BATCH_LENGTH.size:
+            raise WireError('truncated batch')
+        length = BATCH_LENGTH.unpack_from(data, offset)[0]
+        offset += BATCH_LENGTH.size
+        if len(data) < offset + length:
+            raise WireError('truncated batch')
+        messages.append(data[offset:offset + length])
+        offset += length
+    if offset != len(data):
+        raise WireError('batch does not match header')
+    return messages
+
+# collects fragments until a whole message has arrived
+class Reassembler():
+
+    def __init__(self):
+        # (sender address, message id) -> list of chunks
+        self.pending = {}
+
+    # returns the complete message once its last fragment arrives, else None
+    # datagrams that are not fragments are complete messages already
+    def add(self, datagram, senderAddr):
+        if not datagram or datagram[0] != FRAGMENT_MAGIC:
+            return datagram
+        if len(datagram) < FRAGMENT_HEADER.size:
+            raise WireError('truncated fragment')
+        magic, version, messageID, index, count = FRAGMENT_HEADER.unpack_from(datagram)
+        if index >= count:
+            raise WireError('fragment index out of range')
+
+        key = (senderAddr, messageID)
+        chunks = self.pending.get(key)
+        if chunks is None:
+            if len(self.pending) >= MAX_PENDING:
+                # give up on the oldest incomplete message
+                del self.pending[next(iter(self.pending))]
+            chunks = self.pending[key] = [None] * count
+        if len(chunks) != count:
+            raise WireError('fragment count changed')
+        chunks[index] = datagram[FRAGMENT_HEADER.size:]
+        if None in chunks:
+            return None
+        del self.pending[key]
+        return b''.join(chunks)
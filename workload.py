@@ -0,0 +1,268 @@
+import math
+import time
+import asyncio
+import inspect
+import multiprocessing
+from lib import AsyncNode
+from metrics import formatReport
+
+# Scripted workloads for node.py, so nobody has to sit at a terminal per
+# node to put load on a grid.
+#
+# A script has the commands node.py reads from the terminal, one per
+# line, each optionally preceded by how many seconds after the previous
+# line it is due and by the id of the node that runs it:
+#
+#   [+SECONDS] [ID] COMMAND
+#
+#   +0.5 3 move-up       node 3 moves up half a second after the last line
+#   2 external 3         node 2 sends to node 3 right after that
+#   internal             every node has an internal event
+#
+# Blank lines and lines starting with '#' are skipped. A node runs its
+# lines in order, each when it is due or once the node's previous command
+# is done, whichever is later. With fast=True nobody waits for lines to
+# be due, which replays a trace as fast as the nodes can go.
+#
+# Every command that runs gives a Completion with how long it took.
+# launch() starts a whole grid of AsyncNodes in a pool of worker
+# processes, each running the lines of the nodes it hosts.
+
+# run a single command, returns whatever the node method returned
+# (AsyncNode methods that wait on the network return a coroutine)
+def runCommand(me, command):
+    commandArr = command.split(' ')
+
+    if commandArr[0] == 'print':
+        if len(commandArr) == 1:
+            print("Make sure to include print arguments")
+            return
+        optionsArr = commandArr[1].split(',')
+        # N is the cells around us, G the whole grid
+        if 'N' in optionsArr:
+            me.printNetwork()
+        if 'G' in optionsArr:
+            me.printNetwork(None)
+        if 'T' in optionsArr:
+            me.printT()
+        if 'L' in optionsArr:
+            me.printL()
+        if 'S' in optionsArr:
+            me.printS()
+        if 'E' in optionsArr:
+            me.printE()
+    elif commandArr[0] == 'internal':
+        return me.internalEvent()
+    elif commandArr[0] == 'external':
+        if len(commandArr) == 1:
+            print("Make sure to include destination node")
+            return
+        return me.externalSend(int(commandArr[1]))
+    elif commandArr[0] == 'snapshot':
+        return me.getSnapshot()
+    elif commandArr[0] == 'move-up':
+        return me.moveUp()
+    elif commandArr[0] == 'move-down':
+        return me.moveDown()
+    elif commandArr[0] == 'move-left':
+        return me.moveLeft()
+    elif commandArr[0] == 'move-right':
+        return me.moveRight()
+    elif commandArr[0] == 'move-to':
+        if len(commandArr) == 1:
+            print("Make sure to include destination cell")
+            return
+        return me.moveTo(int(commandArr[1]))
+    elif commandArr[0] == 'move-path':
+        if len(commandArr) == 1:
+            print("Make sure to include the cells, separated by commas")
+            return
+        return me.movePath([int(cell) for cell in commandArr[1].split(',')])
+    elif commandArr[0] == 'stats':
+        stats = me.stats()
+        if stats is None:
+            print('Metrics are off')
+        else:
+            print(formatReport(stats))
+    elif commandArr[0] == 'exit':
+        return me.exit()
+    else:
+        print('Command not recognized')
+
+# one line of a script: when it is due (seconds from the start), the id
+# of the node that runs it (None for every node) and the command
+class Step():
+
+    def __init__(self, due, id, command):
+        self.due = due
+        self.id = id
+        self.command = command
+
+    def isFor(self, id):
+        return self.id is None or self.id == id
+
+    def __repr__(self):
+        return 'Step(%r, %r, %r)' % (self.due, self.id, self.command)
+
+# a command that has run: when it was due, which node ran it, the command,
+# and the seconds from when it started to when it was done
+class Completion():
+
+    def __init__(self, due, id, command, elapsed):
+        self.due = due
+        self.id = id
+        self.command = command
+        self.elapsed = elapsed
+
+    def __repr__(self):
+        return '%8.3f  %4d  %-20s  %10.2f ms' % (self.due, self.id, self.command, self.elapsed * 1e3)
+
+# the Steps of a script, from its lines
+def parseScript(lines):
+    steps = []
+    due = 0.0
+    for number, line in enumerate(lines, 1):
+        words = line.split()
+        if not words or words[0].startswith('#'):
+            continue
+        if words[0].startswith('+'):
+            try:
+                due += float(words.pop(0)[1:])
+            except ValueError:
+                raise ValueError('line %d: bad delay' % number)
+        id = None
+        if words and words[0].isdigit():
+            id = int(words.pop(0))
+        if not words:
+            raise ValueError('line %d: no command' % number)
+        steps.append(Step(due, id, ' '.join(words)))
+    return steps
+
+def readScript(path):
+    with open(path) as f:
+        return parseScript(f)
+
+# run the steps for node `me` in this thread, for nodes whose commands
+# return once they are done (Node, LocalNode); clock and sleep are the
+# node's for LocalNodes on a simulated network
+def runScript(me, steps, fast=False, clock=time.monotonic, sleep=time.sleep):
+    start = clock()
+    completions = []
+    for step in steps:
+        if not step.isFor(me.myID):
+            continue
+        if not me.isActive():
+            break
+        wait = start + step.due - clock()
+        if not fast and wait > 0:
+            sleep(wait)
+        began = clock()
+        runCommand(me, step.command)
+        completions.append(Completion(step.due, me.myID, step.command, clock() - began))
+    return completions
+
+# the same for an AsyncNode, on its event loop
+async def runScriptAsync(me, steps, fast=False):
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    completions = []
+    for step in steps:
+        if not step.isFor(me.myID):
+            continue
+        if not me.isActive():
+            break
+        wait = start + step.due - loop.time()
+        if not fast and wait > 0:
+            await asyncio.sleep(wait)
+        began = loop.time()
+        result = runCommand(me, step.command)
+        if inspect.isawaitable(result):
+            await result
+        completions.append(Completion(step.due, me.myID, step.command, loop.time() - began))
+    return completions
+
+# cell of the i-th of count launched nodes: they fill a square block from
+# the top left corner, so everyone is connected to someone
+def launchLocation(i, count, networkSize):
+    side = math.ceil(math.sqrt(count))
+    return (i // side) * networkSize + i % side
+
+# start nodes 0..count-1 across `workers` processes and run the steps,
+# returns the Completions of every node, in the order they were due
+# nodeOptions go to every AsyncNode (multicast=True, reliable=True, ...)
+def launch(count, steps, networkSize, host, basis, workers=None, fast=False, **nodeOptions):
+    if math.ceil(math.sqrt(count)) > networkSize:
+        raise ValueError('%d nodes do not fit in a %dx%d grid' % (count, networkSize, networkSize))
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    workers = max(min(workers, count), 1)
+    # everyone starts the script together, and stays up until everyone is
+    # done with it, so nobody's commands find their neighbors gone
+    barrier = multiprocessing.Barrier(workers)
+    results = multiprocessing.Queue()
+    processes = []
+    for w in range(workers):
+        ids = list(range(w, count, workers))
+        process = multiprocessing.Process(target=runWorker, args=(ids, count, steps, networkSize, host, basis,
+                                                                  fast, nodeOptions, barrier, results))
+        process.start()
+        processes.append(process)
+    completions = []
+    for process in processes:
+        completions.extend(results.get())
+    for process in processes:
+        process.join()
+    completions.sort(key=lambda completion: (completion.due, completion.id))
+    return completions
+
+# one worker process of launch(), hosting the nodes in ids on one loop
+def runWorker(ids, count, steps, networkSize, host, basis, fast, nodeOptions, barrier, results):
+    try:
+        completions = asyncio.run(hostNodes(ids, count, steps, networkSize, host, basis, fast, nodeOptions, barrier))
+    except BaseException:
+        # don't leave the other workers and launch() waiting for us
+        barrier.abort()
+        results.put([])
+        raise
+    results.put(completions)
+
+async def hostNodes(ids, count, steps, networkSize, host, basis, fast, nodeOptions, barrier):
+    loop = asyncio.get_running_loop()
+    nodes = [AsyncNode(networkSize, launchLocation(id, count, networkSize), host, basis, count, id, **nodeOptions)
+             for id in ids]
+    for node in nodes:
+        await node.start(wait=False)
+    await asyncio.gather(*[node.waitForDiscovery() for node in nodes])
+    # the loop keeps answering other workers' nodes while we wait
+    await loop.run_in_executor(None, barrier.wait)
+    runs = await asyncio.gather(*[runScriptAsync(node, steps, fast) for node in nodes])
+    await loop.run_in_executor(None, barrier.wait)
+    for node in nodes:
+        if node.isActive():
+            node.exit()
+    return [completion for run in runs for completion in run]
+
+# per command (the first word): how many ran, and the mean, median,
+# 99th percentile and longest time they took, in seconds
+def summarize(completions):
+    times = {}
+    for completion in completions:
+        times.setdefault(completion.command.split(' ')[0], []).append(completion.elapsed)
+    summary = {}
+    for command, elapsed in sorted(times.items()):
+        elapsed.sort()
+        summary[command] = {
+            'count': len(elapsed),
+            'mean': sum(elapsed) / len(elapsed),
+            'p50': elapsed[len(elapsed) // 2],
+            'p99': elapsed[min(int(len(elapsed) * 0.99), len(elapsed) - 1)],
+            'max': elapsed[-1],
+        }
+    return summary
+
+def formatSummary(summary):
+    lines = ['command        count   mean(ms)    p50(ms)    p99(ms)    max(ms)']
+    for command, stats in summary.items():
+        lines.append('%-12s  %6d  %9.2f  %9.2f  %9.2f  %9.2f' % (command, stats['count'], stats['mean'] * 1e3,
+                     stats['p50'] * 1e3, stats['p99'] * 1e3, stats['max'] * 1e3))
+    return '\n'.join(lines)